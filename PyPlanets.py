@@ -1,34 +1,43 @@
 
 
-import pygame
+import os
+import sys
+import importlib.util
 import numpy as np
-from itertools import combinations
-
-
-def ppl_atan(point):
-    """Advanced arctangent of a tuple point."""
-    if point[0]==0:
-        if point[1]>0:
-            return np.pi
-        else:
-            return -np.pi
-    elif point[0]<0:
-        return np.arctan(point[1]/point[0])+np.pi
-    else:
-        return np.arctan(point[1]/point[0])
-
+from ppl_math import ppl_atan, rot_mat, numpy_to_tuples, palette
+from ppl_physics import PlanetState, Simulation, Time_step_kinematic
+from ppl_loop import PhysicsRunner
+from ppl_spatial import PlanetIndex
+from ppl_trajectory import TrajectoryRecorder, TrajectoryReader, ReplayPlayer
+from ppl_scene import save_scene, load_scene
+from ppl_profile import FrameProfiler
+from ppl_diagnostics import ConservationMonitor
+from ppl_trails import TrailBuffer, rasterize_polylines
+from ppl_predict import TrajectoryPredictor
+from ppl_generators import Generators, add_generated
+
+
+def _lazy_import(Name):
+    """
+    Returns the module Name, but only really imports it when one of its attributes is first used, so
+    importing this file (e.g. for the physics, or the helpers above) does not pay for pygame.
+    """
+    if Name in sys.modules:
+        return sys.modules[Name]
+    Spec = importlib.util.find_spec(Name)
+    if Spec is None:
+        raise ModuleNotFoundError(f"No module named {Name!r}", name=Name)
+    Spec.loader = importlib.util.LazyLoader(Spec.loader)
+    Module = importlib.util.module_from_spec(Spec)
+    sys.modules[Name] = Module
+    Spec.loader.exec_module(Module)
+    return Module
 
-def rot_mat(theta):
-    """Returns a 2-by-2 rotation matrix with an angle theta."""
-    return np.array([[np.cos(theta),np.sin(theta)],[-np.sin(theta),np.cos(theta)]])
 
+pygame = _lazy_import("pygame")
 
-def numpy_to_tuples(np_in):
-    """Takes an N-by-2 numpy matrix and converts it into a list of N tuples."""
-    listout = []
-    for point in np_in:
-        listout.append( (point[0],point[1]) )
-    return listout
+IconPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Planets.ico")
+#   -found next to this file, wherever the app is started from
 
 
 ##################
@@ -52,6 +61,8 @@ class CameraRig():
 
     FocusPlanet = False # When FollowingPlanet==True, this will point to the planet we're following
 
+    FocusPosition = None # When set, used instead of FocusPlanet.position (e.g. the interpolated position being drawn)
+
 
     def __init__(self, ScreenSize):
         """Initializes CameraRig using the screen size (as a tuple)."""
@@ -68,6 +79,15 @@ class CameraRig():
         return (ScreenX, ScreenY)
 
 
+    def get_screen_array(self, real_coords):
+        """Returns Screen coordinates from Real coordinates, for a whole N-by-2 array of points at once."""
+        CameraPosition = self.get_camera_position()
+        screen_coords = np.empty(np.shape(real_coords))
+        screen_coords[:,0] = self.ScreenCenterDisplacement[0] + self.CameraZoom*(real_coords[:,0]-CameraPosition[0])
+        screen_coords[:,1] = self.ScreenCenterDisplacement[1] - self.CameraZoom*(real_coords[:,1]-CameraPosition[1])
+        return screen_coords
+
+
     def get_real(self, screen_coords=(0,0)):
         """Returns the Real coordinates from Screen coordinates."""
         CameraPosition = self.get_camera_position()
@@ -84,6 +104,7 @@ class CameraRig():
         # Remember, CameraPosition = PanPosition + OriginPosition (which is Planet.position)
         # We want to update PanPosition in such a way as to keep CamerPosition the same.
         self.FocusPlanet = Planet
+        self.FocusPosition = None
         self.PanPosition = self.PanPosition - Planet.position
         self.FollowingPlanet = True
 
@@ -91,15 +112,21 @@ class CameraRig():
     def end_focus(self):
         self.FollowingPlanet = False
         if self.FocusPlanet:
-            self.PanPosition = self.PanPosition + self.FocusPlanet.position
+            self.PanPosition = self.PanPosition + self.focus_position()
         self.FocusPlanet = False
+        self.FocusPosition = None
+
+
+    def focus_position(self):
+        """Real position of the planet being followed, as currently drawn."""
+        return self.FocusPlanet.position if self.FocusPosition is None else self.FocusPosition
 
  
     ########################    Pan & Zoom code
 
 
     def get_camera_position(self):
-        CameraPosition = self.PanPosition + (self.FocusPlanet.position if self.FollowingPlanet else np.array([0,0]))
+        CameraPosition = self.PanPosition + (self.focus_position() if self.FollowingPlanet else np.array([0,0]))
         return CameraPosition
 
 
@@ -114,44 +141,93 @@ class CameraRig():
         self.CameraZoom = 10**self.CameraZoomLinear
 
 
+    ########################    Saving the view
+
+
+    def get_view(self):
+        """Returns the pan, zoom and followed planet as a plain dict, e.g. to save with a scene."""
+        return {"PanPosition": [float(x) for x in self.PanPosition], "CameraZoomLinear": float(self.CameraZoomLinear),
+                "VelocityRatio": self.VelocityRatio,
+                "FocusNumber": self.FocusPlanet.CurrentNumber if self.FollowingPlanet else None}
+
+
+    def set_view(self, View, State=None):
+        """Restores a view from get_view(). Following a planet needs the PlanetState it lives in."""
+        self.PanPosition = np.array(View["PanPosition"], dtype=float)
+        self.CameraZoomLinear = View["CameraZoomLinear"]
+        self.CameraZoom = 10**self.CameraZoomLinear
+        self.VelocityRatio = View.get("VelocityRatio", self.VelocityRatio)
+        self.FollowingPlanet = False
+        self.FocusPlanet = False
+        self.FocusPosition = None
+        if View.get("FocusNumber") is not None and State is not None and View["FocusNumber"] in State:
+            self.FocusPlanet = Planet(State, View["FocusNumber"])
+            self.FollowingPlanet = True
+
+
 #################################################
 #################################################
 #################################################
 
 
 
+def _planet_attribute(Name):
+    """Builds a property that reads/writes one row of the PlanetState array called Name."""
+    def getter(self):
+        return getattr(self.State, Name)[self.State.row(self.CurrentNumber)]
+    def setter(self, Value):
+        getattr(self.State, Name)[self.State.row(self.CurrentNumber)] = Value
+        self.State.touch()
+    return property(getter, setter)
+
+
 class Planet():
     """
     Planet Class - represents a planet in the simulation.
+    A Planet holds no data of its own: it is a lightweight view into one row of a PlanetState.
+    Reading position/velocity returns a view of that row, so it always follows the simulation.
     """
-    position = np.array([0,0])
-    velocity = np.array([0,0])
-    force = np.array([0,0])
-    mass = 1.0
-    radius = 1.0
-    color = (170,120,40)
-    outline_color = (0,0,0)
-    CurrentNumber = 0
-    Selected = False
-
-    def __init__(self, position=np.array([0,0]), velocity=np.array([0,0]), radius=1, mass=1):
-        super().__init__()
-        self.position = position
-        self.velocity = velocity
-        self.radius = radius
-        self.mass = mass
-        self.CurrentNumber = self.CurrentNumber
-        Planet.CurrentNumber += 1
-    
+    position = _planet_attribute("Position")
+    velocity = _planet_attribute("Velocity")
+    force = _planet_attribute("Force")
+    mass = _planet_attribute("Mass")
+    radius = _planet_attribute("Radius")
+    Selected = _planet_attribute("Selected")
+    SelectedOutlineColor = (255,255,255)
+    OutlineColor = (0,0,0)
+
+    def __init__(self, State, Number):
+        self.State = State
+        self.CurrentNumber = Number
+
     def __repr__(self):
         return f"Planet object ({self.CurrentNumber})"
-    
+
     def __str__(self):
         return f"Planet {self.CurrentNumber}, position=({self.position[0]},{self.position[1]}), velocity=({self.velocity[0]},{self.velocity[1]})"
-    
+
+    def __eq__(self, other):
+        return isinstance(other, Planet) and (self.State is other.State) and (self.CurrentNumber == other.CurrentNumber)
+
+    def __hash__(self):
+        return hash((id(self.State), self.CurrentNumber))
+
+    @property
+    def color(self):
+        return tuple(int(c) for c in self.State.Color[self.State.row(self.CurrentNumber)])
+
+    @color.setter
+    def color(self, Value):
+        self.State.Color[self.State.row(self.CurrentNumber)] = Value
+        self.State.touch()
+
+    @property
+    def outline_color(self):
+        return self.SelectedOutlineColor if self.Selected else self.OutlineColor
+
     def distance_to_center(self, position):
-        dist = np.sqrt(((self.position - position)**2).sum())
-    
+        return np.sqrt(((self.position - position)**2).sum())
+
     def in_bounds(self, position):
         dist2 = ((self.position - position)**2).sum()
         is_in = (self.radius**2 > dist2)
@@ -159,35 +235,86 @@ class Planet():
 
     def select(self):
         self.Selected = True
-        self.outline_color = (255,255,255)
 
     def deselect(self):
         self.Selected = False
-        self.outline_color = (0,0,0)
 
-    def draw(self, Surface, CameraRig):
-        PlanetScreenPosition = CameraRig.get_screen(self.position)
+    def draw(self, Surface, CameraRig, position=None):
+        """Draws the planet; at "position" instead of its own, if given (e.g. an interpolated position)."""
+        PlanetScreenPosition = CameraRig.get_screen(self.position if position is None else position)
         ImageRadius = (self.radius)*(CameraRig.CameraZoom)
         pygame.draw.circle(Surface, self.color, PlanetScreenPosition, ImageRadius)
         pygame.draw.circle(Surface, self.outline_color, PlanetScreenPosition, ImageRadius, int(np.ceil(0.03*ImageRadius)))
 
+
+class PlanetDict():
+    """
+    Read-only, dict-like view of a PlanetState: maps planet Number -> Planet.
+    Planets are built on demand, so nothing is stored per planet. Iterates in drawing order.
+    """
+
+    def __init__(self, State):
+        self.State = State
+
+    def __getitem__(self, Number):
+        if Number not in self.State:
+            raise KeyError(Number)
+        return Planet(self.State, int(Number))
+
+    def __iter__(self):
+        return iter(self.State.Numbers.tolist())
+
+    def __reversed__(self):
+        return iter(self.State.Numbers[::-1].tolist())
+
+    def __len__(self):
+        return self.State.N
+
+    def __contains__(self, Number):
+        return Number in self.State
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [Planet(self.State, Number) for Number in self]
+
+    def items(self):
+        return [(Number, Planet(self.State, Number)) for Number in self]
+
+
 #################################################
 #################################################
 #################################################
 
+
+def _sim_setting(Name):
+    """Builds a property which reads/writes the setting called Name on the PlanetList's Simulation."""
+    def getter(self):
+        return getattr(self.Sim, Name)
+    def setter(self, Value):
+        setattr(self.Sim, Name, Value)
+    return property(getter, setter)
+
+
 highlight_upperright_default = np.array([[7,10],[10,10],[10,7],[9,7],[9,9],[7,9]])/10
 
 class PlanetList():
     """
     Object to hold the list of planets.
     When a planet is created via new_planet(), it gets a number which the Planet stores.
-    The Planets are stored in the dict List, under their Number
+    The physics is done by a Simulation (self.Sim), whose PlanetState (self.State) holds the planet arrays;
+    List is a dict-like view which gives a Planet for each Number.
+    This class adds the interactive parts: selection, text boxes and drawing.
     """
 
     defaultRadius = 1
     defaultMass = 100
 
-    List = {} # dict of planets
+    List = {} # dict-like view of the planets; see PlanetDict
+    Sim = [] # Simulation doing the physics
+    State = [] # PlanetState holding the planet arrays (same as Sim.State)
+    Index = [] # PlanetIndex over State, for finding the planet under a click
     SelectionActive = False
     CurrentSelection = 0
     MovingVector = False
@@ -200,9 +327,57 @@ class PlanetList():
     Surface = []
     TextList = []
     #   -time to get used to assignments actually pointing to objects instead of copying them...
-
-    NewtonG = 10
-    #   -Newton's gravitational constant, for gravity calculations
+    DrawPositions = None
+    #   -positions to draw the planets at (aligned with State rows), or None to draw the live State
+    DrawNumbers = None
+    #   -the planets' Numbers when DrawPositions were set, to tell if they still line up with State (see drawn_positions)
+    PixelRadius = 1
+    #   -planets whose radius on screen is smaller than this many pixels are drawn as single pixels
+    DensityMap = True
+    #   -when zoomed out over many planets, draw a heat map of their mass instead of every planet (D toggles it)
+    DensityBodies = 2000
+    #   -the heat map is only used with at least this many planets on screen smaller than DensityKeepRadius,
+    DensityZoom = 0.5
+    #   -and when CameraZoom is below this,
+    DensityOverdraw = 2.0
+    #   -or drawing the planets' circles would paint the pixels they cover this many times over, on average
+    DensityCell = 2
+    #   -size of the heat map's cells, in pixels
+    DensityKeepRadius = 3
+    #   -planets at least this many pixels in radius are not put in the heat map, but drawn as circles over it
+    DensityPalette = palette([(40,20,80), (120,40,140), (220,70,80), (255,170,40), (255,250,210)])
+    #   -colours from the lightest to the heaviest cell (none is black: black cells are left out)
+    DensityCheckEvery = 10
+    #   -while the heat map is off, whether to turn it on is checked every this many frames (and when the zoom changes)
+    DensityActive = False
+    #   -was the heat map drawn last frame? (it takes a little less crowding to stay on than to come on)
+    DensityChecked = (None, 0)
+    #   -CameraZoom at the last check, and frames since
+    DrawnRects = []
+    #   -screen rectangles touched by the last draw(), for DirtyRects
+    Trails = None
+    #   -a ppl_trails.TrailBuffer while orbit trails are shown
+    TrailLength = 200
+    #   -samples (frames) per trail
+    TrailLineBodies = 200
+    #   -with up to this many trails, each is drawn as an antialiased line; with more, all are plotted as pixels in one go
+    TrailDim = 0.5
+    #   -trails are drawn in their planet's colour times this
+    ShowPrediction = True
+    #   -draw the predicted path of the selected planet (see ppl_predict)
+    PredictionColor = (120,200,255)
+    Generator = "disk"
+    #   -what G adds at the centre of the view (see ppl_generators); shift + G picks the next one
+    GeneratedBodies = 1000
+    GeneratedPeriod = 20.0
+    #   -generated configurations get masses which give orbits of roughly this period (in simulated seconds)
+    GeneratedSeed = 0
+    #   -seed of the next generated configuration; goes up by one each time, so no two are the same
+
+    NewtonG = _sim_setting("NewtonG")
+    ForceBackend = _sim_setting("ForceBackend")
+    Theta = _sim_setting("Theta")
+    #   -physics settings live on the Simulation; see Simulation for what they mean
 
     
     ModDict = {"Neutral":4096, "LShift":4097, "LCtrl":4160, "LAlt":4352, "LShift+LCtrl":4161}
@@ -218,22 +393,45 @@ class PlanetList():
     ########################    init
 
 
-    def __init__(self, Surface, CameraRig):
+    def __init__(self, Surface, CameraRig, Sim=None):
+        """Sim is the Simulation to display and edit; a new, empty one is made if not given."""
         self.Surface = Surface
         self.Camera = CameraRig
+        self.Sim = Simulation() if Sim is None else Sim
+        self.State = self.Sim.State
+        self.List = PlanetDict(self.State)
+        self.Index = PlanetIndex(self.State)
         self.Arrow = VectArrow(Surface, CameraRig)
         TextPos0 = (10, CameraRig.ScreenSize[0] - 30)
         TextPos1 = (10, CameraRig.ScreenSize[1] - 60)
         self.TextList = [TextHandler(TextPos0, 'M='), TextHandler(TextPos1, 'R=')]
-        
+        self.Predictor = TrajectoryPredictor()
+
 
     ########################    New Planets
 
 
     def new_planet(self, position=np.array([0,0]), velocity=np.array([0,0]), radius=1, mass=100):
-        NewPlanet = Planet(position=position, velocity=velocity, radius=radius, mass=mass)
-        self.List[NewPlanet.CurrentNumber] = NewPlanet
-        return NewPlanet.CurrentNumber
+        return self.State.add(position=position, velocity=velocity, radius=radius, mass=mass)
+
+
+    def generate(self, Name=None, N=None):
+        """
+        Adds N bodies (GeneratedBodies by default) made by generator Name (self.Generator by default), in one
+        bulk insert, filling about a third of the view around its centre. Returns their Numbers.
+        """
+        Name = self.Generator if Name is None else Name
+        N = self.GeneratedBodies if N is None else N
+        Center = self.Camera.get_real(self.Camera.ScreenCenterDisplacement)
+        Size = min(self.Camera.ScreenSize)/self.Camera.CameraZoom/6
+        Mass = 4*np.pi**2*Size**3/(self.NewtonG*self.GeneratedPeriod**2)
+        #   -Kepler's third law: the mass around which an orbit of radius Size has period GeneratedPeriod
+        Params = {"plummer": {"Scale": Size/2, "Mass": Mass},
+                  "disk": {"ScaleLength": Size/3, "Mass": Mass/2, "CentralMass": Mass/2, "CentralRadius": Size/20},
+                  "ring": {"RingRadius": Size, "Width": Size/5, "CentralMass": Mass, "RingMass": Mass/100, "CentralRadius": Size/20},
+                  "binaries": {"Spread": Size, "Separation": (Size/50, Size/10), "Mass": (Mass/2000, Mass/1000)}}[Name]
+        self.GeneratedSeed += 1
+        return add_generated(self.Sim, Name, N, Radius=Size/200, Center=Center, Seed=self.GeneratedSeed, **Params)
 
 
     ########################    Handle Clicks
@@ -245,15 +443,12 @@ class PlanetList():
         -Check the Planets to see if the position was inside of one of the circles.
         -Or, check the text boxes to see if we're editing text / deselecting the text boxes.
         """
-        IsClicked = False
         if not self.SelectionActive:
             ClickRealPosition = self.Camera.get_real(ScreenPosition)
-            for PlanetNum in reversed(self.List):
-                # we reverse the list so that it prefers the planets drawn on top
-                IsClicked = self.List[PlanetNum].in_bounds(position=ClickRealPosition)
-                if IsClicked:
-                    self.select(PlanetNum)
-                    break
+            PlanetNum = self.Index.topmost_at(ClickRealPosition, self.drawn_positions())
+            #   -prefers the planets drawn on top
+            if PlanetNum is not None:
+                self.select(PlanetNum)
         else: # Selection is Active
             BoxSelected = [box.handle_click(ScreenPosition) for box in self.TextList]
             if not any(BoxSelected):
@@ -285,8 +480,7 @@ class PlanetList():
         self.SelectionActive = False
         self.CurrentSelection = 0
         # Time does not automatically resume
-        for planetnum in self.List:
-            self.List[planetnum].deselect()
+        self.State.Selected = False
         for box in self.TextList:
             box.deselect()
         return self.SelectionActive, self.CurrentSelection
@@ -312,15 +506,46 @@ class PlanetList():
             -If so, set the camera to focus on that planet.
             -If not, defocus the camera.
         """
-        IsClicked = False
         ClickRealPosition = self.Camera.get_real(ScreenPosition)
         self.Camera.end_focus()
-        for PlanetNum in reversed(self.List):
-            # we reverse the list so that it prefers the planets drawn on top
-            IsClicked = self.List[PlanetNum].in_bounds(position=ClickRealPosition)
-            if IsClicked:
-                self.Camera.set_focus(self.List[PlanetNum])
-                break
+        PlanetNum = self.Index.topmost_at(ClickRealPosition, self.drawn_positions())
+        #   -prefers the planets drawn on top
+        if PlanetNum is not None:
+            self.Camera.set_focus(self.List[PlanetNum])
+
+
+    def follow_merges(self):
+        """
+        After planets have merged (see Simulation.Collisions): the camera moves on to the planet its focus
+        merged into, and a selected planet that is gone is deselected.
+        """
+        Camera = self.Camera
+        if Camera.FollowingPlanet and Camera.FocusPlanet.CurrentNumber not in self.State:
+            Survivor = self.Sim.survivor(Camera.FocusPlanet.CurrentNumber)
+            if Survivor in self.State:
+                Camera.FocusPlanet = self.List[Survivor]
+            else:
+                Camera.FollowingPlanet = False
+                Camera.FocusPlanet = False
+            Camera.FocusPosition = None
+        if self.SelectionActive and self.CurrentSelection not in self.State:
+            self.deselect()
+
+
+    def save(self, Path, Compress=False):
+        """Saves every planet, the simulation settings and the camera view to Path (.npz or .json; see ppl_scene)."""
+        save_scene(Path, self.State, self.Sim, self.Camera, Compress)
+
+
+    def load(self, Path):
+        """Replaces every planet (and the settings and camera view) with the scene saved in Path."""
+        self.deselect()
+        load_scene(Path, self.State, self.Sim, self.Camera)
+
+
+    def planets_in_rect(self, ScreenCorner1, ScreenCorner2):
+        """Returns the Numbers of all planets overlapping the screen rectangle between the two corners (e.g. for box-select)."""
+        return self.Index.in_rect(self.Camera.get_real(ScreenCorner1), self.Camera.get_real(ScreenCorner2))
 
 
     ########################    Handle keys
@@ -343,6 +568,23 @@ class PlanetList():
         elif event.key == pygame.K_SPACE:
             self.ToggleTime()
 
+        elif event.key == pygame.K_p:
+            self.ShowPrediction = not self.ShowPrediction
+
+        elif event.key == pygame.K_f:
+            self.Predictor.FreezeOthers = not self.Predictor.FreezeOthers
+
+        elif event.key == pygame.K_d:
+            self.DensityMap = not self.DensityMap
+            self.DensityChecked = (None, 0)
+
+        elif event.key == pygame.K_g:
+            if KeyMods & pygame.KMOD_SHIFT:
+                Names = list(Generators)
+                self.Generator = Names[(Names.index(self.Generator) + 1) % len(Names)]
+            else:
+                self.generate()
+
     def update_attribute(self, Value):
         if self.TextList[0].TextBoxSelected == True:
             self.List[self.CurrentSelection].mass = Value
@@ -385,83 +627,292 @@ class PlanetList():
             self.deselect()
 
 
-    def Time_Step(self, dt, iterations = 10):
+    def Time_Step(self, dt, iterations = None):
         """
         Handles stepping forward time by a time interval of "dt".
-        Splits "dt" into "iterations" timesteps and does it that many times.
-        """
-        IntervalDt = dt/iterations
-        for steps in range(0,iterations):
-        # zero out the forces
-            for PlanetNum in self.List:
-                self.List[PlanetNum].force = 0
-            # calculate the forces
-            self.Calculate_gravity(self.List, self.Gravity_force_Newton, self.NewtonG)
-            # calculate new vel/pos
-            for PlanetNum in self.List:
-                PlanetObj = self.List[PlanetNum]
-                PlanetObj.position, PlanetObj.velocity = self.Time_step_kinematic(PlanetObj.position, PlanetObj.velocity, PlanetObj.mass, PlanetObj.force, IntervalDt)
-            # the Planets' positions and velocities are now updated
-
-
-    # these two probably should be full functions, not methods, but whatever...
+        Splits "dt" into "iterations" timesteps (Sim.Iterations by default) and does it that many times.
+        """
+        self.Sim.Time_Step(dt, iterations)
+
+
     def Time_step_kinematic(self, position =np.array([0,0]), velocity =np.array([0,0]), mass =1, force =np.array([0,0]), dt =0.01):
-        # basic numerical integration
-        acceleration = force/mass
-        position = position + velocity*dt + 0.5*acceleration*dt*dt
-        velocity = velocity + acceleration*dt
-        return position, velocity
+        return Time_step_kinematic(position, velocity, mass, force, dt)
 
 
     def Gravity_force_Newton(self, OriginPosition =np.array([0,0]), AttractingBodyPosition =np.array([1,0]), M1 =1, M2 =1):
         # returns normalized force of gravity from Newton = \hat{r}*M1*M2/r**2; must multiply by G
         # force applied to OriginPosition; force _of_ AttractingBodyPosition _on_  OriginPosition
         # vect(force) = unitvec(dr)*G*m1*m2/r**2 = vec(r)*G*m1*m2/r**3 = vec(r)*G*m1*m2/
+        # single-pair reference; the simulation itself uses the vectorized pairwise_gravity()
         dr = AttractingBodyPosition - OriginPosition
         ForceOverG = dr*M1*M2/np.sqrt(sum(dr**2)**3)
         return ForceOverG
 
 
-    def Calculate_gravity(self, List, Gravity_Force, NewtonG):
-        for PlanetPairNums in combinations(List,2):
-            PlanetPair = (List[PlanetPairNums[0]], List[PlanetPairNums[1]])
-            ForceVec = Gravity_Force(PlanetPair[0].position, PlanetPair[1].position, PlanetPair[0].mass, PlanetPair[1].mass)
-            PlanetPair[0].force = PlanetPair[0].force + ForceVec
-            PlanetPair[1].force = PlanetPair[1].force - ForceVec
-    
+    def Calculate_gravity(self, Gravity_Force=None, NewtonG=None):
+        self.Sim.Calculate_gravity(Gravity_Force, NewtonG)
 
 
     ########################    Code for Drawing stuff
+
+
+    def toggle_trails(self):
+        self.Trails = None if self.Trails is not None else TrailBuffer(self.TrailLength)
+
+
+    def update_trails(self, Frame=None):
+        """Adds the positions being drawn (of Frame, see copy_for_draw) to the trails (call once per frame while time flows)."""
+        if self.Trails is not None:
+            if Frame is not None:
+                self.Trails.push(Frame.Numbers, Frame.Position)
+            else:
+                self.Trails.push(self.State.Numbers, self.State.Position if self.DrawPositions is None else self.DrawPositions)
+
+
+    def draw_trails(self, Frame=None):
+        """Draws the orbit trails, if they are on, for the planets of Frame (see copy_for_draw). Returns the list of Rects drawn over."""
+        if self.Trails is None:
+            return []
+        State = self.State if Frame is None else Frame
+        if not np.array_equal(self.Trails.Numbers, State.Numbers):
+            self.Trails.match(State.Numbers)
+        Screen, Starts, Rows = self.Trails.screen_segments(self.Camera.get_screen_array)
+        Colors = (State.Color[Rows]*self.TrailDim).astype(np.uint8)
+        if len(Rows) <= self.TrailLineBodies:
+            Screen = Screen.clip(-1e5, 1e5)
+            #   -keeps far off-screen points within what pygame can draw
+            return [pygame.draw.aalines(self.Surface, tuple(Colors[i]), False, Screen[Starts[i]:Starts[i+1]]) for i in range(len(Rows))]
+        Pixels, Line = rasterize_polylines(Screen, Starts, self.Surface.get_size())
+        Bounds = self.draw_pixels(Pixels, Colors[Line])
+        return [] if Bounds is None else [Bounds]
     
 
-    def draw(self):
-        DrawList = []
-        for PlanetNum in self.List:
-            DrawList.append(self.List[PlanetNum].draw(Surface=self.Surface, CameraRig=self.Camera))
-            #   -draws planet, then appends the DrawTuple to DrawList (for debugging purposes)
+    def set_draw_positions(self, Positions):
+        """
+        Sets the positions to draw the planets at, e.g. interpolated between physics steps (None for the live state).
+        The camera follows the focus planet's drawn position, so it stays still on screen.
+        """
+        self.DrawPositions = Positions
+        self.DrawNumbers = None if Positions is None else self.State.Numbers.copy()
+        self.Camera.FocusPosition = None
+        if Positions is not None and self.Camera.FollowingPlanet and self.Camera.FocusPlanet.CurrentNumber in self.State:
+            self.Camera.FocusPosition = Positions[self.State.row(self.Camera.FocusPlanet.CurrentNumber)]
+
+
+    def drawn_positions(self):
+        """
+        The positions the planets were last drawn at (see set_draw_positions), to hit-test clicks against
+        what is on screen; None (the live positions) if none were set, or the planets have changed since.
+        """
+        if self.DrawPositions is None or not np.array_equal(self.DrawNumbers, self.State.Numbers):
+            return None
+        return self.DrawPositions
+
+
+    def copy_for_draw(self):
+        """
+        Returns a copy of the planets (a PlanetState) at the positions set with set_draw_positions, for
+        draw(), draw_trails() and update_trails(). Taking it is the only part of drawing that needs
+        Runner.editing(): the rest goes on while the physics thread steps. The camera is pinned to the
+        focus planet's position in the copy.
+        """
+        Frame = self.State.copy(self.DrawPositions)
+        if self.Camera.FollowingPlanet and self.Camera.FocusPlanet.CurrentNumber in Frame:
+            self.Camera.FocusPosition = Frame.Position[Frame.row(self.Camera.FocusPlanet.CurrentNumber)]
+        return Frame
+
+
+    def visible_rows(self, Screen, ImageRadius):
+        """Returns a boolean array: which planets (centres Screen, radii ImageRadius, in pixels) overlap the Surface."""
+        Width, Height = self.Surface.get_size()
+        return ((Screen[:,0] + ImageRadius >= 0) & (Screen[:,0] - ImageRadius < Width)
+                & (Screen[:,1] + ImageRadius >= 0) & (Screen[:,1] - ImageRadius < Height))
+
+
+    def draw_pixels(self, Screen, Colors):
+        """
+        Draws one pixel per point, all at once. Screen is N-by-2 screen coordinates, Colors N-by-3.
+        Returns the bounding Rect of the pixels drawn, or None.
+        """
+        Width, Height = self.Surface.get_size()
+        X = Screen[:,0].astype(int)
+        Y = Screen[:,1].astype(int)
+        Inside = (X >= 0) & (X < Width) & (Y >= 0) & (Y < Height)
+        X, Y, Colors = X[Inside], Y[Inside], Colors[Inside]
+        if len(X) == 0:
+            return None
+        Bounds = pygame.Rect(int(X.min()), int(Y.min()), int(X.max() - X.min()) + 1, int(Y.max() - Y.min()) + 1)
+        try:
+            Pixels = pygame.surfarray.pixels3d(self.Surface)
+        except ValueError:
+            # Surfaces which can't be viewed as RGB arrays (e.g. 8-bit): use a PixelArray instead
+            Pixels = pygame.PixelArray(self.Surface)
+            for x, y, Color in zip(X, Y, Colors):
+                Pixels[x, y] = tuple(Color)
+            Pixels.close()
+            return Bounds
+        Pixels[X, Y] = Colors
+        del Pixels
+        #   -the Surface stays locked while the pixel array exists
+        return Bounds
+
+
+    def density_cells(self, Screen):
+        """
+        The heat map cell (a flat index into a grid of DensityCell-pixel cells over the Surface) of every point
+        in Screen which is on the Surface; returns the cells, which rows of Screen those are, and the grid's shape.
+        """
+        Width, Height = self.Surface.get_size()
+        Cell = self.DensityCell
+        Shape = (-(-Width//Cell), -(-Height//Cell))
+        X = np.floor_divide(Screen[:,0], Cell)
+        Y = np.floor_divide(Screen[:,1], Cell)
+        Inside = np.flatnonzero((X >= 0) & (X < Shape[0]) & (Y >= 0) & (Y < Shape[1]))
+        return X[Inside].astype(np.intp)*Shape[1] + Y[Inside].astype(np.intp), Inside, Shape
+
+
+    def use_density_map(self, Cells, ImageRadius, Shape):
+        """
+        Whether to draw the heat map for planets in the given cells, with the given radii on screen: if
+        zoomed out past DensityZoom, or if their circles would overlap by DensityOverdraw.
+        """
+        Occupied = np.count_nonzero(np.bincount(Cells, minlength=Shape[0]*Shape[1]))*self.DensityCell**2
+        Painted = np.maximum(np.pi*ImageRadius*ImageRadius, 1.0).sum()
+        self.DensityActive = bool(self.Camera.CameraZoom < self.DensityZoom or
+                                  Painted/max(Occupied, 1) >= self.DensityOverdraw*(0.7 if self.DensityActive else 1.0))
+        return self.DensityActive
+
+
+    def draw_density(self, Cells, Mass, Shape):
+        """
+        Draws the heat map: the mass in each cell, on a log scale through DensityPalette, as one Surface
+        blitted in one go. Returns the Rect drawn over, or None.
+        """
+        Grid = np.bincount(Cells, weights=np.maximum(Mass, 0), minlength=Shape[0]*Shape[1]).reshape(Shape)
+        if not Grid.any():
+            Grid = np.bincount(Cells, minlength=Shape[0]*Shape[1]).reshape(Shape).astype(float)
+            #   -massless planets: count them instead
+        Columns, Rows = np.flatnonzero(Grid.any(axis=1)), np.flatnonzero(Grid.any(axis=0))
+        if len(Columns) == 0:
+            return None
+        Grid = Grid[Columns[0]:Columns[-1]+1, Rows[0]:Rows[-1]+1]
+        #   -only the part of the grid with planets in it
+        Filled = Grid > 0
+        Lightest = Grid[Filled].min()
+        Level = np.log1p(Grid/Lightest)
+        Level *= (len(self.DensityPalette) - 1)/max(Level.max(), 1e-12)
+        Pixels = self.DensityPalette[Level.astype(np.intp)]
+        Pixels[~Filled] = 0
+        Image = pygame.surfarray.make_surface(Pixels)
+        Image.set_colorkey((0,0,0))
+        Cell = self.DensityCell
+        if Cell != 1:
+            Image = pygame.transform.scale(Image, (Grid.shape[0]*Cell, Grid.shape[1]*Cell))
+        return self.Surface.blit(Image, (Columns[0]*Cell, Rows[0]*Cell))
+
+
+    def draw(self, Frame=None):
+        """
+        Draws every planet of Frame (see copy_for_draw) which is on screen; with no Frame, of the live state,
+        and the selection on top (see draw_selection). The camera transform is done for all planets at once;
+        planets smaller than PixelRadius are drawn as single pixels, in one go, and the rest as circles.
+        Zoomed out over many planets (see use_density_map), a heat map of their mass is drawn instead, with
+        only the planets at least DensityKeepRadius in size on top as circles.
+        Returns the list of the Numbers of planets drawn as circles; the screen rectangles drawn over are
+        left in DrawnRects.
+        """
+        State = self.State if Frame is None else Frame
+        Positions = State.Position if self.DrawPositions is None or Frame is not None else self.DrawPositions
+        Screen = self.Camera.get_screen_array(Positions)
+        ImageRadius = State.Radius*self.Camera.CameraZoom
+        Visible = self.visible_rows(Screen, ImageRadius)
+        Tiny = Visible & (ImageRadius < self.PixelRadius)
+        DrawnRects = []
+        Density = False
+        Binned = Visible & (ImageRadius < self.DensityKeepRadius)
+        #   -planets the heat map would stand in for
+        Zoom, Frames = self.DensityChecked
+        Due = self.DensityActive or Zoom != self.Camera.CameraZoom or Frames + 1 >= self.DensityCheckEvery
+        self.DensityChecked = (self.Camera.CameraZoom, 0) if Due else (Zoom, Frames + 1)
+        if self.DensityMap and Due and np.count_nonzero(Binned) >= self.DensityBodies:
+            Binned = np.flatnonzero(Binned)
+            Cells, Inside, Shape = self.density_cells(Screen[Binned])
+            Binned = Binned[Inside]
+            Density = self.use_density_map(Cells, ImageRadius[Binned], Shape)
+        else:
+            self.DensityActive = False
+        if Density:
+            DrawnRects.append(self.draw_density(Cells, State.Mass[Binned], Shape))
+            Visible[Binned] = False
+            Tiny = Visible & (ImageRadius < self.PixelRadius)
+        if Tiny.any():
+            Colors = np.where(State.Selected[Tiny,None], np.array(Planet.SelectedOutlineColor, dtype=np.uint8), State.Color[Tiny])
+            Bounds = self.draw_pixels(Screen[Tiny], Colors)
+            if Bounds is not None:
+                DrawnRects.append(Bounds)
+        Rows = np.flatnonzero(Visible & ~Tiny)
+        for Row in Rows:
+            Color = tuple(State.Color[Row])
+            OutlineColor = Planet.SelectedOutlineColor if State.Selected[Row] else Planet.OutlineColor
+            DrawnRects.append(pygame.draw.circle(self.Surface, Color, Screen[Row], ImageRadius[Row]))
+            pygame.draw.circle(self.Surface, OutlineColor, Screen[Row], ImageRadius[Row], int(np.ceil(0.03*ImageRadius[Row])))
+        DrawList = State.Numbers[Rows].tolist()
+        if Frame is None:
+            DrawnRects.extend(self.draw_selection())
+        self.DrawnRects = DrawnRects
+        return DrawList
+
+
+    def draw_selection(self):
+        """
+        Draws the selected planet's velocity arrow, predicted path and text boxes, from the live state (time
+        is stopped while a planet is selected). Returns the list of Rects drawn over.
+        """
+        DrawnRects = []
         if self.SelectionActive:
             CurrentPlanet = self.List[self.CurrentSelection]
+            if self.ShowPrediction:
+                DrawnRects.append(self.draw_prediction())
             self.Arrow.set_real_vector(CurrentPlanet.position, CurrentPlanet.velocity/self.Camera.VelocityRatio)
-            self.Arrow.draw()
+            DrawnRects.append(self.Arrow.draw())
             for box in self.TextList:
-                box.draw(self.Surface)
-        return DrawList
+                DrawnRects.append(box.draw(self.Surface))
+        return DrawnRects
 
 
-    def highlight_screen_position(self, coords_in):
-        """This should not be called if we are not following a planet."""
-        real_coords = self.Camera.FocusPlanet.radius*coords_in + self.Camera.FocusPlanet.position
-        screen_coords = []
-        for position in real_coords:
-            screen_coords.append(self.Camera.get_screen(position))
-        return screen_coords
+    def draw_prediction(self):
+        """
+        Draws the predicted path of the selected planet, carrying the prediction on a little further each
+        frame. Returns the Rect drawn over, or None.
+        """
+        Path = self.Predictor.update(self.Sim, self.CurrentSelection)
+        if len(Path) < 2:
+            return None
+        Screen = self.Camera.get_screen_array(Path).clip(-1e5, 1e5)
+        return pygame.draw.aalines(self.Surface, self.PredictionColor, False, Screen)
 
-    def draw_highlight(self):
-        if self.Camera.FollowingPlanet:
-            pygame.draw.polygon(self.Surface, self.highlight_color, self.highlight_screen_position(self.highlight_upperright))
-            pygame.draw.polygon(self.Surface, self.highlight_color, self.highlight_screen_position(self.highlight_upperleft))
-            pygame.draw.polygon(self.Surface, self.highlight_color, self.highlight_screen_position(self.highlight_lowerright))
-            pygame.draw.polygon(self.Surface, self.highlight_color, self.highlight_screen_position(self.highlight_lowerleft))
+
+    def highlight_screen_position(self, coords_in, Radius, Center):
+        """Screen coordinates of a corner mark (coords_in, in radii) around a planet of Radius at Center."""
+        real_coords = Radius*coords_in + Center
+        return self.Camera.get_screen_array(real_coords)
+
+    def draw_highlight(self, Frame=None):
+        """
+        Draws the corner marks around the planet being followed, as it is in Frame (see copy_for_draw; the
+        live state by default), if it is there. Returns the list of Rects drawn over.
+        """
+        if not self.Camera.FollowingPlanet:
+            return []
+        State = self.State if Frame is None else Frame
+        Number = self.Camera.FocusPlanet.CurrentNumber
+        if Number not in State:
+            return []
+        Row = State.row(Number)
+        Radius = State.Radius[Row]
+        Center = self.Camera.focus_position() if Frame is None else Frame.Position[Row]
+        return [pygame.draw.polygon(self.Surface, self.highlight_color, self.highlight_screen_position(Corner, Radius, Center))
+                for Corner in (self.highlight_upperright, self.highlight_upperleft, self.highlight_lowerright, self.highlight_lowerleft)]
 
 
 #################################################
@@ -483,18 +934,25 @@ class TimeIndicator():
     def __init__(self, ScreenSize=(500,500)):
         self.ScreenSize = ScreenSize
         self.center = (ScreenSize[0] + self.centerOffset[0], self.centerOffset[1])
+        self.corner = (self.center[0] - self.radius, self.center[1] - self.radius)
+        self.GoImage = self.make_image(self.GoColor)
+        self.StopImage = self.make_image(self.StopColor)
+        #   -drawn once here, and only blitted from then on
 
 
+    def make_image(self, Color):
+        Image = pygame.Surface((2*self.radius + 1, 2*self.radius + 1), pygame.SRCALPHA)
+        pygame.draw.circle(Image, Color, (self.radius, self.radius), self.radius)
+        pygame.draw.circle(Image, self.BLACK, (self.radius, self.radius), self.radius, 4)
+        return Image
+
 
     def draw(self, Surface, TimeFlowing):
+        """Returns the Rect drawn over."""
         if TimeFlowing:
-            #Surface.blit(self.GoImage, self.Center)
-            pygame.draw.circle(Surface, self.GoColor, self.center, self.radius)
-            pygame.draw.circle(Surface, self.BLACK, self.center, self.radius, 4)
+            return Surface.blit(self.GoImage, self.corner)
         else:
-            #Surface.blit(self.StopImage, self.Center)
-            pygame.draw.circle(Surface, self.StopColor, self.center, self.radius)
-            pygame.draw.circle(Surface, self.BLACK, self.center, self.radius, 4)
+            return Surface.blit(self.StopImage, self.corner)
 
 
 #################################################
@@ -510,6 +968,7 @@ class TextHandler():
     TextBoxSelected = False
     InputRect = []
     BaseFont = []
+    FontSize = 32
     TextDisplacement = (3,0)
     RootText = 'R='
     #   -the prompt for the input
@@ -520,13 +979,12 @@ class TextHandler():
     BorderColor = (0,0,0)
     TextColor = (0,0,0)
     FillColor = (255,255,255)
+    RenderedText = None
+    RenderedSurface = None
+    #   -the last text rendered, and its image: only rendered again when the text changes
 
 
     def __init__(self, TopLeftPosition=(20,20), RootText='R=', DefaultInputText=''):
-        pygame.font.init()
-        #   -this can be called more than once, but _needs_ to be called before we create the Font object.
-        #   can cause serious problems for unknown reasons...
-        self.BaseFont = pygame.font.Font(None, 32)
         self.InputRect = pygame.Rect(TopLeftPosition[0], TopLeftPosition[1], 200, 20)
         self.RootText = RootText
         self.DefaultInputText = DefaultInputText
@@ -539,6 +997,16 @@ class TextHandler():
         return "TextHandler object."
 
 
+    def font(self):
+        """The Font to write with; made on first use, so creating the box costs nothing until it is drawn."""
+        if not self.BaseFont:
+            pygame.font.init()
+            #   -this can be called more than once, but _needs_ to be called before we create the Font object.
+            #   can cause serious problems for unknown reasons...
+            self.BaseFont = pygame.font.Font(None, self.FontSize)
+        return self.BaseFont
+
+
     def set_text(self, TextIn):
         self.InputText = TextIn
     
@@ -601,10 +1069,14 @@ class TextHandler():
 
 
     def draw(self, Surface):
-        pygame.draw.rect(Surface, self.FillColor, self.InputRect, width=0)
+        """Returns the Rect drawn over."""
+        Text = self.RootText + self.InputText + ('|' if self.TextBoxSelected else '')
+        if Text != self.RenderedText:
+            self.RenderedText = Text
+            self.RenderedSurface = self.font().render(Text, True, self.TextColor)
+        Drawn = pygame.draw.rect(Surface, self.FillColor, self.InputRect, width=0)
         #pygame.draw.rect(Surface, self.BorderColor, self.InputRect, width=5)
-        TextSurface = self.BaseFont.render((self.RootText + self.InputText + ('|' if self.TextBoxSelected else '')), True, self.TextColor)
-        Surface.blit(TextSurface, self.TextPos)
+        return Drawn.union(Surface.blit(self.RenderedSurface, self.TextPos))
 
 
 #################################################
@@ -620,6 +1092,7 @@ class TextListHandler():
     Then, we print the text in the list based on state, giving a fixed amount of room between them.
     """
     BaseFont = []
+    FontSize = 20
     BLACK = (0,0,0)
     WHITE = (255,255,255)
     TextHorizontal = 5
@@ -635,29 +1108,186 @@ class TextListHandler():
     Instruction_Select = "Left-click on a planet to select it and edit its properties."
     Instruction_Create = "Press ctrl + left-click to create a new planet."
     Instruction_Follow = "Right-click on a planet to follow it."
-    Instruction_SetVelocity = "Left-click to set the planet's velocity"
+    Instruction_Trails = "Press T to toggle orbit trails."
+    Instruction_Generate = "Press G to add a generated cluster (shift + G picks which)."
+    Instruction_SetVelocity = "Left-click (or drag) to set the planet's velocity"
+    Instruction_Prediction = "P shows/hides the predicted path; F freezes the others."
     Instruction_Deselect = "Press Esc to return."
     Instruction_TimeToggle = "Press space to toggle time on/off."
     Instruction_TimeAndDeselect = "Press space to deselect and toggle time on."
 
-    List_Neutral = [Instruction_Pan, Instruction_TimeToggle, Instruction_Create, Instruction_Select, Instruction_Follow]
-    List_Selected = [Instruction_Pan, Instruction_TimeAndDeselect, Instruction_SetVelocity, Instruction_Deselect]
+    List_Neutral = [Instruction_Pan, Instruction_TimeToggle, Instruction_Create, Instruction_Select, Instruction_Follow, Instruction_Trails,
+                    Instruction_Generate]
+    List_Selected = [Instruction_Pan, Instruction_TimeAndDeselect, Instruction_SetVelocity, Instruction_Prediction, Instruction_Deselect]
 
-    TextDict = {"Neutral":List_Neutral, "Selected":List_Selected}
+    Instruction_ReplayPlay = "Press space to play/pause, R to reverse."
+    Instruction_ReplayStep = "Left/right to step (with shift: 1% of the run)."
+    Instruction_ReplaySpeed = "Up/down to double/halve the speed."
+    Instruction_ReplaySeek = "Click or drag the timeline to jump."
+
+    List_Replay = [Instruction_Pan, Instruction_ReplayPlay, Instruction_ReplayStep, Instruction_ReplaySpeed, Instruction_ReplaySeek, Instruction_Follow]
+
+    TextDict = {"Neutral":List_Neutral, "Selected":List_Selected, "Replay":List_Replay}
 
     def __init__(self):
-        pygame.font.init()
-        #   -this can be called more than once, but _needs_ to be called before we create the Font object.
-        #   can cause serious problems for unknown reasons...
-        self.BaseFont = pygame.font.Font(None, 20)
+        self.Rendered = {}
+        #   -KeyWord: list of the rendered lines; the text never changes, so each list is rendered once
+
+    def font(self):
+        """The Font to write with; made on first use."""
+        if not self.BaseFont:
+            pygame.font.init()
+            self.BaseFont = pygame.font.Font(None, self.FontSize)
+        return self.BaseFont
 
     def draw(self, Surface, KeyWord):
-        TextList = self.TextDict[KeyWord]
+        """Returns the Rect drawn over."""
+        if KeyWord not in self.Rendered:
+            self.Rendered[KeyWord] = [self.font().render(text, True, self.TextColor) for text in self.TextDict[KeyWord]]
+        Drawn = pygame.Rect(self.TextHorizontal, self.TextVertical, 0, 0)
         CurrentNum = 0
-        for text in TextList:
-            TextSurface = self.BaseFont.render(text, True, self.TextColor)
-            Surface.blit(TextSurface, (self.TextHorizontal, self.TextVertical + self.TextDeltaY*CurrentNum))
+        for TextSurface in self.Rendered[KeyWord]:
+            Drawn.union_ip(Surface.blit(TextSurface, (self.TextHorizontal, self.TextVertical + self.TextDeltaY*CurrentNum)))
             CurrentNum += 1
+        return Drawn
+
+
+#################################################
+#################################################
+#################################################
+
+
+class TimelineBar():
+    """
+    The replay timeline along the bottom of the screen: shows how far through the recording we are,
+    and turns clicks on it into frame numbers.
+    """
+    Height = 12
+    Margin = 10
+    BarColor = (90,90,90)
+    FillColor = (200,200,200)
+    BLACK = (0,0,0)
+    TextColor = (255,255,255)
+    BaseFont = None
+    FontSize = 20
+
+    def __init__(self, ScreenSize=(500,500)):
+        self.Rect = pygame.Rect(self.Margin, ScreenSize[1] - self.Margin - self.Height, ScreenSize[0] - 2*self.Margin, self.Height)
+
+    def font(self):
+        """The Font for the label; made on first use, like TextHandler's."""
+        if self.BaseFont is None:
+            pygame.font.init()
+            self.BaseFont = pygame.font.Font(None, self.FontSize)
+        return self.BaseFont
+
+    def contains(self, ScreenPosition):
+        return self.Rect.collidepoint(ScreenPosition)
+
+    def frame_at(self, ScreenPosition, FrameCount):
+        """The frame under a click at ScreenPosition (clipped to the bar)."""
+        Fraction = (ScreenPosition[0] - self.Rect.left)/max(self.Rect.width - 1, 1)
+        return int(round(min(max(Fraction, 0), 1)*max(FrameCount - 1, 0)))
+
+    def draw(self, Surface, Frame, FrameCount, Label=""):
+        pygame.draw.rect(Surface, self.BarColor, self.Rect)
+        if FrameCount > 1:
+            Width = int(round(self.Rect.width*Frame/(FrameCount - 1)))
+            pygame.draw.rect(Surface, self.FillColor, (self.Rect.left, self.Rect.top, Width, self.Rect.height))
+        pygame.draw.rect(Surface, self.BLACK, self.Rect, 1)
+        if Label:
+            TextSurface = self.font().render(Label, True, self.TextColor)
+            Surface.blit(TextSurface, (self.Rect.left, self.Rect.top - TextSurface.get_height() - 2))
+
+
+#################################################
+#################################################
+#################################################
+
+
+class DirtyRects():
+    """
+    Collects the screen rectangles that changed in a frame, so that update() only copies those to the
+    display. Whatever was drawn in the frame before is included too, since it has to be erased.
+    The whole screen is updated instead after invalidate() (e.g. the view moved), or when there are so many
+    rectangles that one big copy is cheaper.
+    """
+    MaxRects = 300
+    MaxAreaFraction = 0.5
+
+    def __init__(self, ScreenSize=(500,500)):
+        self.ScreenRect = pygame.Rect((0,0), ScreenSize)
+        self.Current = []
+        self.Previous = []
+        self.Full = True
+        self.Last = {}
+        #   -Name: (State, Rect) last given to add_if_changed
+
+    def add(self, Rects):
+        """Adds a Rect, or a list of them (None entries are skipped)."""
+        if isinstance(Rects, pygame.Rect):
+            Rects = [Rects]
+        self.Current.extend(Rect for Rect in Rects if Rect is not None)
+
+    def add_if_changed(self, Name, State, Rect):
+        """
+        For overlays which rarely change: adds Rect (and the Rect drawn before it, which has to be erased)
+        only if State differs from the State given for Name last frame.
+        """
+        Last = self.Last.get(Name)
+        if Last is None or Last[0] != State:
+            self.Last[Name] = (State, Rect)
+            self.add([Rect] if Last is None else [Last[1], Rect])
+
+    def invalidate(self):
+        self.Full = True
+
+    def update(self):
+        """Updates the display, and starts the next frame. Returns True if the whole screen was updated."""
+        Rects = [Rect.clip(self.ScreenRect) for Rect in self.Previous + self.Current]
+        Full = self.Full or len(Rects) > self.MaxRects or \
+            sum(Rect.width*Rect.height for Rect in Rects) > self.MaxAreaFraction*self.ScreenRect.width*self.ScreenRect.height
+        if Full:
+            pygame.display.update()
+        elif Rects:
+            pygame.display.update(Rects)
+        self.Previous, self.Current, self.Full = self.Current, [], False
+        return Full
+
+
+#################################################
+#################################################
+#################################################
+
+
+class ProfilerHUD():
+    """
+    Overlay of text lines in the bottom-left corner of the screen (or bottom-right, if Right): the frame
+    timings of a ppl_profile.FrameProfiler, or the drifts of a ppl_diagnostics.ConservationMonitor.
+    """
+    TextColor = (255,255,0)
+    BackColor = (0,0,0)
+    TextHorizontal = 5
+    TextDeltaY = 15
+
+    def __init__(self, ScreenSize=(500,500), Right=False):
+        self.ScreenSize = ScreenSize
+        self.Right = Right
+        self.BaseFont = None
+        #   -made on the first draw, so a hidden overlay costs nothing
+
+    def draw(self, Surface, Lines):
+        """Returns the Rect drawn over."""
+        if self.BaseFont is None:
+            pygame.font.init()
+            self.BaseFont = pygame.font.Font(None, 18)
+        Top = self.ScreenSize[1] - self.TextDeltaY*(len(Lines) + 2)
+        Drawn = pygame.Rect(self.TextHorizontal, Top, 0, 0)
+        for Num, Line in enumerate(Lines):
+            TextSurface = self.BaseFont.render(Line, True, self.TextColor, self.BackColor)
+            Left = self.ScreenSize[0] - self.TextHorizontal - TextSurface.get_width() if self.Right else self.TextHorizontal
+            Drawn.union_ip(Surface.blit(TextSurface, (Left, Top + self.TextDeltaY*Num)))
+        return Drawn
 
 
 #################################################
@@ -697,7 +1327,7 @@ class VectArrow():
     def draw(self):
         self.align_to_points()
         arrow_coords = self.scale*np.matmul(self.base_coords,rot_mat(self.theta-np.pi/2)) + self.tail
-        pygame.draw.polygon(self.SURF, self.color, numpy_to_tuples(arrow_coords))
+        return pygame.draw.polygon(self.SURF, self.color, numpy_to_tuples(arrow_coords))
 
 
 #################################################
@@ -705,7 +1335,38 @@ class VectArrow():
 #################################################
 
 
-def main(ScreenSize=(500,500)):
+DefaultScene = "scene.npz"
+#   -where ctrl + S saves the scene when main() is not given one
+ProfileTracePath = "profile_trace.csv"
+ProfileStatsPath = "profile.prof"
+ProfileFrames = 300
+#   -F4 writes the profiler's frame trace to ProfileTracePath; F5 runs cProfile for ProfileFrames frames
+DiagnosticsPath = "diagnostics.csv"
+DiagnosticsEvery = 10
+#   -F6 samples energy and momentum every DiagnosticsEvery steps; F7 writes the samples to DiagnosticsPath
+
+
+def main(ScreenSize=(500,500), PhysicsMode="inline", PhysicsRate=60, Collisions=None, Record=None, RecordEvery=1, Replay=None,
+         Scene=None, Profile=False, Trails=False, Diagnostics=False, Control=None):
+    """
+    Runs the interactive app.
+    PhysicsMode is where the physics runs: "inline" (in this loop), "thread" or "process" (see ppl_loop.PhysicsRunner).
+    The physics always takes steps of 1/PhysicsRate of simulated time, at that many steps per real second,
+    whatever the frame rate; planets are drawn interpolated between steps.
+    Collisions is what touching planets do: None (pass through), "merge" or "bounce".
+    If Record is a file path, the run is recorded there (every RecordEvery-th step) as a trajectory file,
+    from the first time time is started, for the planets that exist then (see ppl_trajectory).
+    If Replay is the path of such a file, it is played back instead (see replay()).
+    Scene is a scene file (.npz or .json, see ppl_scene) loaded at the start if it exists; ctrl + S saves the
+    scene to it (or to DefaultScene), ctrl + O loads it again.
+    Profile shows the profiling overlay from the start; F3 toggles it, F4 exports the frame trace and F5
+    runs cProfile over the next ProfileFrames frames (see ppl_profile).
+    Trails shows orbit trails from the start; T toggles them.
+    Diagnostics shows the energy, momentum and angular momentum drift from the start; F6 toggles them, and F7
+    exports the samples (see ppl_diagnostics).
+    If Control is given, other programs can drive the simulation through a control socket there: a Unix
+    socket path, or a TCP port on 127.0.0.1 (see ppl_control). Their commands are applied between frames.
+    """
 
     #static Stuff:
     ModDict = {"Neutral":4096, "LShift":4097, "LCtrl":4160, "LAlt":4352, "LShift+LCtrl":4161}
@@ -717,7 +1378,7 @@ def main(ScreenSize=(500,500)):
     pygame.init()
     DISPLAYSURF = pygame.display.set_mode(ScreenSize)
     DISPLAYSURF.fill(BGColor)
-    logo = pygame.image.load("./Planets.ico")
+    logo = pygame.image.load(IconPath)
     pygame.display.set_icon(logo)
     pygame.display.set_caption("PyPlanets")
     pygame.display.update()
@@ -726,25 +1387,58 @@ def main(ScreenSize=(500,500)):
     CameraZoomScrollRatio = 0.10    # when zooming, each scroll scales the picture by this much
     CameraZoomButtonRatio = 0.02    # when zooming, each tick with button held will scale the picture by this much
     
+    if Replay:
+        replay(DISPLAYSURF, Camera, Replay, FPS, BGColor)
+        return
+
     TimeLight = TimeIndicator(ScreenSize)
     TextListObj = TextListHandler()
 
-    mainPlanetList = PlanetList(DISPLAYSURF, Camera)
+    mainSim = Simulation(Collisions=Collisions)
+    mainPlanetList = PlanetList(DISPLAYSURF, Camera, mainSim)
     mainPlanetList.new_planet(position=np.array([0,0]))
-
-    dt = 1/FPS
-    #print(dt)
+    ScenePath = Scene or DefaultScene
+    if Scene and os.path.exists(Scene):
+        mainPlanetList.load(Scene)
+    if Trails:
+        mainPlanetList.toggle_trails()
+
+    Runner = PhysicsRunner(mainSim, Mode=PhysicsMode, StepDt=1/PhysicsRate)
+    Recorder = None
+    Profiler = FrameProfiler(Enabled=Profile)
+    ProfilerOverlay = ProfilerHUD(ScreenSize)
+    Monitor = ConservationMonitor(Every=DiagnosticsEvery)
+    MonitorOverlay = ProfilerHUD(ScreenSize, Right=True)
+    if Diagnostics:
+        Runner.set_monitor(Monitor)
+    Server = None
+    if Control is not None:
+        from ppl_control import ControlServer
+        #   -imported here, as asyncio adds noticeably to the start-up time otherwise
+        Server = ControlServer(Control).start()
+    Dirty = DirtyRects(ScreenSize)
+    LastView = None
+    #   -camera position and zoom in the last frame: if they change, everything on screen moves
+    Clock = pygame.time.Clock()
+    FrameTime = 0
+    #   -real time the last frame took, in seconds
 
 
     FINISHED = False
     while True:
 
+        Profiler.start_frame()
         PressedKeys = pygame.key.get_pressed()
         PressedMods = pygame.key.get_mods()
 
-        # Do the physics:
-        if mainPlanetList.TimeFlowing:
-            mainPlanetList.Time_Step(dt)
+        # Do the physics (or, in thread/process mode, collect what it has done):
+        if Record and Recorder is None and mainPlanetList.TimeFlowing:
+            with Runner.editing():
+                Recorder = TrajectoryRecorder(Record, mainSim, 1/PhysicsRate, RecordEvery)
+            Runner.Recorder = Recorder
+        Runner.set_running(mainPlanetList.TimeFlowing)
+        with Profiler.phase("Time_Step"):
+            Runner.update(FrameTime)
 
         # Handle held buttons:
         if not mainPlanetList.Is_Editing_Text():
@@ -755,54 +1449,97 @@ def main(ScreenSize=(500,500)):
                 #   zoom out
                 Camera.zoom(-CameraZoomButtonRatio)
 
-        # Handle events:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                FINISHED = True
-                break
-
-            # Panning: check MouseMotion with button = (0,1,0):
-            elif event.type == pygame.MOUSEMOTION:
-                if (event.buttons == (0,1,0)) or ((event.buttons == (1,0,0)) and PressedMods == ModDict["LShift"]):
-                    Camera.pan(event.rel)
+        # Handle events (and commands from the control socket, in bulk), holding the lock only for those
+        # which edit the planets, so the physics thread can step in between:
+        with Profiler.phase("events"):
+            if Server is not None and Server.pending():
+                with Runner.editing():
+                    Server.apply(mainPlanetList, Runner)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    Runner.close()
+                    if Server is not None:
+                        Server.close()
+                    if Recorder is not None:
+                        Recorder.close()
+                    pygame.quit()
+                    FINISHED = True
+                    break
 
-            elif event.type == pygame.MOUSEBUTTONDOWN:
+                # Panning: check MouseMotion with button = (0,1,0):
+                elif event.type == pygame.MOUSEMOTION:
+                    if (event.buttons == (0,1,0)) or ((event.buttons == (1,0,0)) and PressedMods == ModDict["LShift"]):
+                        Camera.pan(event.rel)
+                    elif event.buttons == (1,0,0) and PressedMods == ModDict["Neutral"] and mainPlanetList.SelectionActive \
+                            and not mainPlanetList.Is_Editing_Text():
+                        #   dragging sets the velocity continuously, with the predicted path following
+                        with Runner.editing():
+                            mainPlanetList.set_velocity(Camera.get_real(event.pos))
+
+                elif event.type == pygame.MOUSEBUTTONDOWN:
                 
-                if event.button == 1:
-                    #   left click
+                    if event.button == 1:
+                        #   left click
                     
-                    #   if LCtrl is pressed, create a new planet:
-                    if PressedMods == ModDict["LCtrl"]:
-                        #   create new planet
-                        ClickRealPosition = Camera.get_real(event.pos)
-                        CNum = mainPlanetList.new_planet(position=ClickRealPosition)
-                        #print(CNum)
-
-                    elif PressedMods == ModDict["Neutral"]:
-                        #   try to select object
-                        CSelected, CNum = mainPlanetList.handle_click_1(ScreenPosition=event.pos)
-                        #print(CNum)
+                        #   if LCtrl is pressed, create a new planet:
+                        if PressedMods == ModDict["LCtrl"]:
+                            #   create new planet
+                            ClickRealPosition = Camera.get_real(event.pos)
+                            with Runner.editing():
+                                CNum = mainPlanetList.new_planet(position=ClickRealPosition)
+                            #print(CNum)
+
+                        elif PressedMods == ModDict["Neutral"]:
+                            #   try to select object
+                            with Runner.editing():
+                                CSelected, CNum = mainPlanetList.handle_click_1(ScreenPosition=event.pos)
+                            #print(CNum)
                 
-                elif event.button ==2:
-                    #   middle click
-                    pass
-
-                elif event.button == 3:
-                    #   right click
-                    mainPlanetList.handle_click_3(ScreenPosition=event.pos)
-
-                elif event.button == 4:
-                    #   scroll up - zoom in
-                    Camera.zoom(CameraZoomScrollRatio)
-                    #   Maybe one day, scale the image around the mouse position?
-
-                elif event.button == 5:
-                    #   scroll down - zoom out
-                    Camera.zoom(-CameraZoomScrollRatio)
+                    elif event.button ==2:
+                        #   middle click
+                        pass
+
+                    elif event.button == 3:
+                        #   right click
+                        with Runner.editing():
+                            mainPlanetList.handle_click_3(ScreenPosition=event.pos)
+
+                    elif event.button == 4:
+                        #   scroll up - zoom in
+                        Camera.zoom(CameraZoomScrollRatio)
+                        #   Maybe one day, scale the image around the mouse position?
+
+                    elif event.button == 5:
+                        #   scroll down - zoom out
+                        Camera.zoom(-CameraZoomScrollRatio)
                 
-            elif event.type == pygame.KEYDOWN:
-                mainPlanetList.handle_keydown(event, PressedMods)
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_s and PressedMods & pygame.KMOD_CTRL and not mainPlanetList.Is_Editing_Text():
+                        with Runner.editing():
+                            mainPlanetList.save(ScenePath)
+                    elif event.key == pygame.K_o and PressedMods & pygame.KMOD_CTRL and not mainPlanetList.Is_Editing_Text():
+                        if os.path.exists(ScenePath):
+                            with Runner.editing():
+                                mainPlanetList.load(ScenePath)
+                            Runner.send_settings()
+                    elif event.key == pygame.K_t and not mainPlanetList.Is_Editing_Text():
+                        mainPlanetList.toggle_trails()
+                    elif event.key == pygame.K_F3:
+                        Profiler.Enabled = not Profiler.Enabled
+                        Profiler.reset()
+                    elif event.key == pygame.K_F4:
+                        Profiler.export(ProfileTracePath)
+                    elif event.key == pygame.K_F5:
+                        Profiler.start_cprofile(ProfileFrames, ProfileStatsPath)
+                    elif event.key == pygame.K_F6:
+                        Diagnostics = not Diagnostics
+                        Monitor.reset()
+                        Runner.set_monitor(Monitor if Diagnostics else None)
+                    elif event.key == pygame.K_F7:
+                        Monitor.export(DiagnosticsPath)
+                    else:
+                        with Runner.editing():
+                            mainPlanetList.handle_keydown(event, PressedMods)
 
         if FINISHED:
             break
@@ -815,15 +1552,139 @@ def main(ScreenSize=(500,500)):
         if mainPlanetList.SelectionActive:
             TextCurrent = "Selected"
 
-        # render the result:
+        # render the result, with the planets interpolated between physics steps (from the snapshots):
+        # the lock is held only to copy the planets, as they may merge away in the middle of a frame otherwise.
+        # Only the parts of the screen which changed are sent to the display (see DirtyRects).
         DISPLAYSURF.fill(BGColor)
-        mainPlanetList.draw()
-        mainPlanetList.draw_highlight()
-        TimeLight.draw(DISPLAYSURF, mainPlanetList.TimeFlowing)
-        TextListObj.draw(DISPLAYSURF, TextCurrent)
+        with Profiler.phase("PlanetList.draw"):
+            with Runner.editing():
+                mainPlanetList.follow_merges()
+                mainPlanetList.set_draw_positions(Runner.positions())
+                Frame = mainPlanetList.copy_for_draw()
+            if mainPlanetList.TimeFlowing:
+                mainPlanetList.update_trails(Frame)
+            Dirty.add(mainPlanetList.draw_trails(Frame))
+            mainPlanetList.draw(Frame)
+            Dirty.add(mainPlanetList.DrawnRects)
+            if mainPlanetList.SelectionActive:
+                with Runner.editing():
+                    Dirty.add(mainPlanetList.draw_selection())
+            Dirty.add(mainPlanetList.draw_highlight(Frame))
+            View = (tuple(Camera.get_camera_position()), Camera.CameraZoom)
+        if View != LastView:
+            Dirty.invalidate()
+            LastView = View
+        with Profiler.phase("TextListHandler.draw"):
+            Dirty.add_if_changed("TimeLight", mainPlanetList.TimeFlowing, TimeLight.draw(DISPLAYSURF, mainPlanetList.TimeFlowing))
+            Dirty.add_if_changed("TextList", TextCurrent, TextListObj.draw(DISPLAYSURF, TextCurrent))
+        if Profiler.Enabled:
+            Dirty.add(ProfilerOverlay.draw(DISPLAYSURF, Profiler.summary_lines()))
+        if Diagnostics:
+            Dirty.add(MonitorOverlay.draw(DISPLAYSURF, Monitor.summary_lines()))
+        with Profiler.phase("display.update"):
+            Dirty.update()
+        Profiler.end_frame(len(mainSim.State), Runner.force_evaluations())
+        FrameTime = Clock.tick(FPS)/1000
+
+#################################################
+#################################################
+#################################################
+
+
+def replay(Surface, Camera, Path, FPS=60, BGColor=(55,55,55)):
+    """
+    Plays back the trajectory file at Path (recorded with main(Record=...)) on Surface, straight from the
+    file: nothing is simulated. Space plays/pauses, left/right step a frame (with shift: a hundredth of the
+    recording), up/down double/halve the speed, R reverses, Home/End jump to either end, and clicking or
+    dragging on the timeline jumps anywhere. The camera pans, zooms and follows planets as in main().
+    """
+    ModDict = {"Neutral":4096, "LShift":4097}
+    CameraZoomScrollRatio = 0.10
+    CameraZoomButtonRatio = 0.02
+    ScreenSize = Surface.get_size()
+
+    Trajectory = TrajectoryReader(Path)
+    ReplayList = PlanetList(Surface, Camera, Simulation(NewtonG=Trajectory.NewtonG))
+    Player = ReplayPlayer(Trajectory, ReplayList.State)
+    TimeLight = TimeIndicator(ScreenSize)
+    TextListObj = TextListHandler()
+    Timeline = TimelineBar(ScreenSize)
+    pygame.key.set_repeat(250, 30)
+    #   -holding left/right keeps stepping
+
+    Clock = pygame.time.Clock()
+    FrameTime = 0
+    Scrubbing = False
+    #   -True while the left button, pressed on the timeline, is held
+    while True:
+
+        PressedKeys = pygame.key.get_pressed()
+        PressedMods = pygame.key.get_mods()
+
+        if PressedKeys[pygame.K_3]:
+            Camera.zoom(CameraZoomButtonRatio)
+        elif PressedKeys[pygame.K_4]:
+            Camera.zoom(-CameraZoomButtonRatio)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return
+
+            elif event.type == pygame.MOUSEMOTION:
+                if Scrubbing:
+                    Player.seek(Timeline.frame_at(event.pos, len(Player)))
+                elif (event.buttons == (0,1,0)) or ((event.buttons == (1,0,0)) and PressedMods == ModDict["LShift"]):
+                    Camera.pan(event.rel)
+
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1 and Timeline.contains(event.pos):
+                    Scrubbing = True
+                    Player.seek(Timeline.frame_at(event.pos, len(Player)))
+                elif event.button == 3:
+                    ReplayList.handle_click_3(ScreenPosition=event.pos)
+                elif event.button == 4:
+                    Camera.zoom(CameraZoomScrollRatio)
+                elif event.button == 5:
+                    Camera.zoom(-CameraZoomScrollRatio)
+
+            elif event.type == pygame.MOUSEBUTTONUP:
+                if event.button == 1:
+                    Scrubbing = False
+
+            elif event.type == pygame.KEYDOWN:
+                BigStep = max(len(Player)//100, 1) if PressedMods & pygame.KMOD_SHIFT else 1
+                if event.key == pygame.K_SPACE:
+                    Player.toggle()
+                elif event.key == pygame.K_RIGHT:
+                    Player.step(BigStep)
+                elif event.key == pygame.K_LEFT:
+                    Player.step(-BigStep)
+                elif event.key == pygame.K_UP:
+                    Player.Speed *= 2
+                elif event.key == pygame.K_DOWN:
+                    Player.Speed /= 2
+                elif event.key == pygame.K_r:
+                    Player.Speed = -Player.Speed
+                elif event.key == pygame.K_HOME:
+                    Player.seek(0)
+                elif event.key == pygame.K_END:
+                    Player.seek(len(Player) - 1)
+
+        Player.advance(FrameTime)
+        ReplayList.follow_merges()
+        #   -a followed planet that is missing from this frame is let go
+
+        Surface.fill(BGColor)
+        ReplayList.draw()
+        ReplayList.draw_highlight()
+        TimeLight.draw(Surface, Player.Playing)
+        TextListObj.draw(Surface, "Replay")
+        Timeline.draw(Surface, Player.Frame, len(Player),
+                      f"Frame {int(Player.Frame)}/{max(len(Player) - 1, 0)}   t = {Player.time():.2f}   speed x{Player.Speed:g}")
         pygame.display.update()
-        pygame.time.Clock().tick(FPS)
+        FrameTime = Clock.tick(FPS)/1000
 
 #################################################
 #################################################
-#################################################
\ No newline at end of file
+#################################################
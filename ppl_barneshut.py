@@ -0,0 +1,275 @@
+"""
+Barnes-Hut approximate gravity for PyPlanets.
+
+The quadtree is built over Morton (Z-order) keys, one level at a time, so both building the tree
+and walking it are done with whole-array NumPy operations instead of a Python loop per body.
+Only uses NumPy: it can be imported without pygame.
+
+Run this file directly to print accuracy-versus-theta and time-versus-N tables against the exact
+pairwise kernel.
+"""
+
+import time
+import numpy as np
+
+
+MaxDepth = 16
+#   -depth of the finest cells; 16 levels keeps a Morton key inside 32 bits
+DefaultTheta = 0.5
+#   -opening angle: a cell of size s at distance d is treated as one body when s/d < Theta
+
+
+def _spread_bits(V):
+    """Spreads the low 16 bits of each value so that there is a zero bit between every bit."""
+    V = V & np.uint64(0xFFFF)
+    V = (V | (V << np.uint64(8))) & np.uint64(0x00FF00FF)
+    V = (V | (V << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    V = (V | (V << np.uint64(2))) & np.uint64(0x33333333)
+    V = (V | (V << np.uint64(1))) & np.uint64(0x55555555)
+    return V
+
+
+#################################################
+#################################################
+#################################################
+
+
+class QuadTree():
+    """
+    A 2D quadtree stored level by level.
+    Bodies are sorted by Morton key, so the bodies inside any cell are a contiguous slice of the
+    sorted order, and the children of a cell are a contiguous slice of the next level's cells.
+    For level l, the lists below hold one array per level:
+        Prefix[l]  - Morton key of each cell (the body keys shifted right by 2*(Depth-l))
+        BodyCell[l] - for each (sorted) body, the index of the cell holding it
+        Count[l]   - number of bodies in each cell
+        CellMass[l], CellCOM[l] - total mass and centre of mass of each cell
+        ChildLo[l], ChildHi[l]  - range of the cell's children in level l+1
+    """
+
+    def __init__(self, Position, Mass, Depth=MaxDepth):
+        Position = np.asarray(Position, dtype=float)
+        Mass = np.asarray(Mass, dtype=float)
+        self.N = len(Position)
+        self.Depth = Depth
+
+        Lo = Position.min(axis=0)
+        Size = float((Position.max(axis=0) - Lo).max())
+        Size = Size*(1 + 1e-9) if Size > 0 else 1.0
+        #   -padded slightly so the largest coordinate still falls inside the last cell
+        self.Size = Size
+        Cells = np.floor((Position - Lo)*((1 << Depth)/Size)).astype(np.int64)
+        Cells = np.clip(Cells, 0, (1 << Depth) - 1).astype(np.uint64)
+        Keys = _spread_bits(Cells[:,0]) | (_spread_bits(Cells[:,1]) << np.uint64(1))
+
+        self.Order = np.argsort(Keys, kind="stable")
+        self.Keys = Keys[self.Order]
+        self.Position = Position[self.Order]
+        self.Mass = Mass[self.Order]
+
+        self.Prefix, self.BodyCell, self.Count, self.CellMass, self.CellCOM = [], [], [], [], []
+        WeightedPosition = self.Position*self.Mass[:,None]
+        for Level in range(Depth + 1):
+            Prefix = self.Keys >> np.uint64(2*(Depth - Level))
+            Starts = np.flatnonzero(np.r_[True, Prefix[1:] != Prefix[:-1]])
+            Count = np.diff(np.r_[Starts, self.N])
+            CellMass = np.add.reduceat(self.Mass, Starts)
+            CellCOM = np.add.reduceat(WeightedPosition, Starts, axis=0)
+            HasMass = (CellMass != 0)
+            CellCOM[HasMass] /= CellMass[HasMass,None]
+            CellCOM[~HasMass] = np.add.reduceat(self.Position, Starts, axis=0)[~HasMass]/Count[~HasMass,None]
+            #   -massless cells sit at their geometric centre; they exert no force either way
+            self.Prefix.append(Prefix[Starts])
+            self.BodyCell.append(np.repeat(np.arange(len(Starts)), Count))
+            self.Count.append(Count)
+            self.CellMass.append(CellMass)
+            self.CellCOM.append(CellCOM)
+            if Count.max() == 1:
+                break
+                #   -every cell is a single body, so deeper levels would be copies of this one
+        self.Levels = len(self.Prefix)
+
+        self.ChildLo, self.ChildHi = [], []
+        for Level in range(self.Levels - 1):
+            ParentOfChild = self.Prefix[Level+1] >> np.uint64(2)
+            self.ChildLo.append(np.searchsorted(ParentOfChild, self.Prefix[Level], side="left"))
+            self.ChildHi.append(np.searchsorted(ParentOfChild, self.Prefix[Level], side="right"))
+
+
+    def cell_size(self, Level):
+        return self.Size/(1 << Level)
+
+
+    def accelerations_over_G(self, Theta=DefaultTheta, Softening=0.0, Bodies=None, Law=None, Potential=None):
+        """
+        Walks the tree for every body at once, and returns sum_j m_j*(x_j - x_i)/|x_j - x_i|**3
+        for every body, in sorted (Morton) order. If Bodies (sorted indices) is given, only those
+        bodies walk the tree, and the rest are left at zero. With a ppl_forces.ForceLaw Law, every
+        accepted cell pulls with CellMass*Law.factor(r**2) instead of CellMass/r**3. If Potential (N long)
+        is given, sum_j m_j/|x_j - x_i| (or the Law's potential) is added into it, in sorted order.
+        The walk keeps an array of (body, cell) pairs which is refined level by level:
+        far cells are accepted as a point mass, single-body cells are summed exactly, and the rest are opened.
+        """
+        Acc = np.zeros((self.N, 2))
+        if self.N < 2:
+            return Acc
+        Body = np.arange(self.N) if Bodies is None else np.asarray(Bodies)
+        Cell = np.zeros(len(Body), dtype=np.int64)
+        Theta2 = Theta*Theta
+        Eps2 = Softening*Softening
+        for Level in range(self.Levels):
+            LastLevel = (Level == self.Levels - 1)
+            COM = self.CellCOM[Level][Cell]
+            CellMass = self.CellMass[Level][Cell]
+            Count = self.Count[Level][Cell]
+            Contains = (self.BodyCell[Level][Body] == Cell)
+            dR = COM - self.Position[Body]
+            if LastLevel:
+                # Cells that still hold more than one body (bodies closer than the finest cell):
+                # take the body itself out of its own cell's monopole.
+                Own = Contains & (Count > 1)
+                OwnMass = self.Mass[Body[Own]]
+                RestMass = CellMass[Own] - OwnMass
+                Safe = np.where(RestMass != 0, RestMass, 1.0)
+                dR[Own] = (CellMass[Own,None]*COM[Own] - OwnMass[:,None]*self.Position[Body[Own]])/Safe[:,None] - self.Position[Body[Own]]
+                CellMass[Own] = RestMass
+                Accept = ~Contains
+                Accept[np.flatnonzero(Own)[RestMass != 0]] = True
+                dR = dR[Accept]
+                R2 = dR[:,0]**2 + dR[:,1]**2
+            else:
+                R2 = dR[:,0]**2 + dR[:,1]**2
+                Accept = ~Contains & ((Count == 1) | (self.cell_size(Level)**2 < Theta2*R2))
+                #   -far cells, and single bodies, are summed as point masses
+                dR, R2 = dR[Accept], R2[Accept]
+            R2 += Eps2
+            W = CellMass[Accept]/(R2*np.sqrt(R2)) if Law is None else CellMass[Accept]*Law.factor(R2)
+            if Potential is not None:
+                Phi = CellMass[Accept]/np.sqrt(R2) if Law is None else CellMass[Accept]*Law.potential(R2)
+                Potential += np.bincount(Body[Accept], weights=Phi, minlength=self.N)
+            Acc[:,0] += np.bincount(Body[Accept], weights=W*dR[:,0], minlength=self.N)
+            Acc[:,1] += np.bincount(Body[Accept], weights=W*dR[:,1], minlength=self.N)
+            if LastLevel:
+                break
+            Open = ~Accept & (Count > 1)
+            #   -a body's own single-body cell is neither accepted nor opened: it simply drops out
+            Body, Cell = Body[Open], Cell[Open]
+            Lo = self.ChildLo[Level][Cell]
+            NumChildren = self.ChildHi[Level][Cell] - Lo
+            Body = np.repeat(Body, NumChildren)
+            Offsets = np.arange(len(Body)) - np.repeat(np.cumsum(NumChildren) - NumChildren, NumChildren)
+            Cell = np.repeat(Lo, NumChildren) + Offsets
+            if len(Body) == 0:
+                break
+        return Acc
+
+
+def barnes_hut_gravity(Position, Mass, NewtonG=1, Theta=DefaultTheta, Softening=0.0, Rows=None, Law=None, Potential=None):
+    """
+    Approximate gravitational force on every body, in the same units as the exact pairwise kernel.
+    The quadtree is rebuilt on every call. Theta=0 opens every cell and reproduces the exact sum.
+    If Rows (an array of indices) is given, only those bodies walk the tree, and their forces are
+    returned as a len(Rows)-by-2 array. Law is a ppl_forces.ForceLaw to use instead of plain gravity.
+    If Potential (an array, one per row) is given, it is filled with each body's potential energy, from
+    the same tree walk (see pairwise_gravity).
+    """
+    Position = np.asarray(Position, dtype=float)
+    Mass = np.asarray(Mass, dtype=float)
+    Force = np.zeros((len(Position), 2))
+    if len(Position) < 2:
+        if Potential is not None:
+            Potential[:] = 0
+        return Force if Rows is None else Force[Rows]
+    Tree = QuadTree(Position, Mass)
+    Phi = None if Potential is None else np.zeros(len(Position))
+    if Rows is None:
+        Force[Tree.Order] = Tree.accelerations_over_G(Theta=Theta, Softening=Softening, Law=Law, Potential=Phi)
+        Force *= (NewtonG*Mass)[:,None]
+        if Potential is not None:
+            Potential[Tree.Order] = Phi
+            Potential *= -NewtonG*Mass
+        return Force
+    Sorted = np.empty(len(Position), dtype=np.int64)
+    Sorted[Tree.Order] = np.arange(len(Position))
+    #   -sorted (Morton) index of every body
+    Acc = Tree.accelerations_over_G(Theta=Theta, Softening=Softening, Bodies=Sorted[Rows], Law=Law, Potential=Phi)
+    if Potential is not None:
+        Potential[:] = -NewtonG*Mass[Rows]*Phi[Sorted[Rows]]
+    return Acc[Sorted[Rows]]*(NewtonG*Mass[Rows])[:,None]
+
+
+#################################################
+#################################################
+#################################################
+
+
+def _test_scene(N, Seed=0):
+    """A reproducible clumpy disk of N bodies, roughly what a user builds on screen."""
+    Rng = np.random.default_rng(Seed)
+    Radius = 100*np.sqrt(Rng.random(N))
+    Angle = 2*np.pi*Rng.random(N)
+    Position = np.c_[Radius*np.cos(Angle), Radius*np.sin(Angle)]
+    Position += Rng.normal(scale=2.0, size=(N,2))
+    Mass = Rng.uniform(1, 100, N)
+    return Position, Mass
+
+
+def _best_time(Function, Repeats):
+    Best = np.inf
+    for _ in range(Repeats):
+        Start = time.perf_counter()
+        Result = Function()
+        Best = min(Best, time.perf_counter() - Start)
+    return Best, Result
+
+
+def accuracy_report(N=2000, Thetas=(0.0, 0.2, 0.3, 0.5, 0.7, 1.0), Seed=0, NewtonG=10, Repeats=3):
+    """
+    Compares barnes_hut_gravity with the exact pairwise kernel on one scene, for several Thetas.
+    Returns a list of dicts with the relative force error (median / 99th percentile / max) and timings.
+    """
+    from ppl_physics import pairwise_gravity
+    Position, Mass = _test_scene(N, Seed)
+    ExactTime, Exact = _best_time(lambda: pairwise_gravity(Position, Mass, NewtonG), Repeats)
+    ExactNorm = np.linalg.norm(Exact, axis=1)
+    Rows = []
+    for Theta in Thetas:
+        TreeTime, Approx = _best_time(lambda: barnes_hut_gravity(Position, Mass, NewtonG, Theta=Theta), Repeats)
+        RelError = np.linalg.norm(Approx - Exact, axis=1)/ExactNorm
+        Rows.append({"N":N, "Theta":Theta, "MedianRelError":float(np.median(RelError)),
+                     "P99RelError":float(np.percentile(RelError, 99)), "MaxRelError":float(RelError.max()),
+                     "TreeTime":TreeTime, "ExactTime":ExactTime})
+    return Rows
+
+
+def timing_report(Sizes=(1000, 2000, 5000, 10000, 20000, 50000), Theta=DefaultTheta, Seed=0, NewtonG=10, ExactLimit=10000, Repeats=3):
+    """
+    Times barnes_hut_gravity against the exact pairwise kernel for several body counts.
+    The exact kernel is skipped (reported as None) above ExactLimit bodies.
+    """
+    from ppl_physics import pairwise_gravity
+    Rows = []
+    for N in Sizes:
+        Position, Mass = _test_scene(N, Seed)
+        TreeTime, Approx = _best_time(lambda: barnes_hut_gravity(Position, Mass, NewtonG, Theta=Theta), Repeats)
+        ExactTime, MedianRelError = None, None
+        if N <= ExactLimit:
+            ExactTime, Exact = _best_time(lambda: pairwise_gravity(Position, Mass, NewtonG), Repeats)
+            MedianRelError = float(np.median(np.linalg.norm(Approx - Exact, axis=1)/np.linalg.norm(Exact, axis=1)))
+        Rows.append({"N":N, "Theta":Theta, "TreeTime":TreeTime, "ExactTime":ExactTime, "MedianRelError":MedianRelError})
+    return Rows
+
+
+def _print_rows(Rows):
+    Keys = list(Rows[0])
+    print("  ".join(f"{Key:>14}" for Key in Keys))
+    for Row in Rows:
+        print("  ".join(f"{'-':>14}" if Row[Key] is None else f"{Row[Key]:>14.4g}" for Key in Keys))
+
+
+if __name__ == "__main__":
+    print("Accuracy versus Theta:")
+    _print_rows(accuracy_report())
+    print()
+    print("Time versus N:")
+    _print_rows(timing_report())
@@ -0,0 +1,305 @@
+"""
+Benchmark suite for PyPlanets' hot paths.
+
+Times, for a range of body counts N and fixed random seeds:
+    Time_Step           - PlanetList.Time_Step (one frame: all substeps, forces and integration)
+    Calculate_gravity   - PlanetList.Calculate_gravity (one force evaluation)
+    Time_step_kinematic - PlanetList.Time_step_kinematic on all bodies at once
+    draw                - PlanetList.draw onto an off-screen pygame.Surface
+and writes the results as JSON or CSV, so runs of different versions (or force backends and
+integrators) can be compared. Examples:
+
+    python ppl_bench.py                                  # default sizes, prints a table
+    python ppl_bench.py --output results.json
+    python ppl_bench.py --backends pairwise barneshut parallel --integrators leapfrog yoshida4
+    python ppl_bench.py --output new.json --compare old.json   # flags regressions
+    python ppl_bench.py --startup                        # import and cold-start times against their budgets
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numpy as np
+
+
+DefaultSizes = (2, 10, 100, 1000, 10000)
+Benchmarks = ("Time_Step", "Calculate_gravity", "Time_step_kinematic", "draw")
+ScreenSize = (800, 800)
+FrameDt = 1/60
+
+
+def make_scene(N, Seed=0):
+    """A reproducible scene of N bodies: a disk of planets on roughly circular orbits."""
+    Rng = np.random.default_rng(Seed)
+    Radius = 5 + 95*np.sqrt(Rng.random(N))
+    Angle = 2*np.pi*Rng.random(N)
+    Position = np.c_[Radius*np.cos(Angle), Radius*np.sin(Angle)]
+    Velocity = np.c_[-np.sin(Angle), np.cos(Angle)]*np.sqrt(10*N/Radius)[:,None]*0.1
+    Mass = Rng.uniform(1, 100, N)
+    Size = Rng.uniform(0.2, 1.5, N)
+    return Position, Velocity, Mass, Size
+
+
+def make_planet_list(N, Seed=0, ForceBackend="pairwise", Integrator="leapfrog"):
+    """Builds a PlanetList drawing to an off-screen Surface, holding make_scene(N, Seed)."""
+    import pygame
+    import PyPlanets as ppl
+    Surface = pygame.Surface(ScreenSize)
+    Camera = ppl.CameraRig(ScreenSize)
+    Camera.zoom(np.log10(ScreenSize[0]/220) - Camera.CameraZoomLinear)
+    #   -zoom so the whole disk is on screen
+    Planets = ppl.PlanetList(Surface, Camera)
+    Position, Velocity, Mass, Size = make_scene(N, Seed)
+    Planets.State.add_bulk(Position, Velocity, Mass, Size)
+    Planets.ForceBackend = ForceBackend
+    Planets.Sim.Integrator = Integrator
+    return Planets
+
+
+def time_call(Function, Repeats=5, MinTime=0.2, MaxTime=5.0):
+    """
+    Times Function() after one warm-up call. Runs it at least Repeats times, or until MinTime has passed,
+    but stops early once MaxTime has been spent. Returns the list of run times in seconds.
+    """
+    Function()
+    Times = []
+    Spent = 0.0
+    while (len(Times) < Repeats or Spent < MinTime) and (Spent < MaxTime or not Times):
+        Start = time.perf_counter()
+        Function()
+        Times.append(time.perf_counter() - Start)
+        Spent += Times[-1]
+    return Times
+
+
+def run_case(Benchmark, N, Seed, ForceBackend, Integrator, Repeats, MinTime, MaxTime):
+    """Times one (benchmark, N, backend, integrator) case, and returns its result dict."""
+    Planets = make_planet_list(N, Seed, ForceBackend, Integrator)
+    State = Planets.State
+    if Benchmark == "Time_Step":
+        Function = lambda: Planets.Time_Step(FrameDt)
+    elif Benchmark == "Calculate_gravity":
+        Function = lambda: Planets.Calculate_gravity()
+    elif Benchmark == "Time_step_kinematic":
+        Function = lambda: Planets.Time_step_kinematic(State.Position, State.Velocity, State.Mass[:,None], State.Force, FrameDt)
+    elif Benchmark == "draw":
+        Function = lambda: (Planets.Surface.fill((55,55,55)), Planets.draw())
+    else:
+        raise ValueError(f"Unknown benchmark: {Benchmark}")
+    Evaluations = Planets.Sim.ForceEvaluations
+    Times = time_call(Function, Repeats, MinTime, MaxTime)
+    Evaluations = Planets.Sim.ForceEvaluations - Evaluations
+    Planets.Sim.close()
+    return {"benchmark": Benchmark, "N": N, "seed": Seed, "backend": ForceBackend, "integrator": Integrator,
+            "runs": len(Times), "min_s": min(Times), "median_s": float(np.median(Times)), "mean_s": float(np.mean(Times)),
+            "force_evaluations_per_run": Evaluations/(len(Times) + 1)}
+
+
+def run_suite(Sizes=DefaultSizes, Seeds=(0,), Which=Benchmarks, Backends=("pairwise","barneshut"), Integrators=("leapfrog",),
+              Repeats=5, MinTime=0.2, MaxTime=5.0, MaxPairwiseStepN=10000, Log=print):
+    """
+    Runs every benchmark in Which for every size and seed. Time_Step and Calculate_gravity are also run
+    for every force backend (and Time_Step for every integrator); the others don't depend on them.
+    Returns the list of result dicts.
+    """
+    Results = []
+    for Benchmark in Which:
+        PhysicsCase = Benchmark in ("Time_Step", "Calculate_gravity")
+        for ForceBackend in (Backends if PhysicsCase else Backends[:1]):
+            for Integrator in (Integrators if Benchmark == "Time_Step" else Integrators[:1]):
+                for N in Sizes:
+                    if PhysicsCase and ForceBackend != "barneshut" and N > MaxPairwiseStepN:
+                        continue
+                    for Seed in Seeds:
+                        Result = run_case(Benchmark, N, Seed, ForceBackend, Integrator, Repeats, MinTime, MaxTime)
+                        Results.append(Result)
+                        if Log:
+                            Log(f"{Benchmark:>20} {ForceBackend:>10} {Integrator:>10} N={N:<6} seed={Seed} "
+                                f"median={1e3*Result['median_s']:10.3f} ms  ({Result['runs']} runs)")
+    return Results
+
+
+#################################################
+#################################################
+#################################################
+
+
+StartupCases = {
+    "numpy": "import numpy",
+    "ppl_physics": "import ppl_physics",
+    "PyPlanets": "import PyPlanets",
+    "cold_start": "import numpy as np, ppl_physics\n"
+                  "Rng = np.random.default_rng(0)\n"
+                  "Sim = ppl_physics.Simulation.from_arrays(Rng.uniform(-400, 400, (1000, 2)), Mass=1.0)\n"
+                  "Sim.Time_Step(1/60)",
+}
+#   -each is timed in a fresh interpreter, so nothing is already imported
+StartupBudgets = {"ppl_physics": 0.030, "PyPlanets": 0.060, "cold_start": 0.150}
+#   -seconds allowed on top of "numpy" (importing NumPy alone), which no module can avoid
+StartupWithoutPygame = ("ppl_physics", "PyPlanets", "cold_start")
+#   -cases which must not load pygame: it is only imported on first use
+StartupCheck = "\nimport sys, types\nprint(type(sys.modules.get('pygame')) is types.ModuleType)"
+#   -appended to every case: whether pygame was actually executed
+
+
+def time_startup(Repeats=5):
+    """
+    Times every case in StartupCases in fresh interpreters, and returns {case: (seconds, pygame_loaded)}:
+    the median of Repeats rounds, each of which runs every case once, in turn, so a slow spell of the
+    machine hits all cases alike. The interpreter's own start-up is measured with an empty script in the
+    same rounds and taken off.
+    """
+    Here = os.path.dirname(os.path.abspath(__file__))
+    Environment = dict(os.environ, SDL_VIDEODRIVER=os.environ.get("SDL_VIDEODRIVER", "dummy"))
+    Cases = dict({"": "pass"}, **{Name: Code + StartupCheck for Name, Code in StartupCases.items()})
+    Times = {Name: [] for Name in Cases}
+    Loaded = {Name: False for Name in Cases}
+    for Round in range(Repeats):
+        Names = list(Cases)
+        Names = Names[Round % len(Names):] + Names[:Round % len(Names)]
+        #   -a different case goes first in each round
+        for Name in Names:
+            Start = time.perf_counter()
+            Output = subprocess.run([sys.executable, "-c", Cases[Name]], capture_output=True, text=True, cwd=Here,
+                                    env=Environment, check=True).stdout
+            Times[Name].append(time.perf_counter() - Start)
+            Loaded[Name] |= Output.strip().endswith("True")
+    Empty = np.median(Times.pop(""))
+    return {Name: (float(np.median(Seconds)) - Empty, Loaded[Name]) for Name, Seconds in Times.items()}
+
+
+def check_startup(Results, Budgets=StartupBudgets, Log=print):
+    """
+    Compares time_startup's results (less the NumPy import) with Budgets, and checks that the cases in
+    StartupWithoutPygame did not load pygame. Returns the cases that failed.
+    """
+    Baseline = Results["numpy"][0]
+    Over = []
+    for Name, (Seconds, Loaded) in Results.items():
+        Budget = Budgets.get(Name)
+        Extra = Seconds - Baseline
+        Flag = ""
+        if Budget is not None and Extra > Budget:
+            Flag = "  <-- over budget"
+        if Loaded and Name in StartupWithoutPygame:
+            Flag += "  <-- loaded pygame"
+        if Flag:
+            Over.append(Name)
+        if Log:
+            Log(f"{Name:>12}  {1e3*Seconds:8.1f} ms  (+{1e3*Extra:6.1f} ms over numpy"
+                + (f", budget {1e3*Budget:.0f} ms" if Budget is not None else "") + ")"
+                + ("  pygame loaded" if Loaded else "") + Flag)
+    return Over
+
+
+def metadata():
+    """Describes the machine and code version the results came from."""
+    Meta = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count()}
+    try:
+        import pygame
+        Meta["pygame"] = pygame.version.ver
+    except ImportError:
+        Meta["pygame"] = None
+    try:
+        Meta["commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        Meta["commit"] = None
+    return Meta
+
+
+def case_key(Result):
+    return (Result["benchmark"], int(Result["N"]), int(Result["seed"]), Result["backend"], Result["integrator"])
+
+
+def save_results(Path, Results, Meta):
+    """Writes the results as JSON ({"meta":..., "results":[...]}) or, for a .csv path, as CSV with one row per case."""
+    if Path.lower().endswith(".csv"):
+        with open(Path, "w", newline="") as File:
+            Writer = csv.DictWriter(File, fieldnames=list(Results[0]) + ["commit"])
+            Writer.writeheader()
+            for Result in Results:
+                Writer.writerow(dict(Result, commit=Meta.get("commit")))
+    else:
+        with open(Path, "w") as File:
+            json.dump({"meta": Meta, "results": Results}, File, indent=1)
+
+
+def load_results(Path):
+    """Reads results written by save_results (JSON or CSV)."""
+    if Path.lower().endswith(".csv"):
+        with open(Path, newline="") as File:
+            Rows = list(csv.DictReader(File))
+        for Row in Rows:
+            for Key in ("min_s", "median_s", "mean_s"):
+                Row[Key] = float(Row[Key])
+        return Rows
+    with open(Path) as File:
+        return json.load(File)["results"]
+
+
+def compare(Old, New, Tolerance=0.10, Log=print):
+    """
+    Compares the median times of cases present in both result lists.
+    Returns the list of (case, old, new) for cases more than Tolerance slower in New.
+    """
+    OldByCase = {case_key(Result): Result for Result in Old}
+    Regressions = []
+    for Result in New:
+        Before = OldByCase.get(case_key(Result))
+        if Before is None:
+            continue
+        Ratio = Result["median_s"]/Before["median_s"]
+        Flag = ""
+        if Ratio > 1 + Tolerance:
+            Regressions.append((case_key(Result), Before["median_s"], Result["median_s"]))
+            Flag = "  <-- slower"
+        if Log:
+            Log(f"{' '.join(str(Part) for Part in case_key(Result)):>55}  {1e3*Before['median_s']:10.3f} -> {1e3*Result['median_s']:10.3f} ms  x{Ratio:.2f}{Flag}")
+    return Regressions
+
+
+def main(Args=None):
+    Parser = argparse.ArgumentParser(description="Benchmark PyPlanets' stepping, force evaluation and rendering.")
+    Parser.add_argument("--sizes", type=int, nargs="+", default=list(DefaultSizes), help="body counts to run")
+    Parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="random seeds for the scenes")
+    Parser.add_argument("--benchmarks", nargs="+", default=list(Benchmarks), choices=Benchmarks)
+    Parser.add_argument("--backends", nargs="+", default=["pairwise", "barneshut"], help="force backends for Time_Step/Calculate_gravity")
+    Parser.add_argument("--integrators", nargs="+", default=["leapfrog"], help="integrators for Time_Step")
+    Parser.add_argument("--repeats", type=int, default=5, help="minimum timed runs per case")
+    Parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds spent per case")
+    Parser.add_argument("--max-time", type=float, default=5.0, help="stop repeating a case after this many seconds")
+    Parser.add_argument("--output", help="write results to this .json or .csv file")
+    Parser.add_argument("--compare", help="earlier results file to compare against")
+    Parser.add_argument("--tolerance", type=float, default=0.10, help="slowdown ratio reported as a regression")
+    Parser.add_argument("--startup", action="store_true", help="only time imports and a cold start, against their budgets")
+    Options = Parser.parse_args(Args)
+
+    if Options.startup:
+        Over = check_startup(time_startup(Options.repeats))
+        print(f"{len(Over)} case(s) over budget or loading pygame")
+        return 1 if Over else 0
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    #   -nothing is shown on screen; this lets pygame start on machines without a display
+    Results = run_suite(Options.sizes, Options.seeds, Options.benchmarks, Options.backends, Options.integrators,
+                        Options.repeats, Options.min_time, Options.max_time)
+    Meta = metadata()
+    if Options.output:
+        save_results(Options.output, Results, Meta)
+        print(f"Wrote {len(Results)} results to {Options.output}")
+    if Options.compare:
+        Regressions = compare(load_results(Options.compare), Results, Options.tolerance)
+        print(f"{len(Regressions)} regression(s) beyond {100*Options.tolerance:.0f}%")
+        return 1 if Regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Collision handling for PyPlanets.
+
+Overlapping planets are found with a spatial-hash broad phase (ppl_spatial.SpatialGrid) followed by the
+exact circle-circle test, and then either merged or bounced off each other:
+    merge  - every group of touching planets becomes one planet, conserving mass and momentum;
+             the merged planet keeps the Number (and colour) of the heaviest member
+    bounce - touching pairs exchange momentum along the line between their centres, with a coefficient
+             of restitution, and are pushed apart so they no longer overlap
+Only uses NumPy.
+"""
+
+import numpy as np
+from ppl_spatial import SpatialGrid
+
+
+def find_collisions(Position, Radius):
+    """Returns (I, J), I < J: the rows of every pair of overlapping circles."""
+    if len(Position) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return SpatialGrid(Position, Radius).overlapping_pairs()
+
+
+def group_labels(I, J, N):
+    """
+    Connected components of the graph with edges (I, J): returns, for each of the N rows, the smallest
+    row in its group. Found by repeatedly passing the smaller label across every edge.
+    """
+    Labels = np.arange(N)
+    while True:
+        Smaller = np.minimum(Labels[I], Labels[J])
+        New = Labels.copy()
+        np.minimum.at(New, I, Smaller)
+        np.minimum.at(New, J, Smaller)
+        New = New[New]
+        #   -pointer jumping: follow labels of labels, so long chains collapse quickly
+        if np.array_equal(New, Labels):
+            return Labels
+        Labels = New
+
+
+def merge_collisions(State, I, J):
+    """
+    Merges every group of touching planets of the PlanetState into its heaviest member.
+    Mass and momentum are conserved; the survivor moves to the group's centre of mass, and its radius
+    grows so that the group's total area is kept. Returns a dict {absorbed Number: survivor Number}.
+    """
+    if len(I) == 0:
+        return {}
+    Labels = group_labels(I, J, State.N)
+    InGroup = np.flatnonzero(np.bincount(Labels, minlength=State.N)[Labels] > 1)
+    Group = Labels[InGroup]
+    Mass = State.Mass[InGroup]
+    Weight = np.where(np.bincount(Group, weights=Mass, minlength=State.N)[Group] != 0, Mass, 1.0)
+    #   -a group of massless planets is averaged with equal weights instead
+
+    # The survivor of each group is its heaviest member (the first one, on ties):
+    Order = np.lexsort((InGroup, -Mass, Group))
+    IsFirst = np.r_[True, Group[Order][1:] != Group[Order][:-1]]
+    Survivor = np.zeros(State.N, dtype=np.int64)
+    Survivor[Group[Order][IsFirst]] = InGroup[Order][IsFirst]
+    SurvivorRow = Survivor[Group]
+
+    TotalWeight = np.bincount(Group, weights=Weight, minlength=State.N)
+    TotalMass = np.bincount(Group, weights=Mass, minlength=State.N)
+    Area = np.bincount(Group, weights=State.Radius[InGroup]**2, minlength=State.N)
+    Centre = np.c_[np.bincount(Group, weights=Weight*State.Position[InGroup,0], minlength=State.N),
+                   np.bincount(Group, weights=Weight*State.Position[InGroup,1], minlength=State.N)]
+    Momentum = np.c_[np.bincount(Group, weights=Weight*State.Velocity[InGroup,0], minlength=State.N),
+                     np.bincount(Group, weights=Weight*State.Velocity[InGroup,1], minlength=State.N)]
+
+    Groups = Group[Order][IsFirst]
+    Rows = Survivor[Groups]
+    State.Position[Rows] = Centre[Groups]/TotalWeight[Groups,None]
+    State.Velocity[Rows] = Momentum[Groups]/TotalWeight[Groups,None]
+    State.Mass[Rows] = TotalMass[Groups]
+    State.Radius[Rows] = np.sqrt(Area[Groups])
+
+    State.touch()
+
+    Absorbed = InGroup[InGroup != SurvivorRow]
+    Merged = dict(zip(State.Numbers[Absorbed].tolist(), State.Numbers[Survivor[Labels[Absorbed]]].tolist()))
+    State.remove(State.Numbers[Absorbed])
+    return Merged
+
+
+def bounce_collisions(Position, Velocity, Mass, Radius, I, J, Restitution=1.0):
+    """
+    Resolves overlapping pairs (I, J) by impulses along the line of centres, in place.
+    Restitution 1 is perfectly elastic, 0 perfectly inelastic. Pairs already moving apart get no impulse,
+    but every pair is pushed apart (in proportion to inverse mass) so it no longer overlaps.
+    An isolated pair conserves energy exactly when Restitution is 1.
+    """
+    if len(I) == 0:
+        return
+    InverseMass = 1/np.maximum(Mass, 1e-300)
+    #   -massless planets are treated as very light rather than immovable
+    dR = Position[J] - Position[I]
+    Distance = np.sqrt((dR*dR).sum(axis=1))
+    Coincident = Distance == 0
+    dR[Coincident] = [1.0, 0.0]
+    Distance[Coincident] = 1.0
+    Normal = dR/Distance[:,None]
+    Share = InverseMass[I] + InverseMass[J]
+
+    Contacts = np.bincount(np.r_[I, J], minlength=len(Position))
+    Split = np.maximum(Contacts[I], Contacts[J])
+    #   -a planet touching several others at once shares its impulse between them, so the simultaneous
+    #    impulses do not overshoot and add energy; each pair still gets equal and opposite impulses
+
+    Approach = ((Velocity[J] - Velocity[I])*Normal).sum(axis=1)
+    Impulse = np.where(Approach < 0, -(1 + Restitution)*Approach/Share/Split, 0.0)
+    np.add.at(Velocity, I, -(Impulse*InverseMass[I])[:,None]*Normal)
+    np.add.at(Velocity, J, (Impulse*InverseMass[J])[:,None]*Normal)
+
+    Overlap = np.where(Coincident, Radius[I] + Radius[J], Radius[I] + Radius[J] - Distance)
+    np.add.at(Position, I, -(Overlap*InverseMass[I]/Share)[:,None]*Normal)
+    np.add.at(Position, J, (Overlap*InverseMass[J]/Share)[:,None]*Normal)
@@ -0,0 +1,438 @@
+"""
+Control socket for PyPlanets: lets other programs drive the simulation while it runs.
+
+ControlServer listens on a local Unix socket (Address is a path) or a TCP port on 127.0.0.1 (Address is a
+port number), in an asyncio event loop on a background thread. Clients send batches of commands; the
+batches wait in a queue until the render loop calls apply() between frames, which runs every waiting batch
+against the planets in bulk (one add_bulk for a whole "add", one fancy-indexed write for a "modify") and
+sends each client its replies. Planet arrays go both ways as raw binary arrays, never per-planet text.
+
+A message (a batch of commands, or the replies to one) is:
+    header length                 uint32, little-endian
+    header                        JSON: {"commands": [...]} or {"replies": [...]}, and
+                                  "arrays": [[key, dtype, shape], ...]
+    arrays                        the raw bytes of every array listed, in order, little-endian
+Array key "i.Name" is argument (or reply field) Name of command i; everything else is in the JSON.
+
+Commands (any argument not given keeps its default or current value):
+    {"op": "add", "Position": N-by-2, "Velocity", "Mass", "Radius", "Color"}   -> {"Numbers"}
+    {"op": "remove", "Numbers"}                                               -> {"Removed"}
+    {"op": "modify", "Numbers", "Position", "Velocity", "Mass", "Radius", "Color"} -> {"Modified"}
+    {"op": "step", "Count": 1, "dt": the physics step}                        -> {"Time", "StepCount"}
+    {"op": "run", "Running": true, false or null to toggle}                   -> {"Running"}
+    {"op": "state", "Fields": every field}                                    -> {"Time", "StepCount", "Numbers", ...}
+A command that fails gets {"error": message} and the rest of its batch still runs. Steps are taken in
+apply(), so a large Count holds up the frame it is applied in.
+
+    Client = ControlClient("/tmp/pyplanets.sock")
+    Numbers = Client.add(Position, Velocity, Mass=5)
+    Client.step(600)
+    State = Client.state()        # dict of arrays: Numbers, Position, Velocity, Mass, Radius, Color
+Several commands can be sent as one batch with Client.send([...]). Only uses NumPy and the standard library.
+"""
+
+import os
+import json
+import stat
+import queue
+import socket
+import struct
+import asyncio
+import threading
+import numpy as np
+
+
+MaxHeaderBytes = 1 << 20
+MaxArrayBytes = 1 << 30
+#   -larger messages are refused, and the connection closed
+ArrayKinds = "biuf"
+#   -dtype kinds allowed in messages: bool, signed and unsigned integers, floats
+
+StateFields = ("Numbers", "Position", "Velocity", "Mass", "Radius", "Color")
+EditFields = {"Position": float, "Velocity": float, "Mass": float, "Radius": float, "Color": np.uint8}
+#   -fields "modify" can write, and the dtype each is stored as
+
+
+class ControlError(Exception):
+    """A malformed message."""
+
+
+########################    Messages
+
+
+def encode_message(Header, Items, Key):
+    """
+    Encodes Header (a dict), with Items (a list of dicts: the commands or the replies) under Key, into a list of
+    byte strings. NumPy arrays in the items are sent as binary arrays; everything else goes in the JSON.
+    """
+    Plain, Arrays, Listing = [], [], []
+    for Index, Item in enumerate(Items):
+        Fields = {}
+        for Name, Value in Item.items():
+            if isinstance(Value, np.ndarray):
+                Array = np.ascontiguousarray(Value, dtype=Value.dtype.newbyteorder("<"))
+                Listing.append([f"{Index}.{Name}", Array.dtype.str, list(Array.shape)])
+                Arrays.append(Array)
+            else:
+                Fields[Name] = Value.item() if isinstance(Value, np.generic) else Value
+        Plain.append(Fields)
+    Text = json.dumps(dict(Header, **{Key: Plain, "arrays": Listing})).encode()
+    return [struct.pack("<I", len(Text)), Text] + [Array.tobytes() for Array in Arrays]
+
+
+def parse_header(Text):
+    """Reads a message header; returns it and the list of (key, dtype, shape, byte count) of its arrays."""
+    try:
+        Header = json.loads(Text)
+        Listing = []
+        for Key, DType, Shape in Header.pop("arrays", []):
+            DType, Shape = np.dtype(DType), tuple(int(Size) for Size in Shape)
+            if DType.kind not in ArrayKinds or min(Shape, default=0) < 0:
+                raise ControlError(f"Unsupported array {Key}: {DType.str} {Shape}")
+            Listing.append((Key, DType, Shape, DType.itemsize*int(np.prod(Shape))))
+    except (ValueError, TypeError) as Error:
+        raise ControlError(f"Bad message header: {Error}") from None
+    if sum(Entry[3] for Entry in Listing) > MaxArrayBytes:
+        raise ControlError("Message too large")
+    return Header, Listing
+
+
+def attach_arrays(Items, Listing, Buffers):
+    """Puts the arrays read for a message into its items, by their "index.Name" keys. Raises ControlError for a bad key."""
+    for (Key, DType, Shape, Size), Buffer in zip(Listing, Buffers):
+        try:
+            Index, Name = Key.split(".", 1)
+            Index = int(Index)
+        except (ValueError, AttributeError):
+            raise ControlError(f"Bad array key: {Key!r}") from None
+        if not 0 <= Index < len(Items):
+            raise ControlError(f"Array {Key} is for item {Index}, of {len(Items)}")
+        Items[Index][Name] = np.frombuffer(Buffer, dtype=DType).reshape(Shape)
+    return Items
+
+
+async def read_message(Reader, Key):
+    """Reads one message from an asyncio StreamReader; returns its items (see encode_message), or None at EOF."""
+    try:
+        Length, = struct.unpack("<I", await Reader.readexactly(4))
+    except asyncio.IncompleteReadError:
+        return None
+    if Length > MaxHeaderBytes:
+        raise ControlError("Message header too large")
+    Header, Listing = parse_header(await Reader.readexactly(Length))
+    Buffers = [await Reader.readexactly(Entry[3]) for Entry in Listing]
+    Items = Header.get(Key)
+    if not isinstance(Items, list) or not all(isinstance(Item, dict) for Item in Items):
+        raise ControlError(f"Message has no list of {Key}")
+    return attach_arrays(Items, Listing, Buffers)
+
+
+#################################################
+#################################################
+#################################################
+
+
+class ControlServer():
+    """
+    Serves the control socket at Address: a path for a Unix socket, or a port number for TCP on 127.0.0.1
+    (0 picks a free port; self.Address is the real one once started). See the module docstring.
+
+    The render loop calls, between frames (holding Runner.editing()):
+        Server.apply(Planets, Runner)
+    where Planets is the PlanetList (anything with Sim and TimeFlowing attributes will do).
+    """
+
+    def __init__(self, Address):
+        self.Address = Address
+        self.Batches = 0
+        self.Commands = 0
+        #   -applied so far
+        self._Queue = queue.Queue()
+        #   -(commands, asyncio future for the replies) of every batch waiting for apply()
+        self._Loop = None
+        self._Server = None
+        self._Thread = None
+
+
+    def start(self):
+        """Starts listening, on a background thread. Returns self."""
+        Ready = threading.Event()
+        Failure = []
+        def serve():
+            self._Loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._Loop)
+            try:
+                self._Server = self._Loop.run_until_complete(self._listen())
+            except OSError as Error:
+                Failure.append(Error)
+                Ready.set()
+                self._Loop.close()
+                return
+            Ready.set()
+            self._Loop.run_forever()
+            self._Server.close()
+            Tasks = asyncio.all_tasks(self._Loop)
+            for Task in Tasks:
+                Task.cancel()
+                #   -clients still waiting for replies
+            self._Loop.run_until_complete(asyncio.gather(*Tasks, return_exceptions=True))
+            self._Loop.close()
+        self._Thread = threading.Thread(target=serve, name="PyPlanets control", daemon=True)
+        self._Thread.start()
+        Ready.wait()
+        if Failure:
+            self._Thread = None
+            raise Failure[0]
+        return self
+
+
+    async def _listen(self):
+        if isinstance(self.Address, str):
+            if os.path.exists(self.Address) and stat.S_ISSOCK(os.stat(self.Address).st_mode):
+                os.remove(self.Address)
+                #   -left behind by a run that did not close
+            return await asyncio.start_unix_server(self._handle, path=self.Address)
+        Server = await asyncio.start_server(self._handle, host="127.0.0.1", port=int(self.Address))
+        self.Address = Server.sockets[0].getsockname()[1]
+        return Server
+
+
+    async def _handle(self, Reader, Writer):
+        """Serves one client: queues each batch it sends, and writes back the replies once apply() has run it."""
+        try:
+            while True:
+                try:
+                    Commands = await read_message(Reader, "commands")
+                except ControlError as Error:
+                    Writer.writelines(encode_message({"error": str(Error)}, [], "replies"))
+                    await Writer.drain()
+                    break
+                if Commands is None:
+                    break
+                Future = self._Loop.create_future()
+                self._Queue.put((Commands, Future))
+                Writer.writelines(encode_message({}, await Future, "replies"))
+                await Writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            Writer.close()
+
+
+    def close(self):
+        """Stops listening and drops the connections; batches not yet applied are never answered."""
+        if self._Thread is None:
+            return
+        self._Loop.call_soon_threadsafe(self._Loop.stop)
+        self._Thread.join()
+        self._Thread = None
+        if isinstance(self.Address, str) and os.path.exists(self.Address):
+            os.remove(self.Address)
+
+
+    ########################    Applying commands
+
+
+    def pending(self):
+        return self._Queue.qsize()
+
+
+    def apply(self, Planets, Runner=None):
+        """
+        Runs every batch waiting in the queue, in the order they arrived, and sends off the replies.
+        Steps are StepDt of Runner long (1/60 without one) unless a command says otherwise.
+        Returns the number of batches applied.
+        """
+        Count = 0
+        while True:
+            try:
+                Commands, Future = self._Queue.get_nowait()
+            except queue.Empty:
+                return Count
+            Replies = [self._run(Command, Planets, Runner) for Command in Commands]
+            self._Loop.call_soon_threadsafe(_resolve, Future, Replies)
+            Count += 1
+            self.Batches += 1
+            self.Commands += len(Commands)
+
+
+    def _run(self, Command, Planets, Runner):
+        """Runs one command, returning its reply."""
+        Operation = Command.get("op")
+        Handler = self.Operations.get(Operation)
+        if Handler is None:
+            return {"error": f"Unknown command: {Operation}. Choose from {list(self.Operations)}"}
+        try:
+            return Handler(self, Command, Planets, Runner)
+        except (KeyError, ValueError, TypeError, IndexError) as Error:
+            return {"error": f"{type(Error).__name__}: {Error}"}
+
+
+    def _add(self, Command, Planets, Runner):
+        Position = np.asarray(Command["Position"], dtype=float).reshape(-1,2)
+        Velocity = Command.get("Velocity")
+        Arguments = {Name: np.asarray(Command[Name]) for Name in ("Mass", "Radius", "Color") if Name in Command}
+        Arguments.setdefault("Mass", getattr(Planets, "defaultMass", 1))
+        return {"Numbers": Planets.Sim.State.add_bulk(Position, None if Velocity is None else np.asarray(Velocity), **Arguments)}
+
+
+    def _remove(self, Command, Planets, Runner):
+        Numbers = np.asarray(Command["Numbers"], dtype=np.int64).reshape(-1)
+        State = Planets.Sim.State
+        State.rows(Numbers)
+        #   -raises KeyError, before anything is removed, if a planet does not exist
+        Before = len(State)
+        State.remove(Numbers)
+        #   -a Number given twice is only removed once, so count what went
+        return {"Removed": Before - len(State)}
+
+
+    def _modify(self, Command, Planets, Runner):
+        State = Planets.Sim.State
+        Rows = State.rows(np.asarray(Command["Numbers"], dtype=np.int64).reshape(-1))
+        Values = {Name: np.broadcast_to(np.asarray(Command[Name], dtype=DType), getattr(State, Name)[Rows].shape)
+                  for Name, DType in EditFields.items() if Name in Command}
+        #   -checked for every field before any is written
+        for Name, Value in Values.items():
+            getattr(State, Name)[Rows] = Value
+        State.touch()
+        return {"Modified": len(Rows)}
+
+
+    def _step(self, Command, Planets, Runner):
+        Sim = Planets.Sim
+        dt = float(Command.get("dt") or (Runner.StepDt if Runner is not None else 1/60))
+        for Step in range(int(Command.get("Count", 1))):
+            Sim.Time_Step(dt)
+        if Runner is not None:
+            Runner.Snapshots.clear()
+            #   -the snapshots are from before these steps
+        return {"Time": Sim.Time, "StepCount": Sim.StepCount}
+
+
+    def _set_running(self, Command, Planets, Runner):
+        Running = Command.get("Running")
+        Planets.TimeFlowing = (not Planets.TimeFlowing) if Running is None else bool(Running)
+        if Planets.TimeFlowing and getattr(Planets, "SelectionActive", False):
+            Planets.deselect()
+            #   -as ToggleTime does: a selected planet is being edited, with time stopped
+        return {"Running": Planets.TimeFlowing}
+
+
+    def _state(self, Command, Planets, Runner):
+        Sim = Planets.Sim
+        Fields = Command.get("Fields", StateFields)
+        Unknown = set(Fields) - set(StateFields)
+        if Unknown:
+            raise KeyError(f"Unknown fields {sorted(Unknown)}; choose from {list(StateFields)}")
+        Reply = {"Time": Sim.Time, "StepCount": Sim.StepCount}
+        for Name in Fields:
+            Reply[Name] = getattr(Sim.State, Name).copy()
+        return Reply
+
+
+    Operations = {"add": _add, "remove": _remove, "modify": _modify, "step": _step, "run": _set_running, "state": _state}
+    #   -command name: method running it
+
+
+def _resolve(Future, Replies):
+    if not Future.done():
+        Future.set_result(Replies)
+
+
+#################################################
+#################################################
+#################################################
+
+
+class ControlClient():
+    """
+    Blocking client for a ControlServer at Address (a Unix socket path, or a TCP port on 127.0.0.1).
+    send() sends one batch of commands and returns the replies; the other methods each send a single
+    command, and raise ControlError if it failed. Can be used in a with-block.
+    """
+
+    def __init__(self, Address, Timeout=None):
+        if isinstance(Address, str):
+            self.Socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.Socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            Address = ("127.0.0.1", int(Address))
+        self.Socket.settimeout(Timeout)
+        self.Socket.connect(Address)
+
+
+    def close(self):
+        self.Socket.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *Exception):
+        self.close()
+
+
+    def _receive(self, Size):
+        Buffer = bytearray(Size)
+        View = memoryview(Buffer)
+        while View:
+            Count = self.Socket.recv_into(View)
+            if Count == 0:
+                raise ControlError("Connection closed by the server")
+            View = View[Count:]
+        return Buffer
+
+
+    def send(self, Commands):
+        """Sends a batch of commands (dicts, see the module docstring) and returns the list of replies."""
+        self.Socket.sendall(b"".join(encode_message({}, Commands, "commands")))
+        Length, = struct.unpack("<I", self._receive(4))
+        Header, Listing = parse_header(bytes(self._receive(Length)))
+        Buffers = [self._receive(Size) for Key, DType, Shape, Size in Listing]
+        if "error" in Header:
+            raise ControlError(Header["error"])
+        return attach_arrays(Header.get("replies", []), Listing, Buffers)
+
+
+    def _command(self, Command):
+        Reply = self.send([Command])[0]
+        if "error" in Reply:
+            raise ControlError(Reply["error"])
+        return Reply
+
+
+    def add(self, Position, Velocity=None, Mass=None, Radius=None, Color=None):
+        """Adds a planet per row of Position (N-by-2); the others are broadcast to N rows. Returns the new Numbers."""
+        Command = {"op": "add", "Position": np.asarray(Position, dtype=float)}
+        for Name, Value in (("Velocity", Velocity), ("Mass", Mass), ("Radius", Radius), ("Color", Color)):
+            if Value is not None:
+                Command[Name] = np.asarray(Value)
+        return self._command(Command)["Numbers"]
+
+
+    def remove(self, Numbers):
+        return self._command({"op": "remove", "Numbers": np.asarray(Numbers, dtype=np.int64)})["Removed"]
+
+
+    def modify(self, Numbers, **Fields):
+        """Sets fields (Position, Velocity, Mass, Radius, Color) of the planets with the given Numbers."""
+        Command = {"op": "modify", "Numbers": np.asarray(Numbers, dtype=np.int64)}
+        Command.update((Name, np.asarray(Value)) for Name, Value in Fields.items())
+        return self._command(Command)["Modified"]
+
+
+    def step(self, Count=1, dt=None):
+        """Takes Count steps (of dt, or the physics step). Returns the simulation time after them."""
+        return self._command({"op": "step", "Count": Count, "dt": dt})["Time"]
+
+
+    def run(self, Running=None):
+        """Starts (True) or stops (False) time, or toggles it (None). Returns whether it is flowing now."""
+        return self._command({"op": "run", "Running": Running})["Running"]
+
+
+    def state(self, Fields=StateFields):
+        """Returns the current state as a dict of arrays (the given Fields), plus Time and StepCount."""
+        return self._command({"op": "state", "Fields": list(Fields)})
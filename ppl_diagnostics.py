@@ -0,0 +1,156 @@
+"""
+Conservation diagnostics: total energy, linear momentum and angular momentum of a run, and how far they
+have drifted, to judge whether it can be trusted.
+
+ConservationMonitor keeps the last Capacity samples in a ring buffer, one every Every steps. Set it as
+Simulation.Monitor and Time_Step samples it by itself: on those steps the force kernel also returns every
+planet's potential energy, from the distances it works out for the forces anyway, so a sample costs a
+little extra in one force evaluation plus a few O(N) sums. With no Monitor set, nothing is computed.
+
+    Sim.Monitor = ConservationMonitor(Every=10)
+    Sim.run(1000, dt=1/60)
+    Sim.Monitor.drift()          # {"Energy": ..., "Momentum": ..., "AngularMomentum": ...}
+    Sim.Monitor.export("diagnostics.csv")
+
+Drifts are measured from the first sample (or the first after reset()), so editing the planets in between
+shows up as drift too; merging collisions lose energy on purpose.
+Only uses NumPy and the standard library.
+"""
+
+import csv
+import json
+import numpy as np
+
+
+def kinetic_energy(Velocity, Mass):
+    return 0.5*float((Mass*(Velocity*Velocity).sum(axis=1)).sum())
+
+
+def momentum(Velocity, Mass):
+    """Total linear momentum, as an array [px, py]."""
+    return (Mass[:,None]*Velocity).sum(axis=0)
+
+
+def angular_momentum(Position, Velocity, Mass):
+    """Total angular momentum about the origin (the z component; everything is in the plane)."""
+    return float((Mass*(Position[:,0]*Velocity[:,1] - Position[:,1]*Velocity[:,0])).sum())
+
+
+class ConservationMonitor():
+    """Ring buffer of conserved quantities, sampled every Every steps. See the module docstring."""
+
+    Fields = ("Time", "Step", "Bodies", "Kinetic", "Potential", "Energy", "MomentumX", "MomentumY", "AngularMomentum")
+
+    def __init__(self, Every=10, Capacity=512):
+        self.Every = max(int(Every), 1)
+        self.Capacity = Capacity
+        self.Samples = np.zeros((Capacity, len(self.Fields)))
+        #   -row per sample, column per field
+        self.Count = 0
+        #   -samples taken so far (the buffer holds the last min(Count, Capacity) of them)
+        self.First = None
+        #   -the first sample, which drifts are measured from
+        self.Scale = None
+        #   -sum of m|v| and of m|r||v| at the first sample: what momentum drifts are relative to
+        self._Column = {Name: Column for Column, Name in enumerate(self.Fields)}
+
+
+    def due(self, Step):
+        """Whether the state after step number Step (counting from 1) should be sampled."""
+        return Step % self.Every == 0
+
+
+    def reset(self):
+        self.Count = 0
+        self.First = None
+
+
+    def record(self, Position, Velocity, Mass, BodyPotential, Time=0.0, Step=0):
+        """
+        Adds a sample. BodyPotential is every planet's potential energy in the field of the others (as the
+        force kernels give it with Potential=), so the total potential energy is half its sum.
+        """
+        Kinetic = kinetic_energy(Velocity, Mass)
+        Potential = 0.5*float(BodyPotential.sum())
+        Momentum = momentum(Velocity, Mass)
+        Row = (Time, Step, len(Mass), Kinetic, Potential, Kinetic + Potential, Momentum[0], Momentum[1],
+               angular_momentum(Position, Velocity, Mass))
+        self.Samples[self.Count % self.Capacity] = Row
+        self.Count += 1
+        if self.First is None:
+            self.First = np.array(Row)
+            Speed = np.sqrt((Velocity*Velocity).sum(axis=1))
+            Distance = np.sqrt((Position*Position).sum(axis=1))
+            self.Scale = (float((Mass*Speed).sum()), float((Mass*Distance*Speed).sum()))
+
+
+    def record_sim(self, Sim):
+        """Samples Sim's current state, working its potential energy out with a separate force evaluation."""
+        State = Sim.State
+        self.record(State.Position, State.Velocity, State.Mass, Sim.potential_energies(), Sim.Time, Sim.StepCount)
+
+
+    ########################    Results
+
+
+    def _order(self):
+        """Slots of the buffered samples, oldest first."""
+        Held = min(self.Count, self.Capacity)
+        return np.arange(self.Count - Held, self.Count) % self.Capacity
+
+
+    def samples(self):
+        """The buffered samples, oldest first, as a dict of arrays (one per field)."""
+        Table = self.Samples[self._order()]
+        return {Name: Table[:,Column] for Column, Name in enumerate(self.Fields)}
+
+
+    def latest(self):
+        """The newest sample as a dict, or None."""
+        if self.Count == 0:
+            return None
+        return dict(zip(self.Fields, self.Samples[(self.Count - 1) % self.Capacity].tolist()))
+
+
+    def drift(self):
+        """
+        Drift of the newest sample from the first: relative change of energy, change of momentum relative
+        to sum(m|v|), and change of angular momentum relative to sum(m|r||v|) (all at the first sample).
+        """
+        if self.Count == 0:
+            return {}
+        Latest, First = self.Samples[(self.Count - 1) % self.Capacity], self.First
+        Column = self._Column
+        def relative(Change, Scale):
+            return float(Change/Scale) if Scale else float(Change)
+        Energy = Latest[Column["Energy"]] - First[Column["Energy"]]
+        Momentum = np.hypot(Latest[Column["MomentumX"]] - First[Column["MomentumX"]], Latest[Column["MomentumY"]] - First[Column["MomentumY"]])
+        Angular = Latest[Column["AngularMomentum"]] - First[Column["AngularMomentum"]]
+        return {"Energy": relative(Energy, abs(First[Column["Energy"]])), "Momentum": relative(Momentum, self.Scale[0]),
+                "AngularMomentum": relative(Angular, self.Scale[1])}
+
+
+    def summary_lines(self):
+        """Short text lines for an on-screen overlay."""
+        Latest = self.latest()
+        if Latest is None:
+            return ["conservation: no samples yet"]
+        Drift = self.drift()
+        return [f"t {Latest['Time']:.2f}   step {int(Latest['Step'])}   every {self.Every} steps",
+                f"energy   {Latest['Energy']:12.5g}   drift {Drift['Energy']:+.2e}",
+                f"momentum ({Latest['MomentumX']:.4g}, {Latest['MomentumY']:.4g})   drift {Drift['Momentum']:+.2e}",
+                f"ang. mom {Latest['AngularMomentum']:12.5g}   drift {Drift['AngularMomentum']:+.2e}"]
+
+
+    def export(self, Path):
+        """Writes the buffered samples to Path: CSV for a .csv path, otherwise JSON (with the drifts)."""
+        Samples = self.samples()
+        Rows = [dict(zip(self.Fields, Row)) for Row in zip(*(Samples[Name].tolist() for Name in self.Fields))]
+        if Path.lower().endswith(".csv"):
+            with open(Path, "w", newline="") as File:
+                Writer = csv.DictWriter(File, fieldnames=list(self.Fields))
+                Writer.writeheader()
+                Writer.writerows(Rows)
+        else:
+            with open(Path, "w") as File:
+                json.dump({"every": self.Every, "drift": self.drift(), "samples": Rows}, File, indent=1)
@@ -0,0 +1,328 @@
+"""
+Ensembles: many copies of one N-body system, stepped together.
+
+An Ensemble holds M variants (members) of a scene, e.g. with different starting velocities or masses for
+one planet, in arrays with a leading member axis: Position and Velocity are (M, N, 2), Mass and Radius
+(M, N). Time_Step advances every running member at once, with one vectorized force evaluation per
+substep for the whole batch, so a few hundred variants of a small system cost about as much as one
+NumPy call each. Members that escape or collide stop there (see check()), and are no longer stepped.
+
+    Runs = Ensemble.from_simulation(Sim, Members=200)
+    Runs.Velocity[:, Runs.row(Number), 1] *= np.linspace(0.8, 1.2, 200)
+    Runs.run(10000, dt=1/60)
+    Runs.diagnostics()          # dict of per-member arrays: Status, StopTime, EnergyError, ...
+
+Forces are always the exact pairwise sum (of any ppl_forces law). Adaptive stepping is not supported (all members share one
+dt). Only uses NumPy.
+"""
+
+import numpy as np
+from ppl_integrators import get_integrator
+from ppl_forces import get_force_law
+
+
+Running, Escaped, Collided = 0, 1, 2
+StatusNames = ("running", "escaped", "collided")
+
+
+def batched_accelerations(Position, Mass, NewtonG=1, BlockSize=None, Law=None):
+    """
+    All-pairs Newtonian gravity for a batch of independent systems: Position is (M, N, 2), Mass (M, N).
+    Returns the (M, N, 2) accelerations, a_i = G * sum_j m_j * (x_j - x_i) / |x_j - x_i|**3, within each
+    member (or with Law.factor, for a ppl_forces.ForceLaw Law). Members are processed in blocks so each
+    temporary stays around half a megabyte.
+    """
+    M, N = Mass.shape
+    Acc = np.zeros((M, N, 2))
+    if N < 2:
+        return Acc
+    if BlockSize is None:
+        BlockSize = max(1, (1 << 16)//(N*N))
+    Diagonal = np.arange(N)
+    for Start in range(0, M, BlockSize):
+        Stop = min(Start + BlockSize, M)
+        X, Y = Position[Start:Stop,:,0], Position[Start:Stop,:,1]
+        dX = X[:,None,:] - X[:,:,None]
+        dY = Y[:,None,:] - Y[:,:,None]
+        R2 = dX*dX
+        R2 += dY*dY
+        R2[:, Diagonal, Diagonal] = np.inf
+        #   -a body does not attract itself
+        if Law is None:
+            W = np.sqrt(R2)
+            W *= R2
+            np.divide(Mass[Start:Stop,None,:], W, out=W)
+        else:
+            W = Law.factor(R2)
+            W *= Mass[Start:Stop,None,:]
+        Acc[Start:Stop,:,0] = (dX*W).sum(axis=2)
+        Acc[Start:Stop,:,1] = (dY*W).sum(axis=2)
+    Acc *= NewtonG
+    return Acc
+
+
+def batched_energy(Position, Velocity, Mass, Radius, NewtonG=1, BlockSize=None, Law=None):
+    """
+    Per-member energy terms of a batch (shapes as for batched_accelerations). Returns
+    (Kinetic, Potential, Bound, Overlap): the total kinetic and potential energy of each member (M,), each
+    body's energy relative to the rest of its member, kinetic (about the member's centre of mass) plus
+    potential (M, N), and whether any two bodies of each member overlap (M,). The potential is Law's,
+    for a ppl_forces.ForceLaw Law, and Newtonian otherwise.
+    """
+    M, N = Mass.shape
+    TotalMass = Mass.sum(axis=1)
+    Centre = (Mass[:,:,None]*Velocity).sum(axis=1)/np.where(TotalMass != 0, TotalMass, 1.0)[:,None]
+    Relative = Velocity - Centre[:,None,:]
+    BodyKinetic = 0.5*Mass*(Relative*Relative).sum(axis=2)
+    Kinetic = 0.5*(Mass*(Velocity*Velocity).sum(axis=2)).sum(axis=1)
+    BodyPotential = np.zeros((M, N))
+    #   -potential energy of each body in the field of the rest of its member
+    Overlap = np.zeros(M, dtype=bool)
+    if BlockSize is None:
+        BlockSize = max(1, (1 << 16)//max(N*N, 1))
+    Diagonal = np.arange(N)
+    for Start in range(0, M, BlockSize):
+        Stop = min(Start + BlockSize, M)
+        X, Y = Position[Start:Stop,:,0], Position[Start:Stop,:,1]
+        dX = X[:,None,:] - X[:,:,None]
+        dY = Y[:,None,:] - Y[:,:,None]
+        R2 = dX*dX + dY*dY
+        R2[:, Diagonal, Diagonal] = np.inf
+        Distance = np.sqrt(R2)
+        Phi = 1/Distance if Law is None else Law.potential(R2)
+        BodyPotential[Start:Stop] = -NewtonG*Mass[Start:Stop]*(Mass[Start:Stop,None,:]*Phi).sum(axis=2)
+        Overlap[Start:Stop] = (Distance < Radius[Start:Stop,:,None] + Radius[Start:Stop,None,:]).any(axis=(1,2))
+    Potential = 0.5*BodyPotential.sum(axis=1)
+    return Kinetic, Potential, BodyKinetic + BodyPotential, Overlap
+
+
+#################################################
+#################################################
+#################################################
+
+
+class Ensemble():
+    """
+    M members, each a copy of the same N planets (see the module docstring). Status, StopTime and
+    StopStep say, per member, whether it is still running, and when it stopped.
+    """
+
+    NewtonG = 10
+    ForceLaw = "newton"
+    ForceLawParams = None
+    #   -as for Simulation: see ppl_forces
+    Integrator = "leapfrog"
+    Iterations = 2
+    #   -substeps per Time_Step, as for Simulation
+    EscapeRadius = None
+    #   -a body further than this from its member's centre of mass, and unbound, has escaped; None never checks
+    StopOnCollision = True
+    #   -stop a member as soon as two of its planets overlap
+    CheckEvery = 10
+    #   -check for escapes and collisions every this many Time_Steps: each check is a full pairwise energy pass,
+    #   as costly as a force evaluation, so checking every step would double the work. Members are stopped up to
+    #   CheckEvery-1 steps late, and a graze shorter than that can be missed; 1 checks every step
+
+    SettingNames = ("NewtonG", "ForceLaw", "ForceLawParams", "Integrator", "Iterations", "EscapeRadius", "StopOnCollision", "CheckEvery")
+
+
+    def __init__(self, Position, Velocity, Mass, Radius, Numbers=None, **Settings):
+        """
+        Position and Velocity are (M, N, 2); Mass and Radius (M, N), or (N,) to share them between members.
+        Numbers are the planets' Numbers (default 0..N-1). Settings override the class settings by keyword.
+        """
+        for Name, Value in Settings.items():
+            if Name not in self.SettingNames:
+                raise TypeError(f"Unknown Ensemble setting: {Name}")
+            setattr(self, Name, Value)
+        self.Position = np.array(Position, dtype=float)
+        self.Velocity = np.array(Velocity, dtype=float)
+        M, N = self.Position.shape[:2]
+        self.Mass = np.array(np.broadcast_to(Mass, (M, N)), dtype=float)
+        self.Radius = np.array(np.broadcast_to(Radius, (M, N)), dtype=float)
+        self.Numbers = np.arange(N, dtype=np.int64) if Numbers is None else np.array(Numbers, dtype=np.int64)
+        self.Time = 0.0
+        self.StepCount = 0
+        self.ForceEvaluations = 0
+        #   -batched force evaluations so far (each covers every running member)
+        self.Status = np.zeros(M, dtype=np.int8)
+        self.StopTime = np.full(M, np.nan)
+        self.StopStep = np.full(M, -1, dtype=np.int64)
+        self.Escapers = np.full(M, -1, dtype=np.int64)
+        #   -Number of the first planet found escaping from each member, or -1
+        self.InitialEnergy = None
+        #   -energy of every member when first stepped (so after any changes made to set up the variants)
+        self._AccCache = None
+        #   -(Rows, Position, Mass, Gravity, Acc) of the running members at the end of the last step, reused by the
+        #   next if nothing in it has changed since
+
+
+    @classmethod
+    def from_simulation(cls, Sim, Members, **Settings):
+        """Builds an Ensemble of Members identical copies of Sim's planets, with Sim's NewtonG, force law, Integrator and Iterations."""
+        State = Sim.State
+        Defaults = {"NewtonG": Sim.NewtonG, "ForceLaw": Sim.ForceLaw, "ForceLawParams": Sim.ForceLawParams,
+                    "Integrator": Sim.Integrator, "Iterations": Sim.Iterations}
+        Defaults.update(Settings)
+        Shape = (Members,) + State.Position.shape
+        return cls(np.broadcast_to(State.Position, Shape), np.broadcast_to(State.Velocity, Shape), State.Mass, State.Radius,
+                   State.Numbers, **Defaults)
+
+
+    def __len__(self):
+        return len(self.Position)
+
+
+    def row(self, Number):
+        """Index (along the planet axis) of the planet with this Number."""
+        Row = int(np.searchsorted(self.Numbers, Number))
+        if Row >= len(self.Numbers) or self.Numbers[Row] != Number:
+            raise KeyError(Number)
+        return Row
+
+
+    def member_state(self, Member):
+        """One member as a dict like Simulation.get_state(), e.g. to look at it in the app with Sim.set_state()."""
+        return {"Time": self.StopTime[Member] if self.Status[Member] else self.Time, "Numbers": self.Numbers.copy(),
+                "Position": self.Position[Member].copy(), "Velocity": self.Velocity[Member].copy(),
+                "Mass": self.Mass[Member].copy(), "Radius": self.Radius[Member].copy()}
+
+
+    def settings(self):
+        return {Name: getattr(self, Name) for Name in self.SettingNames}
+
+
+    ########################    Physics code
+
+
+    def force_law(self):
+        """The ForceLaw object, or None for plain Newtonian gravity."""
+        if self.ForceLaw == "newton" and not self.ForceLawParams:
+            return None
+        return get_force_law(self.ForceLaw, **(self.ForceLawParams or {}))
+
+
+    def running(self):
+        """Indices of the members still running."""
+        return np.flatnonzero(self.Status == Running)
+
+
+    def energy(self):
+        """Total energy of every member, (M,)."""
+        Kinetic, Potential, Bound, Overlap = batched_energy(self.Position, self.Velocity, self.Mass, self.Radius, self.NewtonG,
+                                                            Law=self.force_law())
+        return Kinetic + Potential
+
+
+    def Time_Step(self, dt, iterations=None):
+        """
+        Advances every running member by dt, in iterations substeps of the Integrator, then (every CheckEvery
+        steps) stops the members that escaped or collided.
+        """
+        if self.InitialEnergy is None:
+            self.InitialEnergy = self.energy()
+        Rows = self.running()
+        if len(Rows) == 0:
+            return
+        Mass = self.Mass[Rows]
+        Law = self.force_law()
+        def Accel(Position):
+            self.ForceEvaluations += 1
+            return batched_accelerations(Position, Mass, self.NewtonG, Law=Law)
+        Integrator = get_integrator(self.Integrator)
+        Position, Velocity = self.Position[Rows], self.Velocity[Rows]
+        Gravity = (self.NewtonG, self.ForceLaw, self.ForceLawParams)
+        Acc = None
+        if self._AccCache is not None:
+            CachedRows, CachedPosition, CachedMass, CachedGravity, CachedAcc = self._AccCache
+            if (np.array_equal(CachedRows, Rows) and np.array_equal(CachedPosition, Position) and np.array_equal(CachedMass, Mass)
+                    and CachedGravity == Gravity):
+                Acc = CachedAcc
+        iterations = self.Iterations if iterations is None else iterations
+        for Step in range(iterations):
+            Position, Velocity, Acc = Integrator.step(Position, Velocity, dt/iterations, Accel, Acc)
+        self.Position[Rows], self.Velocity[Rows] = Position, Velocity
+        self._AccCache = None if Acc is None else (Rows, Position, Mass, Gravity, Acc)
+        self.Time += dt
+        self.StepCount += 1
+        if self.StepCount % self.CheckEvery == 0:
+            self.check(Rows)
+
+
+    def check(self, Rows=None):
+        """
+        Stops the members (of Rows, by default all running ones) in which two planets overlap (if
+        StopOnCollision), or a planet has escaped: it is further than EscapeRadius from the member's centre
+        of mass, and has positive energy relative to the rest. Returns the indices of the members stopped.
+        """
+        Rows = self.running() if Rows is None else Rows
+        if len(Rows) == 0 or (self.EscapeRadius is None and not self.StopOnCollision):
+            return Rows[:0]
+        Position, Mass = self.Position[Rows], self.Mass[Rows]
+        Kinetic, Potential, Bound, Overlap = batched_energy(Position, self.Velocity[Rows], Mass, self.Radius[Rows], self.NewtonG,
+                                                            Law=self.force_law())
+        Status = np.full(len(Rows), Running, dtype=np.int8)
+        if self.EscapeRadius is not None:
+            TotalMass = Mass.sum(axis=1)
+            Centre = (Mass[:,:,None]*Position).sum(axis=1)/np.where(TotalMass != 0, TotalMass, 1.0)[:,None]
+            Offset = Position - Centre[:,None,:]
+            Escaping = ((Offset*Offset).sum(axis=2) > self.EscapeRadius**2) & (Bound > 0)
+            Any = Escaping.any(axis=1)
+            Status[Any] = Escaped
+            self.Escapers[Rows[Any]] = self.Numbers[Escaping[Any].argmax(axis=1)]
+        if self.StopOnCollision:
+            Status[Overlap] = Collided
+        Stopped = Status != Running
+        if Stopped.any():
+            Members = Rows[Stopped]
+            self.Status[Members] = Status[Stopped]
+            self.StopTime[Members] = self.Time
+            self.StopStep[Members] = self.StepCount
+        return Rows[Stopped]
+
+
+    def run(self, Steps, dt, iterations=None, Callback=None):
+        """
+        Calls Time_Step(dt, iterations) up to Steps times, stopping early once no member is running, or when
+        Callback(self) (called after every step) returns True. Returns the number of steps taken. The members
+        are checked at the end, even between every CheckEvery steps.
+        """
+        Taken = Steps
+        for Step in range(Steps):
+            if not (self.Status == Running).any():
+                Taken = Step
+                break
+            self.Time_Step(dt, iterations)
+            if Callback is not None and Callback(self):
+                Taken = Step + 1
+                break
+        if self.StepCount % self.CheckEvery != 0:
+            self.check()
+        return Taken
+
+
+    ########################    Diagnostics
+
+
+    def diagnostics(self):
+        """
+        Per-member results, as a dict of arrays of length M: Status (see StatusNames), StopTime and StopStep
+        (NaN and -1 while running), Escaper (Number of the planet that escaped, or -1), Energy, EnergyError
+        (relative change since the start) and MaxDistance (of any planet from its member's centre of mass).
+        """
+        Energy = self.energy()
+        InitialEnergy = Energy if self.InitialEnergy is None else self.InitialEnergy
+        TotalMass = self.Mass.sum(axis=1)
+        Centre = (self.Mass[:,:,None]*self.Position).sum(axis=1)/np.where(TotalMass != 0, TotalMass, 1.0)[:,None]
+        Offset = self.Position - Centre[:,None,:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            EnergyError = np.abs((Energy - InitialEnergy)/InitialEnergy)
+        return {"Status": self.Status.copy(), "StopTime": self.StopTime.copy(), "StopStep": self.StopStep.copy(),
+                "Escaper": self.Escapers.copy(), "Energy": Energy, "EnergyError": EnergyError,
+                "MaxDistance": np.sqrt((Offset*Offset).sum(axis=2).max(axis=1))}
+
+
+    def summary(self):
+        """Number of members in each status, e.g. {"running": 180, "escaped": 15, "collided": 5}."""
+        Counts = np.bincount(self.Status, minlength=len(StatusNames))
+        return {Name: int(Count) for Name, Count in zip(StatusNames, Counts)}
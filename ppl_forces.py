@@ -0,0 +1,165 @@
+"""
+Force laws for PyPlanets: what the force between two planets is, as a function of their distance.
+
+Every law is written as a vectorized factor g(r) of the squared separations, so that the force on body i
+from body j is
+    F_ij = G * m_i * m_j * g(r) * (x_j - x_i)
+(plain gravity is g = 1/r**3), and the kernels (pairwise_gravity, barnes_hut_gravity, ParallelGravity)
+apply it to whole blocks of separations at once. potential() is the matching pair potential phi, with
+U_ij = -G * m_i * m_j * phi(r). Every law can be softened: r is replaced by sqrt(r**2 + Softening**2), so
+forces stay finite as r -> 0.
+
+Pick a law by name with get_force_law, or through Simulation.ForceLaw and Simulation.ForceLawParams:
+    "newton"         1/r**2 attraction (with Softening 0, the kernels' own exact path is used instead)
+    "plummer"        Plummer-softened gravity: "newton" with Softening 0.1 by default
+    "yukawa"         screened gravity, exp(-r/Length)/r potential: short-ranged beyond Length
+    "power"          1/r**Power attraction
+    "electrostatic"  1/r**2 repulsion between like charges, taken to be the masses times Strength
+Only uses NumPy.
+"""
+
+import numpy as np
+
+
+class ForceLaw():
+    """
+    Base class. Subclasses set Name, and implement factor() and potential() on arrays of squared
+    distances R2 (which may hold inf, for a body and itself: both must give 0 there).
+    """
+    Name = ""
+    Softening = 0.0
+
+    def __init__(self, Softening=None):
+        if Softening is not None:
+            self.Softening = Softening
+
+    def params(self):
+        """The parameters of the law, as keywords for get_force_law."""
+        return {"Softening": self.Softening}
+
+    def softened(self, R2):
+        """R2 + Softening**2, as a new array."""
+        return R2 + self.Softening*self.Softening
+
+    def factor(self, R2):
+        """g(r) for every squared distance in R2."""
+        raise NotImplementedError
+
+    def potential(self, R2):
+        """phi(r) for every squared distance in R2."""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}(" + ", ".join(f"{Name}={Value}" for Name, Value in self.params().items()) + ")"
+
+
+class NewtonLaw(ForceLaw):
+    """Newtonian gravity, g = 1/s**3 with s = sqrt(r**2 + Softening**2)."""
+    Name = "newton"
+
+    def factor(self, R2):
+        S2 = self.softened(R2)
+        W = np.sqrt(S2)
+        W *= S2
+        return np.reciprocal(W, out=W)
+
+    def potential(self, R2):
+        return 1/np.sqrt(self.softened(R2))
+
+
+class PlummerLaw(NewtonLaw):
+    """Plummer-softened gravity: the force of a Plummer sphere of scale Softening, never infinite."""
+    Name = "plummer"
+    Softening = 0.1
+
+
+class YukawaLaw(ForceLaw):
+    """
+    Screened (Yukawa) gravity, phi = exp(-s/Length)/s: Newtonian well inside Length, and dying off
+    exponentially beyond it.
+    """
+    Name = "yukawa"
+    Length = 10.0
+
+    def __init__(self, Length=None, Softening=None):
+        super().__init__(Softening)
+        if Length is not None:
+            self.Length = Length
+
+    def params(self):
+        return {"Length": self.Length, "Softening": self.Softening}
+
+    def factor(self, R2):
+        S = np.sqrt(self.softened(R2))
+        with np.errstate(invalid="ignore"):
+            W = np.exp(-S/self.Length)*(1/S + 1/self.Length)/(S*S)
+        return np.nan_to_num(W, copy=False, nan=0.0)
+
+    def potential(self, R2):
+        S = np.sqrt(self.softened(R2))
+        return np.exp(-S/self.Length)/S
+
+
+class InversePowerLaw(ForceLaw):
+    """An attraction falling off as 1/s**Power (Power 2 is gravity), g = 1/s**(Power+1)."""
+    Name = "power"
+    Power = 2.0
+
+    def __init__(self, Power=None, Softening=None):
+        super().__init__(Softening)
+        if Power is not None:
+            self.Power = Power
+
+    def params(self):
+        return {"Power": self.Power, "Softening": self.Softening}
+
+    def factor(self, R2):
+        return self.softened(R2)**(-(self.Power + 1)/2)
+
+    def potential(self, R2):
+        S2 = self.softened(R2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.Power == 1:
+                Phi = -0.5*np.log(S2)
+            else:
+                Phi = S2**(-(self.Power - 1)/2)/(self.Power - 1)
+        #   -for Power <= 1, phi does not vanish at infinite distance: a body and itself (inf) is masked out explicitly
+        return np.where(np.isinf(S2), 0.0, Phi)
+
+
+class ElectrostaticLaw(ForceLaw):
+    """
+    Coulomb repulsion between like charges, g = -Strength/s**3. The charges are the masses (there is no
+    separate charge per planet), so Strength is the charge-to-mass ratio squared, in units of G.
+    """
+    Name = "electrostatic"
+    Strength = 1.0
+
+    def __init__(self, Strength=None, Softening=None):
+        super().__init__(Softening)
+        if Strength is not None:
+            self.Strength = Strength
+
+    def params(self):
+        return {"Strength": self.Strength, "Softening": self.Softening}
+
+    def factor(self, R2):
+        S2 = self.softened(R2)
+        W = np.sqrt(S2)
+        W *= S2
+        return np.divide(-self.Strength, W, out=W)
+
+    def potential(self, R2):
+        return -self.Strength/np.sqrt(self.softened(R2))
+
+
+ForceLaws = {Class.Name: Class for Class in (NewtonLaw, PlummerLaw, YukawaLaw, InversePowerLaw, ElectrostaticLaw)}
+#   -name: class, for every law Simulation.ForceLaw may name
+
+
+def get_force_law(Name, **Params):
+    try:
+        Class = ForceLaws[Name]
+    except KeyError:
+        raise ValueError(f"Unknown force law: {Name}. Choose from {list(ForceLaws)}") from None
+    return Class(**Params)
@@ -0,0 +1,224 @@
+"""
+Procedural initial conditions: whole clusters, disks and rings of planets, generated from a seed.
+
+Every generator works out all N bodies at once with vectorized NumPy, and returns them as a dict of
+arrays with the argument names of PlanetState.add_bulk (Position, Velocity, Mass, Radius, Color), so a
+whole configuration goes into a simulation with one bulk insert:
+
+    Bodies = exponential_disk(100000, Mass=5000, ScaleLength=20, CentralMass=2000, Seed=1)
+    Sim.State.add_bulk(**Bodies)
+    add_generated(Sim, "plummer", 2000, Center=(300,0), Drift=(-2,0))    # the same, with Sim's NewtonG
+
+    "plummer"   plummer_sphere     - a Plummer model's radii and speeds, laid out in the plane (see its docstring)
+    "disk"      exponential_disk   - exponential surface density, on circular orbits
+    "ring"      keplerian_ring     - a thin ring of light bodies on circular orbits around a central mass
+    "binaries"  random_binaries    - circular binary pairs scattered over a disk
+
+Velocities are worked out for NewtonG and plain (unsoftened) Newtonian gravity. Every generator takes
+Center and Drift (added to all positions and velocities), so configurations can be put together with
+combine(), and Seed (an int or a numpy Generator): the same seed always gives the same bodies.
+Only uses NumPy.
+"""
+
+import numpy as np
+from ppl_physics import Simulation, pairwise_gravity
+
+
+CentralColor = (255,220,120)
+#   -colour of the central mass of a disk or ring
+
+
+def _bodies(Position, Velocity, Mass, Radius, Color, Center, Drift):
+    """Packs the generated arrays into the dict add_bulk takes, moved to Center and Drift."""
+    N = len(Position)
+    return {"Position": Position + np.asarray(Center, dtype=float), "Velocity": Velocity + np.asarray(Drift, dtype=float),
+            "Mass": np.broadcast_to(np.asarray(Mass, dtype=float), (N,)).copy(),
+            "Radius": np.broadcast_to(np.asarray(Radius, dtype=float), (N,)).copy(),
+            "Color": np.broadcast_to(np.asarray(Color, dtype=np.uint8), (N,3)).copy()}
+
+
+def _on_circle(Distance, Rng):
+    """Points at the given distances from the origin, in uniformly random directions; and those unit vectors."""
+    Angle = Rng.uniform(0, 2*np.pi, len(Distance))
+    Direction = np.empty((len(Distance),2))
+    np.cos(Angle, out=Direction[:,0])
+    np.sin(Angle, out=Direction[:,1])
+    return Distance[:,None]*Direction, Direction
+
+
+def _tangential(Direction, Speed, Clockwise=False):
+    """Velocities of the given speeds at right angles to Direction: anticlockwise orbits, or clockwise ones."""
+    Velocity = np.empty_like(Direction)
+    np.multiply(Direction[:,1], -Speed if not Clockwise else Speed, out=Velocity[:,0])
+    np.multiply(Direction[:,0], Speed if not Clockwise else -Speed, out=Velocity[:,1])
+    return Velocity
+
+
+def _with_central(Central, Bodies):
+    """Puts a central body (a dict of single values) in front of the generated bodies."""
+    return {Name: np.concatenate([np.asarray(Central[Name], dtype=Bodies[Name].dtype).reshape((1,) + Bodies[Name].shape[1:]), Bodies[Name]])
+            for Name in Bodies}
+
+
+def _potential_energy(Position, Mass, NewtonG, Sample, Rng):
+    """
+    Total potential energy of N bodies of the same Mass, -G sum over pairs of m*m/r: exactly for up to
+    Sample bodies, and for more, scaled up from a random Sample of them (the mean over their pairs).
+    """
+    N = len(Position)
+    if N > Sample:
+        Position = Position[Rng.choice(N, Sample, replace=False)]
+    Count = len(Position)
+    Potential = np.empty(Count)
+    pairwise_gravity(Position, np.full(Count, float(Mass)), NewtonG, Potential=Potential)
+    return 0.5*Potential.sum()*(N*(N - 1))/(Count*(Count - 1))
+
+
+def combine(*Parts):
+    """Joins several generated configurations into one, to insert them all with one add_bulk."""
+    return {Name: np.concatenate([Part[Name] for Part in Parts]) for Name in Parts[0]}
+
+
+########################    Generators
+
+
+def plummer_sphere(N, Mass=1000.0, Scale=10.0, Radius=0.1, Color=(170,120,40), Center=(0,0), Drift=(0,0),
+                   NewtonG=Simulation.NewtonG, Truncate=0.99, Virial=True, VirialSample=2000, Seed=0):
+    """
+    N bodies of total Mass with the radii of a Plummer sphere of scale length Scale, and speeds drawn from
+    its distribution function (Aarseth, Henon & Wielen 1974), in random directions in the plane. Radii are
+    drawn from the inner Truncate of the mass, to leave out the few bodies very far out. The centre of
+    mass is at Center, moving at Drift.
+
+    A Plummer sphere laid flat is not in equilibrium: the same bodies are closer together in the plane
+    than in space, so with the speeds as drawn (Virial=False) it is too cold (2T/|W| about 0.8) and
+    contracts. Virial rescales all speeds by one factor so that 2T = |W| for the planar cluster, with W
+    worked out from VirialSample bodies. That only balances it overall: the speeds still follow the
+    spherical model, so it settles, rather than staying as it starts.
+    """
+    Rng = np.random.default_rng(Seed)
+    Fraction = Rng.uniform(0, Truncate, N)
+    Distance = Scale/np.sqrt(Fraction**(-2/3) - 1)
+    Position = _on_circle(Distance, Rng)[0]
+    Q = np.zeros(0)
+    while len(Q) < N:
+        #   -rejection sampling of q = v/v_escape from g(q) = q**2 (1 - q**2)**3.5, whose maximum is below 0.1:
+        #   about 43% of the tries are accepted, so one batch of tries is nearly always enough
+        Trial = Rng.random(int(2.5*(N - len(Q))) + 16)
+        Rest = 1 - Trial*Trial
+        Q = np.concatenate([Q, Trial[0.1*Rng.random(len(Trial)) < (1 - Rest)*Rest*Rest*Rest*np.sqrt(Rest)]])
+    Q = Q[:N]
+    Escape = np.sqrt(2*NewtonG*Mass)*(Distance*Distance + Scale*Scale)**-0.25
+    Velocity = _on_circle(Q*Escape, Rng)[0]
+    Position -= Position.mean(axis=0)
+    Velocity -= Velocity.mean(axis=0)
+    #   -all bodies weigh the same, so this puts the centre of mass at rest at the origin
+    if Virial and N > 1:
+        Kinetic = 0.5*(Mass/N)*(Velocity*Velocity).sum()
+        Potential = _potential_energy(Position, Mass/N, NewtonG, VirialSample, Rng)
+        if Kinetic > 0:
+            Velocity *= np.sqrt(-Potential/(2*Kinetic))
+    return _bodies(Position, Velocity, Mass/N, Radius, Color, Center, Drift)
+
+
+def exponential_disk(N, Mass=1000.0, ScaleLength=10.0, CentralMass=0.0, CentralRadius=1.0, Dispersion=0.0, Clockwise=False,
+                     Radius=0.1, Color=(120,170,230), Center=(0,0), Drift=(0,0), NewtonG=Simulation.NewtonG, Seed=0):
+    """
+    N bodies of total Mass with surface density falling off as exp(-r/ScaleLength), on circular orbits
+    around the mass inside them (the disk's, taken as if it were spherical, plus CentralMass). With a
+    CentralMass, it is added as one more body, first, at Center. Dispersion adds random velocities of that
+    fraction of the circular speed.
+    """
+    Rng = np.random.default_rng(Seed)
+    Distance = -ScaleLength*np.log((1 - Rng.random(N))*(1 - Rng.random(N)))
+    #   -r exp(-r/ScaleLength) is the distribution of distances of an exponential disk: a sum of two
+    #   exponential variables (much faster than Rng.gamma)
+    Position, Direction = _on_circle(Distance, Rng)
+    X = Distance/ScaleLength
+    Inside = CentralMass + Mass*(1 - (1 + X)*np.exp(-X))
+    Speed = np.sqrt(NewtonG*Inside/Distance)
+    Velocity = _tangential(Direction, Speed, Clockwise)
+    if Dispersion:
+        Velocity += Dispersion*Speed[:,None]*Rng.standard_normal((N,2))
+    Bodies = _bodies(Position, Velocity, Mass/N, Radius, Color, Center, Drift)
+    if CentralMass:
+        Bodies = _with_central({"Position": Center, "Velocity": Drift, "Mass": CentralMass, "Radius": CentralRadius,
+                                "Color": CentralColor}, Bodies)
+    return Bodies
+
+
+def keplerian_ring(N, CentralMass=1000.0, RingRadius=20.0, Width=2.0, RingMass=1.0, CentralRadius=1.0, Eccentricity=0.0,
+                   Clockwise=False, Radius=0.1, Color=(200,200,200), Center=(0,0), Drift=(0,0), NewtonG=Simulation.NewtonG, Seed=0):
+    """
+    A central body of CentralMass at Center (first), and a ring of N bodies of total RingMass spread evenly
+    over distances RingRadius +- Width/2, each on a Keplerian orbit around the central mass: circular, or
+    with Eccentricity, starting from a random phase of an orbit of that semi-major axis.
+    """
+    Rng = np.random.default_rng(Seed)
+    SemiMajor = RingRadius + Width*(Rng.random(N) - 0.5)
+    if Eccentricity:
+        MeanAnomaly = Rng.uniform(0, 2*np.pi, N)
+        Eccentric = MeanAnomaly.copy()
+        for Iteration in range(8):
+            #   -Newton's method on Kepler's equation, E - e sin E = M
+            Eccentric -= (Eccentric - Eccentricity*np.sin(Eccentric) - MeanAnomaly)/(1 - Eccentricity*np.cos(Eccentric))
+        Orbit = np.c_[SemiMajor*(np.cos(Eccentric) - Eccentricity), SemiMajor*np.sqrt(1 - Eccentricity**2)*np.sin(Eccentric)]
+        Rate = np.sqrt(NewtonG*CentralMass/SemiMajor)/(1 - Eccentricity*np.cos(Eccentric))
+        OrbitVelocity = np.c_[-np.sin(Eccentric), np.sqrt(1 - Eccentricity**2)*np.cos(Eccentric)]*Rate[:,None]
+        Periapsis = Rng.uniform(0, 2*np.pi, N)
+        Cos, Sin = np.cos(Periapsis), np.sin(Periapsis)
+        Position = np.c_[Cos*Orbit[:,0] - Sin*Orbit[:,1], Sin*Orbit[:,0] + Cos*Orbit[:,1]]
+        Velocity = np.c_[Cos*OrbitVelocity[:,0] - Sin*OrbitVelocity[:,1], Sin*OrbitVelocity[:,0] + Cos*OrbitVelocity[:,1]]
+        if Clockwise:
+            Position[:,1], Velocity[:,1] = -Position[:,1], -Velocity[:,1]
+            #   -mirrored across the x axis
+    else:
+        Position, Direction = _on_circle(SemiMajor, Rng)
+        Velocity = _tangential(Direction, np.sqrt(NewtonG*CentralMass/SemiMajor), Clockwise)
+    Bodies = _bodies(Position, Velocity, RingMass/N, Radius, Color, Center, Drift)
+    return _with_central({"Position": Center, "Velocity": Drift, "Mass": CentralMass, "Radius": CentralRadius,
+                          "Color": CentralColor}, Bodies)
+
+
+def random_binaries(N, Mass=(1.0, 10.0), Separation=(0.5, 5.0), Spread=50.0, Dispersion=0.0, Radius=0.1, Color=(230,130,130),
+                    Center=(0,0), Drift=(0,0), NewtonG=Simulation.NewtonG, Seed=0):
+    """
+    N/2 binary pairs (N must be even), with centres of mass spread evenly over a disk of radius Spread. Each star's mass is
+    drawn uniformly from the range Mass, and each pair's separation log-uniformly from the range Separation;
+    every pair is on a circular orbit of random orientation and sense. Dispersion gives the pairs random
+    velocities of about that speed. The two stars of a pair are next to each other.
+    """
+    if N % 2:
+        raise ValueError(f"random_binaries makes pairs of stars: N must be even, not {N}")
+    Rng = np.random.default_rng(Seed)
+    Pairs = N//2
+    Masses = Rng.uniform(Mass[0], Mass[1], (Pairs,2))
+    Total = Masses.sum(axis=1)
+    Apart = np.exp(Rng.uniform(np.log(Separation[0]), np.log(Separation[1]), Pairs))
+    PairCenter = _on_circle(Spread*np.sqrt(Rng.random(Pairs)), Rng)[0]
+    Axis, AxisDirection = _on_circle(Apart, Rng)
+    Spin = np.where(Rng.random(Pairs) < 0.5, 1.0, -1.0)
+    Relative = _tangential(AxisDirection, Spin*np.sqrt(NewtonG*Total/Apart))
+    #   -velocity of the second star relative to the first
+    PairVelocity = Dispersion*Rng.standard_normal((Pairs,2))
+    Share = (Masses/Total[:,None])[:,:,None]
+    Position = np.stack([PairCenter - Share[:,1]*Axis, PairCenter + Share[:,0]*Axis], axis=1).reshape(-1,2)
+    Velocity = np.stack([PairVelocity - Share[:,1]*Relative, PairVelocity + Share[:,0]*Relative], axis=1).reshape(-1,2)
+    return _bodies(Position, Velocity, Masses.reshape(-1), Radius, Color, Center, Drift)
+
+
+Generators = {"plummer": plummer_sphere, "disk": exponential_disk, "ring": keplerian_ring, "binaries": random_binaries}
+#   -name: generator, for add_generated and the app
+
+
+def add_generated(Sim, Name, N, **Params):
+    """
+    Generates N bodies with generator Name (see Generators), using Sim's NewtonG unless Params say
+    otherwise, and adds them to Sim in one bulk insert. Returns their Numbers.
+    """
+    try:
+        Generator = Generators[Name]
+    except KeyError:
+        raise ValueError(f"Unknown generator: {Name}. Choose from {list(Generators)}") from None
+    Params.setdefault("NewtonG", Sim.NewtonG)
+    return Sim.State.add_bulk(**Generator(N, **Params))
@@ -0,0 +1,240 @@
+"""
+Time integrators for PyPlanets.
+
+Every integrator advances (Position, Velocity) by one step dt, given Accel(Position) which returns
+the N-by-2 accelerations. Integrators may take the acceleration at the starting position (Acc0) and
+return the acceleration at the final position, so that the next step can reuse it instead of paying
+for another force evaluation. Only uses NumPy.
+"""
+
+import numpy as np
+
+
+class Integrator():
+    """
+    Base class. Subclasses implement step(), and set:
+        Name - the name used for Simulation.Integrator
+        Order - order of accuracy
+        ForceEvaluations - force evaluations per step, when the starting acceleration is cached
+    """
+    Name = ""
+    Order = 1
+    ForceEvaluations = 1
+
+    def step(self, Position, Velocity, dt, Accel, Acc0=None):
+        """Returns (Position, Velocity, Acc1): the new state and the acceleration there (or None if unknown)."""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class KinematicIntegrator(Integrator):
+    """The original first-order scheme (see ppl_physics.Time_step_kinematic). Not time-reversible: orbits drift."""
+    Name = "kinematic"
+    Order = 1
+    ForceEvaluations = 1
+
+    def step(self, Position, Velocity, dt, Accel, Acc0=None):
+        Acc = Accel(Position) if Acc0 is None else Acc0
+        Position = Position + Velocity*dt + 0.5*Acc*dt*dt
+        Velocity = Velocity + Acc*dt
+        return Position, Velocity, None
+
+
+class LeapfrogIntegrator(Integrator):
+    """
+    Velocity-Verlet (kick-drift-kick leapfrog). Second order and symplectic, so energy errors stay
+    bounded instead of growing. Costs one force evaluation per step, since the closing kick's
+    acceleration is the next step's opening kick.
+    """
+    Name = "leapfrog"
+    Order = 2
+    ForceEvaluations = 1
+
+    def step(self, Position, Velocity, dt, Accel, Acc0=None):
+        Acc = Accel(Position) if Acc0 is None else Acc0
+        Velocity = Velocity + 0.5*dt*Acc
+        Position = Position + dt*Velocity
+        Acc = Accel(Position)
+        Velocity = Velocity + 0.5*dt*Acc
+        return Position, Velocity, Acc
+
+
+class YoshidaIntegrator(Integrator):
+    """
+    Yoshida's 4th-order symplectic integrator: three leapfrog steps of dt*W1, dt*W0, dt*W1.
+    Three force evaluations per step.
+    """
+    Name = "yoshida4"
+    Order = 4
+    ForceEvaluations = 3
+    W1 = 1/(2 - 2**(1/3))
+    W0 = -2**(1/3)*W1
+    Leapfrog = LeapfrogIntegrator()
+
+    def step(self, Position, Velocity, dt, Accel, Acc0=None):
+        Acc = Acc0
+        for Weight in (self.W1, self.W0, self.W1):
+            Position, Velocity, Acc = self.Leapfrog.step(Position, Velocity, Weight*dt, Accel, Acc)
+        return Position, Velocity, Acc
+
+
+class RK4Integrator(Integrator):
+    """Classic 4th-order Runge-Kutta. Accurate per step but not symplectic; four force evaluations per step."""
+    Name = "rk4"
+    Order = 4
+    ForceEvaluations = 4
+
+    def step(self, Position, Velocity, dt, Accel, Acc0=None):
+        A1 = Accel(Position) if Acc0 is None else Acc0
+        V1 = Velocity
+        A2 = Accel(Position + 0.5*dt*V1)
+        V2 = Velocity + 0.5*dt*A1
+        A3 = Accel(Position + 0.5*dt*V2)
+        V3 = Velocity + 0.5*dt*A2
+        A4 = Accel(Position + dt*V3)
+        V4 = Velocity + dt*A3
+        Position = Position + dt/6*(V1 + 2*V2 + 2*V3 + V4)
+        Velocity = Velocity + dt/6*(A1 + 2*A2 + 2*A3 + A4)
+        return Position, Velocity, None
+
+
+Integrators = {Class.Name: Class for Class in (KinematicIntegrator, LeapfrogIntegrator, YoshidaIntegrator, RK4Integrator)}
+#   -name: class, for every integrator Simulation.Integrator may name
+
+
+def get_integrator(Name):
+    try:
+        return Integrators[Name]()
+    except KeyError:
+        raise ValueError(f"Unknown integrator: {Name}. Choose from {list(Integrators)}") from None
+
+
+#################################################
+#################################################
+#################################################
+
+
+def encounter_timescales(Velocity, Acc, Mass, Radius):
+    """
+    Dynamical timescale of every body, from its motion relative to the centre of mass:
+        tau_i = (|v_i| + sqrt(R_i*|a_i|)) / |a_i|
+    which is |v|/|a| (about an orbital period / 2pi) for a moving body, and sqrt(R/|a|)
+    (the time to fall one radius) for a body at rest. inf for bodies that are not accelerating.
+    """
+    TotalMass = Mass.sum()
+    if TotalMass != 0:
+        Velocity = Velocity - (Mass[:,None]*Velocity).sum(axis=0)/TotalMass
+    Speed = np.sqrt((Velocity*Velocity).sum(axis=1))
+    AccSize = np.sqrt((Acc*Acc).sum(axis=1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        Tau = (Speed + np.sqrt(Radius*AccSize))/AccSize
+    return np.where(np.isnan(Tau), np.inf, Tau)
+
+
+def encounter_timescale(Velocity, Acc, Mass, Radius):
+    """Shortest encounter_timescales() among the bodies; inf if nothing is accelerating."""
+    Tau = encounter_timescales(Velocity, Acc, Mass, Radius)
+    return Tau.min() if len(Tau) else np.inf
+
+
+class AdaptiveStepper():
+    """
+    Advances a whole interval with a variable number of substeps, each one Eta times the current
+    encounter_timescale. Quiet scenes then take one substep per frame, and close encounters take as
+    many as they need (up to MaxSubsteps).
+    """
+
+    def __init__(self, Integrator, Eta=0.02, MaxSubsteps=1000):
+        self.Integrator = Integrator
+        self.Eta = Eta
+        self.MaxSubsteps = MaxSubsteps
+        self.LastSubsteps = 0
+        #   -number of substeps taken by the last advance() call
+
+    def advance(self, Position, Velocity, Interval, Accel, Mass, Radius, Acc0=None):
+        """Returns (Position, Velocity, Acc1) after Interval of time; Acc1 is the acceleration at the end, or None."""
+        Remaining = Interval
+        Substeps = 0
+        Acc = Acc0
+        while Remaining > 0:
+            if Acc is None:
+                Acc = Accel(Position)
+            StepsLeft = self.MaxSubsteps - Substeps
+            h = max(self.Eta*encounter_timescale(Velocity, Acc, Mass, Radius), Remaining/StepsLeft)
+            if h >= Remaining*(1 - 1e-9):
+                h = Remaining
+                #   -don't leave a sliver of the interval for another substep
+            Position, Velocity, Acc = self.Integrator.step(Position, Velocity, h, Accel, Acc)
+            Remaining -= h
+            Substeps += 1
+        self.LastSubsteps = Substeps
+        return Position, Velocity, Acc
+
+
+class BlockStepper():
+    """
+    Individual power-of-two timesteps ("block timesteps"): advances a whole interval with kick-drift-kick
+    leapfrog, where each body takes steps of Interval/2**Level, its Level picked from its own
+    encounter_timescales() (step about Eta times it, and at most MaxLevel). Every body drifts at every
+    tick where some step ends, which is cheap, but only the bodies whose step ends there get new forces, from
+    AccelRows(Position, Rows). So a tight pair takes many small steps while the rest of the scene takes
+    one. A body's Level is re-picked at the end of each of its steps: it can always move to smaller steps,
+    and to larger ones once the tick is a multiple of the larger step, so all bodies stay in sync and
+    meet at the end of the interval.
+    """
+
+    def __init__(self, Eta=0.02, MaxLevel=9):
+        self.Eta = Eta
+        self.MaxLevel = MaxLevel
+        self.LastSubsteps = 0
+        #   -number of ticks at which some bodies were kicked, in the last advance() call
+        self.LastForceRows = 0
+        #   -number of single-body force evaluations in the last advance() call
+        self.Levels = None
+        #   -Level of every body at the end of the last advance() call
+
+    def levels(self, Velocity, Acc, Mass, Radius, Interval):
+        """The Level each body would like: the smallest with Interval/2**Level <= Eta*tau."""
+        Tau = encounter_timescales(Velocity, Acc, Mass, Radius)
+        with np.errstate(divide="ignore"):
+            Wanted = np.ceil(np.log2(Interval/(self.Eta*Tau)))
+        return np.clip(np.nan_to_num(Wanted, nan=0, neginf=0), 0, self.MaxLevel).astype(np.int64)
+
+    def advance(self, Position, Velocity, Interval, AccelRows, Mass, Radius, Acc0=None):
+        """Returns (Position, Velocity, Acc1) after Interval of time; Acc1 is the acceleration at the end."""
+        N = len(Position)
+        Position, Velocity = Position.copy(), Velocity.copy()
+        Everyone = np.arange(N)
+        Acc = AccelRows(Position, Everyone) if Acc0 is None else Acc0.copy()
+        ForceRows = 0 if Acc0 is not None else N
+        Ticks = 1 << self.MaxLevel
+        Tick = Interval/Ticks
+        Span = Ticks >> self.levels(Velocity, Acc, Mass, Radius, Interval)
+        #   -ticks per step, for every body
+        Velocity += (0.5*Tick*Span)[:,None]*Acc
+        End = Span.copy()
+        #   -tick at which each body's current step ends
+        Now, Substeps = 0, 0
+        while Now < Ticks:
+            Next = int(End.min())
+            Position += ((Next - Now)*Tick)*Velocity
+            Now = Next
+            Active = np.flatnonzero(End == Now)
+            Acc[Active] = AccelRows(Position, Active)
+            ForceRows += len(Active)
+            Substeps += 1
+            Velocity[Active] += (0.5*Tick*Span[Active])[:,None]*Acc[Active]
+            if Now == Ticks:
+                break
+            Coarsest = self.MaxLevel - ((Now & -Now).bit_length() - 1)
+            #   -the largest step that can start at this tick, as a Level
+            Wanted = self.levels(Velocity, Acc, Mass, Radius, Interval)[Active]
+            Span[Active] = Ticks >> np.maximum(Wanted, Coarsest)
+            End[Active] = Now + Span[Active]
+            Velocity[Active] += (0.5*Tick*Span[Active])[:,None]*Acc[Active]
+        self.LastSubsteps = Substeps
+        self.LastForceRows = ForceRows
+        self.Levels = np.round(np.log2(Ticks/Span)).astype(np.int64)
+        return Position, Velocity, Acc
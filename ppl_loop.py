@@ -0,0 +1,416 @@
+"""
+Fixed-timestep physics loop for PyPlanets.
+
+The physics always advances in steps of exactly StepDt of simulated time, however long the frames take:
+real time is collected in an accumulator, and as many whole steps are taken as it holds. After every step
+a snapshot of the positions is published to a double buffer (previous + current), and the renderer draws
+the positions interpolated between the two, so motion stays smooth when the display rate and the
+physics rate differ.
+
+PhysicsRunner runs the steps in one of three places:
+    "inline"  - in the render loop itself, from update()
+    "thread"  - in a background thread, which keeps stepping while the render loop draws
+    "process" - in a child process with its own copy of the Simulation; edits are sent to it, and
+                snapshots come back through a pipe
+Only uses NumPy and the standard library.
+"""
+
+import time
+import threading
+import multiprocessing
+import numpy as np
+from ppl_physics import Simulation
+
+
+class Snapshot():
+    """Positions of every planet at one moment, as published by the physics. Never modified after creation."""
+
+    def __init__(self, Numbers, Position, Velocity, SimTime, WallTime):
+        self.Numbers = Numbers
+        self.Position = Position
+        self.Velocity = Velocity
+        self.SimTime = SimTime
+        self.WallTime = WallTime
+        #   -time.perf_counter() when the snapshot was published
+
+
+class SnapshotBuffer():
+    """
+    Double buffer of the two latest Snapshots. The physics side publishes; the render side reads
+    both under a small lock, so it never sees a half-written pair.
+    """
+
+    def __init__(self):
+        self.Lock = threading.Lock()
+        self.Previous = None
+        self.Current = None
+        self.Count = 0
+        #   -number of snapshots published so far
+
+    def publish(self, Numbers, Position, Velocity, SimTime, WallTime=None):
+        New = Snapshot(Numbers, Position, Velocity, SimTime, time.perf_counter() if WallTime is None else WallTime)
+        with self.Lock:
+            self.Previous, self.Current = self.Current, New
+            self.Count += 1
+
+    def publish_state(self, Sim):
+        """Publishes copies of Sim's current positions."""
+        State = Sim.State
+        self.publish(State.Numbers.copy(), State.Position.copy(), State.Velocity.copy(), Sim.Time)
+
+    def clear(self):
+        with self.Lock:
+            self.Previous, self.Current = None, None
+
+    def read(self):
+        with self.Lock:
+            return self.Previous, self.Current
+
+    def interpolate(self, Alpha):
+        """
+        Returns (Numbers, Position) at Alpha of the way from the previous to the current snapshot
+        (Alpha is clipped to 0..1). Falls back to the current snapshot if the planets changed in between,
+        and returns (None, None) if nothing has been published.
+        """
+        Previous, Current = self.read()
+        if Current is None:
+            return None, None
+        if Previous is None or not np.array_equal(Previous.Numbers, Current.Numbers):
+            return Current.Numbers, Current.Position
+        Alpha = min(max(Alpha, 0.0), 1.0)
+        return Current.Numbers, Previous.Position + Alpha*(Current.Position - Previous.Position)
+
+
+#################################################
+#################################################
+#################################################
+
+
+class FixedStepClock():
+    """
+    Accumulator for a fixed timestep: advance(Elapsed) adds real time and returns how many steps of
+    StepDt to take. At most MaxStepsPerUpdate are returned; time beyond that is dropped, so a slow
+    machine runs the simulation slower instead of falling further and further behind.
+    """
+
+    def __init__(self, StepDt=1/60, MaxStepsPerUpdate=8):
+        self.StepDt = StepDt
+        self.MaxStepsPerUpdate = MaxStepsPerUpdate
+        self.Accumulator = 0.0
+        self.DroppedTime = 0.0
+        #   -real time thrown away because the physics could not keep up
+
+    def advance(self, Elapsed):
+        self.Accumulator += Elapsed
+        Steps = int(self.Accumulator // self.StepDt)
+        if Steps > self.MaxStepsPerUpdate:
+            self.DroppedTime += (Steps - self.MaxStepsPerUpdate)*self.StepDt
+            Steps = self.MaxStepsPerUpdate
+            self.Accumulator = self.Accumulator % self.StepDt
+        else:
+            self.Accumulator -= Steps*self.StepDt
+        return Steps
+
+    def reset(self):
+        self.Accumulator = 0.0
+
+    @property
+    def Alpha(self):
+        """How far the accumulator is into the next step, 0..1: the interpolation fraction for drawing."""
+        return self.Accumulator/self.StepDt
+
+
+#################################################
+#################################################
+#################################################
+
+
+def _physics_process(Conn, Settings, StateDict, StepDt, MaxStepsPerUpdate):
+    """Body of the "process" mode child: owns a Simulation, steps it in real time, and sends snapshots back."""
+    Sim = Simulation(**Settings)
+    Sim.set_state(StateDict)
+    Clock = FixedStepClock(StepDt, MaxStepsPerUpdate)
+    Running = False
+    Last = time.perf_counter()
+    KnownMerges = len(Sim.Merged)
+    while True:
+        Timeout = max(0.0, StepDt - Clock.Accumulator) if Running else None
+        if Conn.poll(Timeout):
+            Command, Argument = Conn.recv()
+            if Command == "stop":
+                break
+            elif Command == "run":
+                Running = Argument
+                Clock.reset()
+                Last = time.perf_counter()
+            elif Command == "state":
+                Sim.set_state(Argument)
+            elif Command == "settings":
+                for Name, Value in Argument.items():
+                    setattr(Sim, Name, Value)
+            continue
+        Now = time.perf_counter()
+        for Step in range(Clock.advance(Now - Last)):
+            Sim.Time_Step(StepDt)
+            State = Sim.State
+            Merges = None
+            if len(Sim.Merged) != KnownMerges:
+                Merges = (dict(list(Sim.Merged.items())[KnownMerges:]), State.Mass.copy(), State.Radius.copy())
+                #   -planets merged: the parent needs to know which, and the survivors' new masses and radii
+                KnownMerges = len(Sim.Merged)
+            Conn.send((State.Numbers.copy(), State.Position.copy(), State.Velocity.copy(), Sim.Time, Merges, Sim.ForceEvaluations))
+        Last = Now
+    Sim.close()
+    Conn.close()
+
+
+class PhysicsRunner():
+    """
+    Drives a Simulation at a fixed timestep of StepDt, in Mode "inline", "thread" or "process" (see the
+    module docstring), and publishes snapshots to self.Snapshots for the renderer.
+
+    The render loop calls, every frame:
+        Runner.set_running(TimeFlowing)
+        Runner.update(FrameTime)        - inline: takes the steps; process: collects snapshots
+        Positions = Runner.positions()  - interpolated positions aligned with Sim.State rows, or None
+    and makes every edit of the planets inside "with Runner.editing():".
+    If Recorder (a ppl_trajectory.TrajectoryRecorder) is set, every step taken is recorded to it.
+    """
+
+    Modes = ("inline", "thread", "process")
+
+    def __init__(self, Sim, Mode="inline", StepDt=1/60, MaxStepsPerUpdate=8):
+        if Mode not in self.Modes:
+            raise ValueError(f"Unknown physics mode: {Mode}. Choose from {self.Modes}")
+        self.Sim = Sim
+        self.Mode = Mode
+        self.StepDt = StepDt
+        self.Clock = FixedStepClock(StepDt, MaxStepsPerUpdate)
+        self.Snapshots = SnapshotBuffer()
+        self.Running = False
+        self.StepsTaken = 0
+        self.Recorder = None
+        self.Monitor = None
+        #   -process mode: the ppl_diagnostics.ConservationMonitor sampled from the snapshots (see set_monitor)
+        self.ChildForceEvaluations = 0
+        #   -process mode: the child Simulation's ForceEvaluations, as of the last snapshot
+        self._Thread = None
+        self._StopEvent = threading.Event()
+        self._RunEvent = threading.Event()
+        self._ResetEvent = threading.Event()
+        #   -thread mode: asks the physics thread to reset its Clock (only that thread touches it)
+        self._Process = None
+        self._Conn = None
+        self._Synced = None
+        #   -process mode: the state last exchanged with the child, to spot edits made here
+        if Mode == "thread":
+            self._Thread = threading.Thread(target=self._thread_loop, name="PyPlanets physics", daemon=True)
+            self._Thread.start()
+        elif Mode == "process":
+            self._Conn, ChildConn = multiprocessing.Pipe()
+            self._Process = multiprocessing.Process(target=_physics_process, name="PyPlanets physics", daemon=True,
+                                                    args=(ChildConn, Sim.settings(), Sim.get_state(), StepDt, MaxStepsPerUpdate))
+            self._Process.start()
+            ChildConn.close()
+            self._Synced = Sim.get_state()
+
+
+    ########################    Control
+
+
+    def set_running(self, Running):
+        """Starts or pauses the physics (time flowing or not)."""
+        if Running == self.Running:
+            return
+        self.Running = Running
+        self.Snapshots.clear()
+        if self.Mode == "inline":
+            self.Clock.reset()
+        elif self.Mode == "thread":
+            self._ResetEvent.set()
+            if Running:
+                self._RunEvent.set()
+            else:
+                self._RunEvent.clear()
+        elif self.Mode == "process":
+            self.sync()
+            self._Conn.send(("run", Running))
+
+
+    def editing(self):
+        """Context manager to hold while editing the planets: keeps the physics thread from stepping meanwhile."""
+        return self.Sim.Lock
+
+
+    def set_monitor(self, Monitor):
+        """
+        Samples conservation diagnostics into Monitor (a ppl_diagnostics.ConservationMonitor), or stops for None.
+        Inline and thread mode hand it to the Simulation; process mode samples the snapshots as they arrive,
+        at one extra force evaluation here per sample.
+        """
+        if self.Mode == "process":
+            self.Monitor = Monitor
+        else:
+            with self.Sim.Lock:
+                self.Sim.Monitor = Monitor
+
+
+    def force_evaluations(self):
+        """Force evaluations done so far by the physics, wherever it runs (in process mode, the child's as well)."""
+        return self.Sim.ForceEvaluations + self.ChildForceEvaluations
+
+
+    def send_settings(self):
+        """Process mode: passes changed Simulation settings on to the child (edits to the planets go by themselves)."""
+        if self.Mode == "process":
+            self._Conn.send(("settings", self.Sim.settings()))
+
+
+    def close(self):
+        """Stops the background thread or process."""
+        self._StopEvent.set()
+        self._RunEvent.set()
+        if self._Thread is not None:
+            self._Thread.join()
+            self._Thread = None
+        if self._Process is not None:
+            try:
+                self._Conn.send(("stop", None))
+            except (BrokenPipeError, OSError):
+                pass
+            self._Process.join(timeout=2)
+            if self._Process.is_alive():
+                self._Process.terminate()
+            self._Conn.close()
+            self._Process = None
+
+
+    ########################    Stepping
+
+
+    def update(self, FrameTime):
+        """Called once per rendered frame with the real time the frame took."""
+        if self.Mode == "inline":
+            if self.Running:
+                for Step in range(self.Clock.advance(FrameTime)):
+                    self.Sim.Time_Step(self.StepDt)
+                    self.Snapshots.publish_state(self.Sim)
+                    if self.Recorder is not None:
+                        self.Recorder.record_sim(self.Sim)
+                    self.StepsTaken += 1
+        elif self.Mode == "process":
+            self.sync()
+
+
+    def _thread_loop(self):
+        """Body of the "thread" mode physics thread."""
+        Last = time.perf_counter()
+        while not self._StopEvent.is_set():
+            if not self._RunEvent.is_set():
+                self._RunEvent.wait()
+                Last = time.perf_counter()
+                continue
+            if self._ResetEvent.is_set():
+                self._ResetEvent.clear()
+                self.Clock.reset()
+            Now = time.perf_counter()
+            for Step in range(self.Clock.advance(Now - Last)):
+                self.Sim.Time_Step(self.StepDt)
+                with self.Sim.Lock:
+                    self.Snapshots.publish_state(self.Sim)
+                    if self.Recorder is not None:
+                        self.Recorder.record_sim(self.Sim)
+                self.StepsTaken += 1
+            Last = Now
+            time.sleep(max(0.0, self.StepDt - self.Clock.Accumulator))
+
+
+    def sync(self):
+        """
+        Process mode: sends any edits made here to the child, then copies in the child's newest snapshot.
+        Edits are spotted by comparing the state with the last one exchanged with the child.
+        """
+        if self.Mode != "process":
+            return
+        State = self.Sim.State
+        Synced = self._Synced
+        if not (np.array_equal(State.Numbers, Synced["Numbers"]) and np.array_equal(State.Position, Synced["Position"])
+                and np.array_equal(State.Velocity, Synced["Velocity"]) and np.array_equal(State.Mass, Synced["Mass"])
+                and np.array_equal(State.Radius, Synced["Radius"])):
+            self._Synced = self.Sim.get_state()
+            self._Conn.send(("state", self._Synced))
+            self.Snapshots.clear()
+            self._drain()
+            #   -snapshots already in the pipe predate the edit, so they are thrown away
+            return
+        Latest = self._drain()
+        if Latest is not None:
+            Numbers, Position, Velocity, SimTime, Merges, Evaluations = Latest
+            if Merges is not None:
+                with self.Sim.Lock:
+                    Absorbed = [Number for Number in Merges[0] if Number in State]
+                    State.remove(Absorbed)
+                    self.Sim.Merged.update(Merges[0])
+                    if np.array_equal(Numbers, State.Numbers):
+                        State.Mass, State.Radius = Merges[1], Merges[2]
+            if np.array_equal(Numbers, State.Numbers):
+                State.Position, State.Velocity = Position, Velocity
+                self.Sim.Time = SimTime
+                self._Synced = self.Sim.get_state()
+
+
+    def _drain(self):
+        """
+        Reads every snapshot waiting in the pipe, publishing them; returns the newest (or None), with the
+        merges reported by all of them gathered into its fifth element.
+        """
+        Latest = None
+        Merged, Sizes = {}, None
+        while self._Conn.poll():
+            Latest = self._Conn.recv()
+            Numbers, Position, Velocity, SimTime, Merges, self.ChildForceEvaluations = Latest
+            self.Snapshots.publish(Numbers, Position, Velocity, SimTime)
+            if self.Recorder is not None:
+                if Merges is not None:
+                    self.Recorder.record(Numbers, Position, Velocity, SimTime, *Merges[1:])
+                elif np.array_equal(Numbers, self.Sim.State.Numbers):
+                    self.Recorder.record(Numbers, Position, Velocity, SimTime, self.Sim.State.Mass, self.Sim.State.Radius)
+                else:
+                    self.Recorder.record(Numbers, Position, Velocity, SimTime)
+                    #   -masses and radii as in the last frame recorded
+            self.StepsTaken += 1
+            if self.Monitor is not None and self.Monitor.due(self.StepsTaken) and np.array_equal(Numbers, self.Sim.State.Numbers):
+                self.Monitor.record(Position, Velocity, self.Sim.State.Mass, self.Sim.potential_energies(Position), SimTime, self.StepsTaken)
+            if Merges is not None:
+                Merged.update(Merges[0])
+                Sizes = Merges[1:]
+        if Merged:
+            Latest = Latest[:4] + ((Merged,) + Sizes,) + Latest[5:]
+        return Latest
+
+
+    ########################    Drawing
+
+
+    def alpha(self):
+        """Interpolation fraction between the previous and current snapshot, for drawing now."""
+        if self.Mode == "inline":
+            return self.Clock.Alpha
+        Previous, Current = self.Snapshots.read()
+        if Current is None:
+            return 1.0
+        return (time.perf_counter() - Current.WallTime)/self.StepDt
+
+
+    def positions(self):
+        """
+        Positions to draw this frame, interpolated between the last two snapshots, as an array aligned
+        with the rows of Sim.State. Returns None when the live state should be drawn instead: time is
+        stopped, nothing has been published yet, or the planets have changed since the snapshot.
+        """
+        if not self.Running:
+            return None
+        Numbers, Position = self.Snapshots.interpolate(self.alpha())
+        if Numbers is None or not np.array_equal(Numbers, self.Sim.State.Numbers):
+            return None
+        return Position
@@ -0,0 +1,38 @@
+"""
+Small geometry and colour helpers used by the app. Only uses NumPy, so they can be imported without pygame.
+"""
+
+import numpy as np
+
+
+def ppl_atan(point):
+    """Advanced arctangent of a tuple point."""
+    if point[0]==0:
+        if point[1]>0:
+            return np.pi
+        else:
+            return -np.pi
+    elif point[0]<0:
+        return np.arctan(point[1]/point[0])+np.pi
+    else:
+        return np.arctan(point[1]/point[0])
+
+
+def rot_mat(theta):
+    """Returns a 2-by-2 rotation matrix with an angle theta."""
+    return np.array([[np.cos(theta),np.sin(theta)],[-np.sin(theta),np.cos(theta)]])
+
+
+def numpy_to_tuples(np_in):
+    """Takes an N-by-2 numpy matrix and converts it into a list of N tuples."""
+    listout = []
+    for point in np_in:
+        listout.append( (point[0],point[1]) )
+    return listout
+
+
+def palette(Anchors, Size=256):
+    """A Size-by-3 uint8 colour ramp running evenly through the given RGB colours, e.g. to colour-map a density."""
+    Anchors = np.asarray(Anchors, dtype=float)
+    Steps, Stops = np.linspace(0, 1, Size), np.linspace(0, 1, len(Anchors))
+    return np.stack([np.interp(Steps, Stops, Anchors[:,Channel]) for Channel in range(3)], axis=1).round().astype(np.uint8)
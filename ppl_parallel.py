@@ -0,0 +1,119 @@
+"""
+Multi-core force computation for PyPlanets.
+
+ParallelGravity is a force kernel, used like pairwise_gravity, which splits the rows of the
+pairwise interaction matrix into tiles and hands them to a pool of worker processes.
+Positions, masses and the resulting forces live in multiprocessing.shared_memory blocks that
+every worker maps once, at startup; each call then only sends a few integers per tile, and waits
+for all tiles to finish. Only uses NumPy and the standard library.
+"""
+
+import os
+import atexit
+import numpy as np
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from ppl_physics import pairwise_gravity_rows
+
+
+_Shared = {}
+#   -in a worker process: the arrays mapped onto the shared memory blocks (and the blocks themselves)
+
+
+def _attach(Names, Capacity):
+    """Pool initializer: maps the shared Position/Mass/Force/Potential blocks into this worker."""
+    for Name, Shape in (("Position", (Capacity,2)), ("Mass", (Capacity,)), ("Force", (Capacity,2)), ("Potential", (Capacity,))):
+        Block = SharedMemory(name=Names[Name])
+        _Shared[Name + "Block"] = Block
+        _Shared[Name] = np.ndarray(Shape, dtype=float, buffer=Block.buf)
+
+
+def _tile(Args):
+    """Worker task: forces on rows Start..Stop-1, written straight into the shared Force array."""
+    Start, Stop, N, NewtonG, Law, WithPotential = Args
+    pairwise_gravity_rows(_Shared["Position"][:N], _Shared["Mass"][:N], NewtonG, Start, Stop, Out=_Shared["Force"][Start:Stop], Law=Law,
+                          Potential=_Shared["Potential"][Start:Stop] if WithPotential else None)
+
+
+#################################################
+#################################################
+#################################################
+
+
+class ParallelGravity():
+    """
+    Pairwise gravity, tiled across Workers processes.
+    Call it like pairwise_gravity: ParallelGravity(Workers)(Position, Mass, NewtonG, Law=None, Potential=None) -> N-by-2 forces.
+    The result matches pairwise_gravity to the last bit, since every row is summed in the same order.
+    Below MinParallelN bodies it just runs pairwise_gravity here, as handing out tiles would cost more.
+    Call close() (or use it in a with-block) to stop the workers and free the shared memory.
+    """
+
+    MinParallelN = 512
+    TilesPerWorker = 4
+    #   -more tiles than workers, so a slow worker does not hold up the whole barrier
+
+    def __init__(self, Workers=None, Capacity=1024):
+        self.Workers = Workers if Workers else (os.cpu_count() or 1)
+        self.Capacity = 0
+        self.Pool = None
+        self.Blocks = {}
+        self._allocate(Capacity)
+
+
+    def _allocate(self, Capacity):
+        """(Re)creates the shared blocks with room for Capacity bodies, and a pool of workers mapped onto them."""
+        self.close()
+        for Name, Shape in (("Position", (Capacity,2)), ("Mass", (Capacity,)), ("Force", (Capacity,2)), ("Potential", (Capacity,))):
+            Block = SharedMemory(create=True, size=int(np.prod(Shape))*8)
+            self.Blocks[Name] = Block
+            setattr(self, Name, np.ndarray(Shape, dtype=float, buffer=Block.buf))
+        self.Capacity = Capacity
+        Names = {Name: Block.name for Name, Block in self.Blocks.items()}
+        self.Pool = Pool(self.Workers, initializer=_attach, initargs=(Names, Capacity))
+        atexit.register(self.close)
+        #   -frees the shared memory even if close() is never called; close() takes it off again
+
+
+    def close(self):
+        """Stops the workers and frees the shared memory. Safe to call more than once."""
+        if self.Pool is not None:
+            self.Pool.terminate()
+            self.Pool.join()
+            self.Pool = None
+        for Name, Block in self.Blocks.items():
+            setattr(self, Name, None)
+            Block.close()
+            Block.unlink()
+        self.Blocks = {}
+        atexit.unregister(self.close)
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Args):
+        self.close()
+
+
+    def tiles(self, N):
+        """Splits rows 0..N-1 into (Start, Stop) tiles."""
+        Bounds = np.linspace(0, N, min(N, self.Workers*self.TilesPerWorker) + 1).astype(int)
+        return list(zip(Bounds[:-1], Bounds[1:]))
+
+
+    def __call__(self, Position, Mass, NewtonG=1, Law=None, Potential=None):
+        Position = np.asarray(Position, dtype=float)
+        Mass = np.asarray(Mass, dtype=float)
+        N = len(Position)
+        if N < self.MinParallelN or self.Workers == 1:
+            return pairwise_gravity_rows(Position, Mass, NewtonG, 0, N, Law=Law, Potential=Potential)
+        if N > self.Capacity:
+            self._allocate(max(N, 2*self.Capacity))
+        self.Position[:N] = Position
+        self.Mass[:N] = Mass
+        self.Pool.map(_tile, [(int(Start), int(Stop), N, NewtonG, Law, Potential is not None) for Start, Stop in self.tiles(N)])
+        #   -map returns once every tile is done: that is the barrier
+        if Potential is not None:
+            Potential[:] = self.Potential[:N]
+        return self.Force[:N].copy()
@@ -0,0 +1,644 @@
+"""
+Physics core of PyPlanets: planet storage, force kernels and time stepping.
+Only needs NumPy, so it can be used without pygame or a display, e.g. for batch jobs:
+
+    Sim = Simulation.from_arrays(Position, Velocity, Mass)
+    Sim.run(1000, dt=1/60)
+    State = Sim.get_state()
+
+The interactive app (PyPlanets.main) drives the same Simulation.
+"""
+
+import os
+import threading
+import numpy as np
+from functools import partial
+from ppl_barneshut import barnes_hut_gravity
+from ppl_integrators import get_integrator, AdaptiveStepper, BlockStepper
+from ppl_collisions import find_collisions, merge_collisions, bounce_collisions
+from ppl_forces import get_force_law
+
+
+def _state_array(Name):
+    """Builds a property giving a view of the first N rows of the backing array called Name."""
+    def getter(self):
+        return getattr(self, Name)[:self.N]
+    def setter(self, Value):
+        getattr(self, Name)[:self.N] = Value
+        self.Version += 1
+    return property(getter, setter)
+
+
+class PlanetState():
+    """
+    Structure-of-arrays storage for every planet in the simulation.
+    Each planet owns one row of the Position/Velocity/Force (N-by-2) and Mass/Radius (length N) arrays.
+    Rows are kept in creation order, so the last row is the planet drawn on top.
+    Planets are identified by a Number which never changes; Numbers are handed out in increasing order,
+    so the row of a planet can always be found with a binary search of Numbers.
+    Version goes up whenever the planets change, so caches built from them (e.g. ppl_spatial.PlanetIndex)
+    know when to rebuild. Assigning through the properties below bumps it; code that writes into the
+    arrays in place should call touch().
+    """
+
+    InitialCapacity = 16
+    DefaultColor = (170,120,40)
+
+    Fields = {"_Position":((2,), float), "_Velocity":((2,), float), "_Force":((2,), float),
+              "_Mass":((), float), "_Radius":((), float), "_Color":((3,), np.uint8),
+              "_Selected":((), bool), "_Numbers":((), np.int64)}
+    #   -name: (shape of one row, dtype) of every backing array
+
+    def __init__(self, Capacity=InitialCapacity):
+        self.N = 0
+        self.NextNumber = 0
+        self.Version = 0
+        self._allocate(max(int(Capacity), 1))
+
+
+    def touch(self):
+        """Marks the state as changed."""
+        self.Version += 1
+
+
+    def _allocate(self, Capacity):
+        """(Re)allocates the backing arrays with room for Capacity planets, keeping the first N rows."""
+        for Name, (RowShape, DType) in self.Fields.items():
+            Array = np.zeros((Capacity,) + RowShape, dtype=DType)
+            if Name in self.__dict__:
+                Array[:self.N] = getattr(self, Name)[:self.N]
+            setattr(self, Name, Array)
+        self.Capacity = Capacity
+
+
+    def reserve(self, Count):
+        """Makes sure there is room for Count more planets, growing the arrays geometrically."""
+        Needed = self.N + Count
+        if Needed > self.Capacity:
+            self._allocate(max(Needed, 2*self.Capacity))
+
+
+    ########################    Array views
+    #   -each property is a view of the first N rows, so writing into it writes into the state
+
+
+    Position = _state_array("_Position")
+    Velocity = _state_array("_Velocity")
+    Force = _state_array("_Force")
+    Mass = _state_array("_Mass")
+    Radius = _state_array("_Radius")
+    Color = _state_array("_Color")
+    Selected = _state_array("_Selected")
+    Numbers = property(lambda self: self._Numbers[:self.N])
+
+
+    ########################    Adding / removing planets
+
+
+    def add(self, position=np.array([0,0]), velocity=np.array([0,0]), radius=1, mass=1, color=DefaultColor):
+        """Adds a single planet and returns its Number."""
+        return int(self.add_bulk([position], [velocity], [mass], [radius], [color])[0])
+
+
+    def add_bulk(self, Position, Velocity=None, Mass=1, Radius=1, Color=DefaultColor):
+        """
+        Adds many planets at once. Position is N-by-2; the other arguments are broadcast to N rows.
+        Returns the array of the new planets' Numbers.
+        """
+        Position = np.asarray(Position, dtype=float).reshape(-1,2)
+        Count = len(Position)
+        self.reserve(Count)
+        Rows = slice(self.N, self.N + Count)
+        self._Position[Rows] = Position
+        self._Velocity[Rows] = 0 if Velocity is None else np.asarray(Velocity, dtype=float).reshape(-1,2)
+        self._Force[Rows] = 0
+        self._Mass[Rows] = Mass
+        self._Radius[Rows] = Radius
+        self._Color[Rows] = Color
+        self._Selected[Rows] = False
+        self._Numbers[Rows] = np.arange(self.NextNumber, self.NextNumber + Count)
+        self.N += Count
+        self.NextNumber += Count
+        self.touch()
+        return self._Numbers[Rows].copy()
+
+
+    def assign(self, Numbers, Position, Velocity, Mass, Radius, Color=DefaultColor):
+        """
+        Replaces every planet with the given rows, keeping the given Numbers (which must be increasing).
+        Used to copy a whole state across, e.g. between processes.
+        """
+        Numbers = np.asarray(Numbers, dtype=np.int64)
+        self.N = 0
+        self.reserve(len(Numbers))
+        Rows = slice(0, len(Numbers))
+        self._Position[Rows] = Position
+        self._Velocity[Rows] = Velocity
+        self._Force[Rows] = 0
+        self._Mass[Rows] = Mass
+        self._Radius[Rows] = Radius
+        self._Color[Rows] = Color
+        self._Selected[Rows] = False
+        self._Numbers[Rows] = Numbers
+        self.N = len(Numbers)
+        self.NextNumber = max(self.NextNumber, int(Numbers[-1]) + 1 if len(Numbers) else 0)
+        self.touch()
+
+
+    def remove(self, Numbers):
+        """Removes the planets with the given Numbers, keeping the remaining rows in order."""
+        Keep = np.ones(self.N, dtype=bool)
+        Keep[self.rows(Numbers)] = False
+        Count = int(Keep.sum())
+        for Name in self.Fields:
+            Array = getattr(self, Name)
+            Array[:Count] = Array[:self.N][Keep]
+        self.N = Count
+        self.touch()
+
+
+    def clear(self):
+        self.N = 0
+        self.touch()
+
+
+    def copy(self, Position=None):
+        """
+        Returns a separate copy of the planets, e.g. to draw from while the physics goes on. Position, if
+        given, is put in the copy instead of the planets' own positions.
+        """
+        New = PlanetState(self.N)
+        New.N, New.NextNumber, New.Version = self.N, self.NextNumber, self.Version
+        for Name in self.Fields:
+            getattr(New, Name)[:self.N] = getattr(self, Name)[:self.N]
+        if Position is not None:
+            New._Position[:self.N] = Position
+        return New
+
+
+    ########################    Lookup
+
+
+    def rows(self, Numbers):
+        """Returns the rows holding the planets with the given Numbers. Raises KeyError for unknown Numbers."""
+        Numbers = np.asarray(Numbers, dtype=np.int64)
+        Rows = np.searchsorted(self.Numbers, Numbers)
+        Found = (Rows < self.N)
+        Found[Found] = (self.Numbers[Rows[Found]] == Numbers[Found])
+        if not Found.all():
+            raise KeyError(Numbers[~Found].tolist())
+        return Rows
+
+
+    def row(self, Number):
+        """Returns the row holding the planet with the given Number."""
+        Row = int(np.searchsorted(self.Numbers, Number))
+        if Row >= self.N or self._Numbers[Row] != Number:
+            raise KeyError(Number)
+        return Row
+
+
+    def __contains__(self, Number):
+        Row = int(np.searchsorted(self.Numbers, Number))
+        return Row < self.N and self._Numbers[Row] == Number
+
+
+    def __len__(self):
+        return self.N
+
+
+#################################################
+#################################################
+#################################################
+
+
+def pairwise_gravity(Position, Mass, NewtonG=1, BlockSize=None, Rows=None, Law=None, Potential=None):
+    """
+    Vectorized all-pairs Newtonian gravity: returns the N-by-2 array of forces on each body.
+    F_i = G * m_i * sum_j m_j * (x_j - x_i) / |x_j - x_i|**3
+    The interaction matrix is processed in blocks of rows so memory stays bounded for large N.
+    If Rows (an array of indices) is given, only the forces on those bodies are worked out, at a
+    cost proportional to len(Rows), and returned as a len(Rows)-by-2 array.
+    Law is a ppl_forces.ForceLaw to use instead of plain Newtonian gravity.
+    If Potential (an array, one per row) is given, it is filled with each body's potential energy in the
+    field of the others, U_i = -G * m_i * sum_j m_j / |x_j - x_i|, from the same distances.
+    """
+    Position = np.asarray(Position, dtype=float)
+    Mass = np.asarray(Mass, dtype=float)
+    if Rows is not None:
+        return pairwise_gravity_rows(Position, Mass, NewtonG, 0, len(Rows), BlockSize, Targets=np.asarray(Rows), Law=Law,
+                                     Potential=Potential)
+    return pairwise_gravity_rows(Position, Mass, NewtonG, 0, len(Position), BlockSize, Law=Law, Potential=Potential)
+
+
+def pairwise_gravity_rows(Position, Mass, NewtonG, Start, Stop, BlockSize=None, Out=None, Targets=None, Law=None, Potential=None):
+    """
+    Forces on bodies Start..Stop-1 from all N bodies: rows Start:Stop of pairwise_gravity().
+    Every row sums over all columns in the same order whatever the split, so tiling the rows
+    across workers gives exactly the same result as one call. Writes into Out (Stop-Start by 2) if given.
+    If Targets (an array of body indices) is given, the rows are Targets[Start:Stop] instead.
+    Law is a ppl_forces.ForceLaw to use instead of plain Newtonian gravity.
+    If Potential (Stop-Start long) is given, it gets the potential energies of the rows (see pairwise_gravity).
+    """
+    N = len(Position)
+    Force = np.zeros((Stop-Start,2)) if Out is None else Out
+    if N < 2:
+        Force[:] = 0
+        if Potential is not None:
+            Potential[:] = 0
+        return Force
+    if BlockSize is None:
+        BlockSize = max(1, (1 << 16)//N)
+        #   -keeps each temporary block around half a megabyte, so it stays in cache
+    X, Y = Position[:,0], Position[:,1]
+    for BlockStart in range(Start, Stop, BlockSize):
+        BlockStop = min(BlockStart + BlockSize, Stop)
+        Block = slice(BlockStart, BlockStop) if Targets is None else Targets[BlockStart:BlockStop]
+        dX = X[None,:] - X[Block,None]
+        dY = Y[None,:] - Y[Block,None]
+        R2 = dX*dX
+        R2 += dY*dY
+        R2[np.arange(BlockStop-BlockStart), np.arange(BlockStart,BlockStop) if Targets is None else Block] = np.inf
+        #   -a body does not attract itself
+        Rows = slice(BlockStart-Start, BlockStop-Start)
+        if Law is None:
+            W = np.sqrt(R2)
+            if Potential is not None:
+                Potential[Rows] = (Mass/W).sum(axis=1)
+            W *= R2
+            np.divide(Mass, W, out=W)
+        else:
+            if Potential is not None:
+                Potential[Rows] = (Mass*Law.potential(R2)).sum(axis=1)
+            W = Law.factor(R2)
+            W *= Mass
+        dX *= W
+        dY *= W
+        Force[Rows,0] = dX.sum(axis=1)
+        Force[Rows,1] = dY.sum(axis=1)
+    RowMass = NewtonG*(Mass[Start:Stop] if Targets is None else Mass[Targets[Start:Stop]])
+    Force *= RowMass[:,None]
+    if Potential is not None:
+        Potential *= -RowMass
+    return Force
+
+
+def Time_step_kinematic(position =np.array([0,0]), velocity =np.array([0,0]), mass =1, force =np.array([0,0]), dt =0.01):
+    # basic numerical integration; works on single vectors or on N-by-2 arrays (with mass N-by-1)
+    acceleration = force/mass
+    position = position + velocity*dt + 0.5*acceleration*dt*dt
+    velocity = velocity + acceleration*dt
+    return position, velocity
+
+
+#################################################
+#################################################
+#################################################
+
+
+class Simulation():
+    """
+    A headless N-body simulation: a PlanetState plus the settings needed to step it forward.
+    Has no knowledge of the screen; PlanetList wraps one of these for the interactive app.
+    """
+
+    NewtonG = 10
+    #   -Newton's gravitational constant, for gravity calculations
+    ForceBackend = "pairwise"
+    #   -which force solver Calculate_gravity uses: "pairwise" (exact), "barneshut" (approximate, O(N log N))
+    #   or "parallel" (exact, tiled across Workers processes)
+    Theta = 0.5
+    #   -opening angle for the "barneshut" backend. Smaller is more accurate and slower
+    Workers = None
+    #   -number of worker processes for the "parallel" backend; None means one per CPU
+    Integrator = "leapfrog"
+    #   -time integrator: "leapfrog" (velocity Verlet), "yoshida4", "rk4" or "kinematic" (the old first-order scheme)
+    Iterations = 2
+    #   -number of substeps Time_Step splits dt into, when not told otherwise
+    Adaptive = False
+    #   -if True, Time_Step ignores Iterations and picks its substeps from the encounter timescale
+    AdaptiveEta = 0.02
+    #   -adaptive substep = AdaptiveEta * shortest encounter timescale
+    MaxSubsteps = 1000
+    #   -adaptive stepping never takes more substeps than this per Time_Step
+    ForceLaw = "newton"
+    #   -the force between planets: "newton", "plummer", "yukawa", "power" or "electrostatic"; see ppl_forces
+    ForceLawParams = None
+    #   -dict of parameters for the ForceLaw, e.g. {"Softening": 0.5} or {"Length": 20}
+    BlockSteps = False
+    #   -if True, every planet gets its own power-of-two substep (see ppl_integrators.BlockStepper), from
+    #   AdaptiveEta; the smallest is at least dt/MaxSubsteps. Always uses leapfrog, whatever the Integrator
+
+    Collisions = None
+    #   -what happens when planets overlap: None (they pass through), "merge" or "bounce"; see ppl_collisions
+    Restitution = 1.0
+    #   -for "bounce": 1 is perfectly elastic, 0 perfectly inelastic
+    StepAttempts = 3
+    #   -tries at a step with the planets copied out, before holding Lock for all of it (see Time_Step)
+
+    SettingNames = ("NewtonG", "ForceLaw", "ForceLawParams", "ForceBackend", "Theta", "Workers", "Integrator", "Iterations", "Adaptive", "AdaptiveEta", "MaxSubsteps",
+                    "BlockSteps", "Collisions", "Restitution")
+
+
+    def __init__(self, State=None, **Settings):
+        """
+        State is an existing PlanetState to simulate (a new, empty one by default).
+        Any class setting (NewtonG, ForceBackend, Integrator, Iterations, ...) can be overridden by keyword.
+        """
+        self.State = PlanetState() if State is None else State
+        for Name, Value in Settings.items():
+            if Name not in self.SettingNames:
+                raise TypeError(f"Unknown Simulation setting: {Name}")
+            setattr(self, Name, Value)
+        self.Time = 0.0
+        #   -total simulated time
+        self.StepCount = 0
+        #   -number of Time_Step calls so far
+        self.ForceEvaluations = 0
+        #   -number of force kernel calls so far
+        self.ForceRows = 0
+        #   -number of forces on single planets worked out so far (N per full force evaluation)
+        self.LastSubsteps = 0
+        #   -number of substeps the last Time_Step took
+        self._AccCache = None
+        #   -(Position, Mass, Acc) from the end of the last step, reused if the planets have not been edited since
+        self._Parallel = None
+        #   -ParallelGravity worker pool, started the first time the "parallel" backend is used
+        self.Lock = threading.RLock()
+        #   -hold it to edit or copy the planets while another thread steps them: Time_Step only holds it to
+        #   copy the planets in and put the result back (see there)
+        self.CollisionCount = 0
+        #   -number of colliding pairs handled so far
+        self.Merged = {}
+        #   -Number of every planet absorbed in a merge: Number of the planet it merged into
+        self.Monitor = None
+        #   -a ppl_diagnostics.ConservationMonitor to sample every Monitor.Every steps, or None
+        self._Potential = None
+        #   -while a step is being sampled: [buffer the force kernel fills with potential energies, Position it was for]
+
+
+    @classmethod
+    def from_arrays(cls, Position, Velocity=None, Mass=1, Radius=1, **Settings):
+        """Builds a Simulation holding one planet per row of Position (N-by-2)."""
+        Sim = cls(**Settings)
+        Sim.State.add_bulk(Position, Velocity, Mass, Radius)
+        return Sim
+
+
+    ########################    Planets
+
+
+    def add_planet(self, position=np.array([0,0]), velocity=np.array([0,0]), radius=1, mass=1):
+        """Adds one planet, and returns its Number."""
+        return self.State.add(position=position, velocity=velocity, radius=radius, mass=mass)
+
+
+    def add_planets(self, Position, Velocity=None, Mass=1, Radius=1):
+        """Adds many planets at once, and returns their Numbers."""
+        return self.State.add_bulk(Position, Velocity, Mass, Radius)
+
+
+    def remove_planets(self, Numbers):
+        self.State.remove(Numbers)
+
+
+    def close(self):
+        """Stops any worker processes the simulation started. The simulation can still be used afterwards."""
+        if self._Parallel is not None:
+            self._Parallel.close()
+            self._Parallel = None
+
+
+    def settings(self):
+        """Returns the current settings as a dict, e.g. to build a matching Simulation elsewhere."""
+        return {Name: getattr(self, Name) for Name in self.SettingNames}
+
+
+    def get_state(self):
+        """Returns a snapshot (copies) of the simulation state as a dict of arrays."""
+        State = self.State
+        return {"Time": self.Time, "Numbers": State.Numbers.copy(), "Position": State.Position.copy(),
+                "Velocity": State.Velocity.copy(), "Mass": State.Mass.copy(), "Radius": State.Radius.copy()}
+
+
+    def set_state(self, StateDict):
+        """Replaces the planets (and Time) with a dict returned by get_state()."""
+        self.State.assign(StateDict["Numbers"], StateDict["Position"], StateDict["Velocity"], StateDict["Mass"], StateDict["Radius"])
+        self.Time = StateDict["Time"]
+
+
+    ########################    Physics code
+
+
+    def force_law(self):
+        """
+        Returns the selected ForceLaw object, or None for plain Newtonian gravity (which the kernels
+        compute on their own, slightly faster, path).
+        """
+        if self.ForceLaw == "newton" and not self.ForceLawParams:
+            return None
+        return get_force_law(self.ForceLaw, **(self.ForceLawParams or {}))
+
+
+    def force_kernel(self):
+        """Returns the force kernel of the selected ForceBackend, applying the selected ForceLaw."""
+        Law = self.force_law()
+        if self.ForceBackend == "pairwise":
+            return pairwise_gravity if Law is None else partial(pairwise_gravity, Law=Law)
+        elif self.ForceBackend == "barneshut":
+            return partial(barnes_hut_gravity, Theta=self.Theta, Law=Law)
+        elif self.ForceBackend == "parallel":
+            from ppl_parallel import ParallelGravity
+            Workers = self.Workers or os.cpu_count() or 1
+            if self._Parallel is None or self._Parallel.Workers != Workers:
+                self.close()
+                self._Parallel = ParallelGravity(Workers)
+            return self._Parallel if Law is None else partial(self._Parallel, Law=Law)
+        else:
+            raise ValueError(f"Unknown force backend: {self.ForceBackend}")
+
+
+    def Calculate_gravity(self, Gravity_Force=None, NewtonG=None):
+        """
+        Fills State.Force with the gravitational force on every planet.
+        Gravity_Force is a vectorized kernel taking (Position, Mass, NewtonG) and returning the N-by-2 forces;
+        by default it is the kernel of the selected ForceBackend.
+        """
+        NewtonG = self.NewtonG if NewtonG is None else NewtonG
+        if Gravity_Force is None:
+            Gravity_Force = self.force_kernel()
+        self.State.Force = Gravity_Force(self.State.Position, self.State.Mass, NewtonG)
+
+
+    def accelerations(self, Position, Kernel=None, Mass=None):
+        """Returns the N-by-2 accelerations of the planets, if they were at Position (and had Mass, if given)."""
+        Kernel = self.force_kernel() if Kernel is None else Kernel
+        self.ForceEvaluations += 1
+        Mass = self.State.Mass if Mass is None else Mass
+        self.ForceRows += len(Mass)
+        if self._Potential is not None:
+            self._Potential[1] = Position
+            return Kernel(Position, Mass, self.NewtonG, Potential=self._Potential[0])/Mass[:,None]
+        return Kernel(Position, Mass, self.NewtonG)/Mass[:,None]
+
+
+    def potential_energies(self, Position=None):
+        """
+        Returns every planet's potential energy in the field of the others (half their sum is the total),
+        at Position (the current positions by default), with one force evaluation.
+        """
+        State = self.State
+        Position = State.Position if Position is None else Position
+        Potential = np.zeros(len(State))
+        self.ForceEvaluations += 1
+        self.ForceRows += len(State)
+        self.force_kernel()(Position, State.Mass, self.NewtonG, Potential=Potential)
+        return Potential
+
+
+    def accelerations_of(self, Position, Rows, Kernel=None, Mass=None):
+        """
+        Returns the accelerations of just the planets Rows (an array of row indices), if the planets were at
+        Position (and had Mass, if given). The "pairwise" and "barneshut" backends only work out those rows;
+        others do all of them.
+        """
+        Mass = self.State.Mass if Mass is None else Mass
+        if len(Rows) == len(Mass):
+            return self.accelerations(Position, Kernel, Mass)
+        Kernel = self.force_kernel() if Kernel is None else Kernel
+        self.ForceEvaluations += 1
+        self.ForceRows += len(Rows)
+        if self.ForceBackend in ("pairwise", "barneshut"):
+            return Kernel(Position, Mass, self.NewtonG, Rows=Rows)/Mass[Rows,None]
+        return Kernel(Position, Mass, self.NewtonG)[Rows]/Mass[Rows,None]
+
+
+    def _cached_acceleration(self):
+        """Returns the acceleration left over from the last step, if it still matches the current state."""
+        if self._AccCache is None:
+            return None
+        Position, Mass, Acc = self._AccCache
+        if np.array_equal(Position, self.State.Position) and np.array_equal(Mass, self.State.Mass):
+            return Acc
+        return None
+
+
+    def Time_Step(self, dt, iterations=None):
+        """
+        Handles stepping forward time by a time interval of "dt".
+        Splits "dt" into "iterations" timesteps and does it that many times, using the selected Integrator;
+        or, if Adaptive, into as many substeps as the encounter timescale asks for; or, if BlockSteps, gives
+        each planet as many as its own encounter timescale asks for.
+        Lock is only held to copy the planets in and to put the result back, so other threads can edit or
+        draw the planets meanwhile. If they were edited (State.Version changed) in the middle, the step is
+        thrown away and taken again; after StepAttempts tries, it is taken holding Lock throughout.
+        """
+        for Attempt in range(self.StepAttempts):
+            with self.Lock:
+                Inputs = self._step_inputs()
+            Result = self._integrate(dt, iterations, *Inputs[1:])
+            with self.Lock:
+                if self.State.Version == Inputs[0]:
+                    self._finish_step(dt, *Result)
+                    return
+        with self.Lock:
+            self._finish_step(dt, *self._integrate(dt, iterations, *self._step_inputs()[1:]))
+
+
+    def _step_inputs(self):
+        """Copies of what a step starts from: (State.Version, Position, Velocity, Mass, Radius, cached acceleration)."""
+        State = self.State
+        return (State.Version, State.Position.copy(), State.Velocity.copy(), State.Mass.copy(), State.Radius.copy(),
+                self._cached_acceleration())
+
+
+    def _integrate(self, dt, iterations, Position, Velocity, Mass, Radius, Acc):
+        """
+        Integrates copies of the planets over dt (see Time_Step), touching nothing in State. Returns
+        (Position, Velocity, Mass, Acc, Potential): Acc is the acceleration at the end, or None, and
+        Potential the planets' potential energies there if the Monitor is due a sample, or None.
+        """
+        Kernel = self.force_kernel()
+        Accel = lambda Position: self.accelerations(Position, Kernel, Mass)
+        Integrator = get_integrator(self.Integrator)
+        Sampling = self.Monitor is not None and self.Monitor.due(self.StepCount + 1)
+        if Sampling:
+            self._Potential = [np.zeros(len(Mass)), None]
+            #   -full force evaluations during this step also fill in the potential energies
+        if self.BlockSteps:
+            Stepper = BlockStepper(self.AdaptiveEta, MaxLevel=max(int(np.log2(self.MaxSubsteps)), 0))
+            AccelRows = lambda Position, Rows: self.accelerations_of(Position, Rows, Kernel, Mass)
+            Position, Velocity, Acc = Stepper.advance(Position, Velocity, dt, AccelRows, Mass, Radius, Acc)
+            self.LastSubsteps = Stepper.LastSubsteps
+        elif self.Adaptive:
+            Stepper = AdaptiveStepper(Integrator, self.AdaptiveEta, self.MaxSubsteps)
+            Position, Velocity, Acc = Stepper.advance(Position, Velocity, dt, Accel, Mass, Radius, Acc)
+            self.LastSubsteps = Stepper.LastSubsteps
+        else:
+            iterations = self.Iterations if iterations is None else iterations
+            IntervalDt = dt/iterations
+            for steps in range(0,iterations):
+                Position, Velocity, Acc = Integrator.step(Position, Velocity, IntervalDt, Accel, Acc)
+            self.LastSubsteps = iterations
+        Potential = None
+        if Sampling:
+            if self._Potential[1] is None or not np.array_equal(self._Potential[1], Position):
+                Acc = self.accelerations(Position, Kernel, Mass)
+                #   -the integrator did not end on a force evaluation: do it here, for the potential
+                #   (it is not wasted, as the next step starts from this acceleration)
+            Potential = self._Potential[0]
+            self._Potential = None
+        return Position, Velocity, Mass, Acc, Potential
+
+
+    def _finish_step(self, dt, Position, Velocity, Mass, Acc, Potential):
+        """Puts the result of _integrate into State (call holding Lock), then handles collisions."""
+        State = self.State
+        if Potential is not None:
+            self.Monitor.record(Position, Velocity, Mass, Potential, self.Time + dt, self.StepCount + 1)
+        State.Position, State.Velocity = Position, Velocity
+        if Acc is not None:
+            State.Force = Acc*Mass[:,None]
+            self._AccCache = (State.Position.copy(), Mass, Acc)
+        else:
+            self._AccCache = None
+        if self.Collisions:
+            self.handle_collisions()
+        self.Time += dt
+        self.StepCount += 1
+
+
+    def handle_collisions(self):
+        """Finds overlapping planets and merges or bounces them, according to Collisions."""
+        State = self.State
+        I, J = find_collisions(State.Position, State.Radius)
+        if len(I) == 0:
+            return
+        self.CollisionCount += len(I)
+        if self.Collisions == "merge":
+            self.Merged.update(merge_collisions(State, I, J))
+        elif self.Collisions == "bounce":
+            bounce_collisions(State.Position, State.Velocity, State.Mass, State.Radius, I, J, self.Restitution)
+            State.touch()
+        else:
+            raise ValueError(f"Unknown collision mode: {self.Collisions}")
+
+
+    def survivor(self, Number):
+        """Returns the Number of the planet that Number merged into (following repeated merges), or Number itself."""
+        while Number in self.Merged:
+            Number = self.Merged[Number]
+        return Number
+
+
+    def run(self, Steps, dt, iterations=None, Callback=None):
+        """
+        Calls Time_Step(dt, iterations) Steps times in a row.
+        If given, Callback(self) is called after every step; returning True from it stops the run early.
+        Returns the number of steps taken.
+        """
+        for Step in range(Steps):
+            self.Time_Step(dt, iterations)
+            if Callback is not None and Callback(self):
+                return Step + 1
+        return Steps
@@ -0,0 +1,118 @@
+"""
+Predicted paths: where a planet will go if time is started, worked out on a copy of the state.
+
+TrajectoryPredictor integrates a copy of a Simulation's planets forward over Horizon (simulated seconds)
+in Steps steps and returns the path of one of them. With FreezeOthers, only that planet moves, through the
+(fixed) field of the others, which costs O(N) per step instead of a whole force evaluation.
+
+The work is incremental: update() carries on from where the last call stopped, spending at most
+TimeBudget seconds, so dragging the mouse keeps the frame rate up while the path is recomputed, and the
+path grows to the full horizon over the next frames. Nothing is recomputed while the inputs stay the same.
+Collisions are not predicted. Only uses NumPy.
+"""
+
+import time
+import numpy as np
+from ppl_physics import pairwise_gravity_rows
+from ppl_integrators import get_integrator
+
+
+class TrajectoryPredictor():
+    """Predicted path of one planet of a Simulation. See the module docstring."""
+
+    Horizon = 10.0
+    Steps = 600
+    FreezeOthers = True
+    TimeBudget = 0.004
+    #   -seconds of work per update() call (at least one step is always taken)
+
+    def __init__(self, Horizon=None, Steps=None, FreezeOthers=None):
+        if Horizon is not None:
+            self.Horizon = Horizon
+        if Steps is not None:
+            self.Steps = Steps
+        if FreezeOthers is not None:
+            self.FreezeOthers = FreezeOthers
+        self.Path = np.zeros((0,2))
+        #   -the path so far, starting at the planet's current position
+        self.Key = None
+        #   -what the path was computed from: ((Number, settings...), Position, Velocity, Mass)
+        self._Integrator = None
+        self._Accel = None
+        self._Position = None
+        self._Velocity = None
+        self._Acc = None
+        self._Row = None
+        self._Taken = 0
+
+
+    def invalidate(self):
+        self.Key = None
+
+
+    def done(self):
+        return self.Key is not None and self._Taken >= self.Steps
+
+
+    def _key(self, Sim, Number):
+        State = Sim.State
+        return ((Number, Sim.NewtonG, Sim.ForceLaw, Sim.ForceLawParams, Sim.Integrator, Sim.ForceBackend, self.Horizon, self.Steps,
+                 self.FreezeOthers), State.Position.copy(), State.Velocity.copy(), State.Mass.copy())
+
+
+    def _same_key(self, Key):
+        if self.Key is None:
+            return False
+        return Key[0] == self.Key[0] and all(np.array_equal(New, Old) for New, Old in zip(Key[1:], self.Key[1:]))
+
+
+    def _start(self, Sim, Number, Key):
+        """Sets up a fresh integration of a copy of Sim's state."""
+        State = Sim.State
+        Row = State.row(Number)
+        Mass = State.Mass.copy()
+        NewtonG = Sim.NewtonG
+        self._Integrator = get_integrator(Sim.Integrator)
+        if self.FreezeOthers:
+            Others = State.Position.copy()
+            UnitMass = Mass.copy()
+            UnitMass[Row] = 1.0
+            #   -force on a unit mass at Row is its acceleration
+            Law = Sim.force_law()
+            def Accel(Position):
+                Others[Row] = Position[0]
+                return pairwise_gravity_rows(Others, UnitMass, NewtonG, Row, Row + 1, Law=Law)
+            self._Position = State.Position[Row:Row+1].copy()
+            self._Velocity = State.Velocity[Row:Row+1].copy()
+            self._Row = 0
+        else:
+            Kernel = Sim.force_kernel()
+            SafeMass = np.where(Mass != 0, Mass, 1.0)[:,None]
+            def Accel(Position):
+                return Kernel(Position, Mass, NewtonG)/SafeMass
+            self._Position = State.Position.copy()
+            self._Velocity = State.Velocity.copy()
+            self._Row = Row
+        self._Accel = Accel
+        self._Acc = None
+        self._Taken = 0
+        self.Path = np.empty((self.Steps + 1, 2))
+        self.Path[0] = self._Position[self._Row]
+        self.Key = Key
+
+
+    def update(self, Sim, Number):
+        """
+        Advances the prediction for planet Number of Sim (restarting it if anything changed) for at most
+        TimeBudget seconds, and returns the path so far: an array of Real positions, starting at the planet.
+        """
+        Key = self._key(Sim, Number)
+        if not self._same_key(Key):
+            self._start(Sim, Number, Key)
+        dt = self.Horizon/self.Steps
+        Deadline = time.perf_counter() + self.TimeBudget
+        while self._Taken < self.Steps and time.perf_counter() < Deadline:
+            self._Position, self._Velocity, self._Acc = self._Integrator.step(self._Position, self._Velocity, dt, self._Accel, self._Acc)
+            self._Taken += 1
+            self.Path[self._Taken] = self._Position[self._Row]
+        return self.Path[:self._Taken + 1]
@@ -0,0 +1,195 @@
+"""
+Per-frame profiling for the PyPlanets main loop.
+
+FrameProfiler times the phases of every frame (physics, events, drawing, ...) into a ring buffer of the
+last Capacity frames, from which it gives rolling percentiles, and can write the buffer out as a CSV or
+JSON trace. It can also run cProfile over the next N frames. In the loop:
+
+    Profiler.start_frame()
+    with Profiler.phase("Time_Step"):
+        ...
+    Profiler.end_frame(Bodies=N, ForceEvaluations=Sim.ForceEvaluations)
+
+Timing a phase costs two perf_counter() calls; with Enabled False, phase() does nothing at all.
+Only uses NumPy and the standard library.
+"""
+
+import csv
+import json
+import time
+import cProfile
+import numpy as np
+from contextlib import contextmanager
+
+
+class FrameProfiler():
+    """Ring buffer of per-phase frame timings (in seconds). See the module docstring."""
+
+    Phases = ("Time_Step", "events", "PlanetList.draw", "TextListHandler.draw", "display.update")
+    Percentiles = (50, 95, 99)
+
+    def __init__(self, Capacity=600, Phases=None, Enabled=True):
+        self.Phases = tuple(Phases) if Phases is not None else self.Phases
+        self.Capacity = Capacity
+        self.Enabled = Enabled
+        self.Times = np.zeros((Capacity, len(self.Phases)))
+        #   -row per frame, column per phase
+        self.Totals = np.zeros(Capacity)
+        #   -wall time of each frame, from start_frame() to end_frame()
+        self.Bodies = np.zeros(Capacity, dtype=np.int64)
+        self.ForceEvaluations = np.zeros(Capacity, dtype=np.int64)
+        #   -force evaluations done during each frame
+        self.Count = 0
+        #   -frames recorded so far (the buffer holds the last min(Count, Capacity) of them)
+        self._Column = {Name: Column for Column, Name in enumerate(self.Phases)}
+        self._Row = np.zeros(len(self.Phases))
+        self._FrameStart = None
+        self._LastEvaluations = None
+        self._Profile = None
+        self._ProfileFrames = 0
+        self._ProfilePath = None
+
+
+    ########################    Timing
+
+
+    def start_frame(self):
+        if self.Enabled:
+            self._Row[:] = 0
+            self._FrameStart = time.perf_counter()
+
+
+    @contextmanager
+    def phase(self, Name):
+        """Times the enclosed block as phase Name (added up, if the phase runs more than once in a frame)."""
+        if not self.Enabled:
+            yield
+            return
+        Start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._Row[self._Column[Name]] += time.perf_counter() - Start
+
+
+    def end_frame(self, Bodies=0, ForceEvaluations=None):
+        """
+        Stores the frame. ForceEvaluations is the simulation's running total (Simulation.ForceEvaluations);
+        the number done during this frame is worked out from it.
+        """
+        if self._Profile is not None:
+            self._ProfileFrames -= 1
+            if self._ProfileFrames <= 0:
+                self.stop_cprofile()
+        if not self.Enabled or self._FrameStart is None:
+            return
+        Slot = self.Count % self.Capacity
+        self.Times[Slot] = self._Row
+        self.Totals[Slot] = time.perf_counter() - self._FrameStart
+        self.Bodies[Slot] = Bodies
+        Evaluations = 0
+        if ForceEvaluations is not None:
+            if self._LastEvaluations is not None:
+                Evaluations = ForceEvaluations - self._LastEvaluations
+            self._LastEvaluations = ForceEvaluations
+        self.ForceEvaluations[Slot] = Evaluations
+        self.Count += 1
+        self._FrameStart = None
+
+
+    def reset(self):
+        self.Count = 0
+        self._LastEvaluations = None
+
+
+    ########################    Statistics
+
+
+    def _order(self):
+        """Slots of the buffered frames, oldest first."""
+        Held = min(self.Count, self.Capacity)
+        return (np.arange(self.Count - Held, self.Count)) % self.Capacity
+
+
+    def percentiles(self, Percentiles=None):
+        """
+        Returns {phase: [p50, p95, p99]} in seconds over the buffered frames (plus "frame" for the whole
+        frame), or {} if nothing has been recorded.
+        """
+        Percentiles = self.Percentiles if Percentiles is None else Percentiles
+        Slots = self._order()
+        if len(Slots) == 0:
+            return {}
+        Values = np.percentile(np.c_[self.Times[Slots], self.Totals[Slots]], Percentiles, axis=0)
+        return {Name: Values[:,Column].tolist() for Column, Name in enumerate(self.Phases + ("frame",))}
+
+
+    def force_evaluations_per_second(self):
+        """Force evaluations per second of wall time, over the buffered frames."""
+        Slots = self._order()
+        Time = self.Totals[Slots].sum()
+        return float(self.ForceEvaluations[Slots].sum()/Time) if Time > 0 else 0.0
+
+
+    def summary_lines(self):
+        """Short text lines for an on-screen overlay."""
+        Stats = self.percentiles()
+        if not Stats:
+            return ["profiler: no frames yet"]
+        Slots = self._order()
+        Lines = [f"bodies {int(self.Bodies[Slots[-1]])}   force evals/s {self.force_evaluations_per_second():.0f}",
+                 "ms (p50 / p95 / p99)"]
+        for Name in self.Phases + ("frame",):
+            Lines.append(f"{Name:<22}" + " / ".join(f"{1e3*Value:6.2f}" for Value in Stats[Name]))
+        if self._Profile is not None:
+            Lines.append(f"cProfile: {self._ProfileFrames} frames left")
+        return Lines
+
+
+    ########################    Export
+
+
+    def trace(self):
+        """The buffered frames, oldest first, as a list of dicts (times in seconds)."""
+        Rows = []
+        for Index, Slot in zip(range(self.Count - len(self._order()), self.Count), self._order()):
+            Row = {"frame": Index, "total_s": float(self.Totals[Slot]), "bodies": int(self.Bodies[Slot]),
+                   "force_evaluations": int(self.ForceEvaluations[Slot])}
+            Row.update({Name + "_s": float(self.Times[Slot, Column]) for Column, Name in enumerate(self.Phases)})
+            Rows.append(Row)
+        return Rows
+
+
+    def export(self, Path):
+        """Writes trace() to Path: CSV for a .csv path, otherwise JSON (with the percentiles)."""
+        Rows = self.trace()
+        if Path.lower().endswith(".csv"):
+            with open(Path, "w", newline="") as File:
+                Writer = csv.DictWriter(File, fieldnames=list(Rows[0]) if Rows else ["frame"])
+                Writer.writeheader()
+                Writer.writerows(Rows)
+        else:
+            with open(Path, "w") as File:
+                json.dump({"phases": list(self.Phases), "percentiles": list(self.Percentiles),
+                           "summary_s": self.percentiles(), "frames": Rows}, File, indent=1)
+
+
+    ########################    cProfile
+
+
+    def start_cprofile(self, Frames, Path):
+        """Runs cProfile over the next Frames frames, then writes its stats to Path (for pstats or snakeviz)."""
+        if self._Profile is not None:
+            return
+        self._Profile = cProfile.Profile()
+        self._ProfileFrames = Frames
+        self._ProfilePath = Path
+        self._Profile.enable()
+
+
+    def stop_cprofile(self):
+        if self._Profile is None:
+            return
+        self._Profile.disable()
+        self._Profile.dump_stats(self._ProfilePath)
+        self._Profile = None
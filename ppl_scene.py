@@ -0,0 +1,73 @@
+"""
+Saving and loading whole scenes: every planet (Numbers, positions, velocities, masses, radii, colours),
+the simulation time and settings, and the camera view.
+
+Two formats, picked by the file extension:
+    .npz  - one NumPy array per field, plus the rest as a JSON string; compact and fast (the default)
+    .json - the same, as plain JSON, to read or edit by hand
+Loading goes straight into the PlanetState's arrays with one bulk assignment, without building a Planet
+object per body, so 100,000 planets load in a small fraction of a second from .npz.
+Only uses NumPy and the standard library.
+"""
+
+import json
+import numpy as np
+
+
+FormatVersion = 1
+Fields = ("Numbers", "Position", "Velocity", "Mass", "Radius", "Color")
+
+
+def _is_json(Path):
+    return str(Path).lower().endswith(".json")
+
+
+def save_scene(Path, State, Sim=None, Camera=None, Compress=False):
+    """
+    Writes the planets of State, and (if given) the time and settings of Sim and the view of Camera
+    (a PyPlanets.CameraRig), to Path. Compress makes a smaller .npz, but takes longer.
+    """
+    Meta = {"Format": FormatVersion}
+    if Sim is not None:
+        Meta["Time"] = Sim.Time
+        Meta["Settings"] = Sim.settings()
+    if Camera is not None:
+        Meta["Camera"] = Camera.get_view()
+    Arrays = {Name: getattr(State, Name) for Name in Fields}
+    if _is_json(Path):
+        Meta["Planets"] = {Name: Array.tolist() for Name, Array in Arrays.items()}
+        with open(Path, "w") as File:
+            json.dump(Meta, File)
+    else:
+        with open(Path, "wb") as File:
+            (np.savez_compressed if Compress else np.savez)(File, Meta=np.array(json.dumps(Meta)), **Arrays)
+
+
+def load_scene(Path, State, Sim=None, Camera=None, Settings=True):
+    """
+    Replaces the planets of State with the ones saved in Path. If given, Sim gets the saved time (and,
+    if Settings, the saved settings) and Camera the saved view. Returns the saved metadata as a dict.
+    """
+    if _is_json(Path):
+        with open(Path) as File:
+            Meta = json.load(File)
+        Arrays = {Name: np.array(Meta["Planets"][Name]) for Name in Fields}
+    else:
+        with np.load(Path) as File:
+            Meta = json.loads(str(File["Meta"]))
+            Arrays = {Name: File[Name] for Name in Fields}
+    if Meta.get("Format") != FormatVersion:
+        raise ValueError(f"Unsupported scene format: {Meta.get('Format')}")
+
+    N = len(Arrays["Numbers"])
+    State.assign(Arrays["Numbers"], Arrays["Position"].reshape(N,2), Arrays["Velocity"].reshape(N,2),
+                 Arrays["Mass"], Arrays["Radius"], Arrays["Color"].reshape(N,3))
+    if Sim is not None:
+        Sim.Time = Meta.get("Time", 0.0)
+        if Settings:
+            for Name, Value in Meta.get("Settings", {}).items():
+                if Name in Sim.SettingNames:
+                    setattr(Sim, Name, Value)
+    if Camera is not None and "Camera" in Meta:
+        Camera.set_view(Meta["Camera"], State)
+    return Meta
@@ -0,0 +1,194 @@
+"""
+Spatial index over the planets, for hit-testing clicks (and box selection), and the broad phase of
+collision detection.
+
+SpatialGrid is a uniform grid stored as a sorted list of (cell, row) pairs: every body is registered
+in each cell its circle's bounding box touches, so a point query only looks at the bodies registered
+in one cell. Bodies far bigger than a cell are kept aside in a short list and always tested.
+PlanetIndex keeps a SpatialGrid in sync with a PlanetState, rebuilding it only when the state has
+changed since the last query. Only uses NumPy.
+"""
+
+import numpy as np
+
+
+class SpatialGrid():
+    """
+    Uniform grid over circles (Position N-by-2, Radius length N), built in one go with array operations.
+    Rows are the indices into Position; a higher row means the body is drawn on top.
+    """
+
+    MaxCellsPerBody = 16
+    #   -bodies whose bounding box would cover more cells than this go in the Large list instead
+
+    def __init__(self, Position, Radius, CellSize=None):
+        Position = np.asarray(Position, dtype=float)
+        Radius = np.broadcast_to(np.asarray(Radius, dtype=float), (len(Position),))
+        self.Position = Position
+        self.Radius = Radius
+        self.N = len(Position)
+        if self.N == 0:
+            self.CellSize, self.Origin, self.Shape = 1.0, np.zeros(2), (1, 1)
+            self.Keys, self.Rows, self.Large = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            return
+
+        Lo = (Position - Radius[:,None]).min(axis=0)
+        Hi = (Position + Radius[:,None]).max(axis=0)
+        if CellSize is None:
+            Extent = np.maximum(Hi - Lo, 1e-12)
+            CellSize = max(np.sqrt(Extent[0]*Extent[1]/self.N), 2*np.median(Radius))
+            #   -about one body per cell, but no smaller than a typical body
+        CellSize = max(float(CellSize), 1e-12)
+        self.CellSize = CellSize
+        self.Origin = Lo
+        self.Shape = tuple((np.floor((Hi - Lo)/CellSize).astype(np.int64) + 1).tolist())
+
+        CellLo = self.cell_of(Position - Radius[:,None])
+        CellHi = self.cell_of(Position + Radius[:,None])
+        Span = CellHi - CellLo + 1
+        CellsPerBody = Span[:,0]*Span[:,1]
+        IsLarge = CellsPerBody > self.MaxCellsPerBody
+        self.Large = np.flatnonzero(IsLarge)
+        Small = np.flatnonzero(~IsLarge)
+
+        # Expand every small body into one (cell, row) entry per cell it touches:
+        Count = CellsPerBody[Small]
+        Rows = np.repeat(Small, Count)
+        Offset = np.arange(len(Rows)) - np.repeat(np.cumsum(Count) - Count, Count)
+        Width = np.repeat(Span[Small,1], Count)
+        CellX = np.repeat(CellLo[Small,0], Count) + Offset//Width
+        CellY = np.repeat(CellLo[Small,1], Count) + Offset % Width
+        Keys = CellX*self.Shape[1] + CellY
+        Order = np.argsort(Keys, kind="stable")
+        self.Keys = Keys[Order]
+        self.Rows = Rows[Order]
+
+
+    def cell_of(self, Points):
+        """Grid cell (ix, iy) of each point, clipped to the grid."""
+        Cells = np.floor((np.asarray(Points, dtype=float) - self.Origin)/self.CellSize).astype(np.int64)
+        return np.clip(Cells, 0, np.array(self.Shape) - 1)
+
+
+    def _rows_in_cells(self, Keys):
+        """All rows registered in any of the given cell keys (may repeat), plus the Large rows."""
+        Start = np.searchsorted(self.Keys, Keys, side="left")
+        Stop = np.searchsorted(self.Keys, Keys, side="right")
+        Count = Stop - Start
+        Index = np.repeat(Start - np.cumsum(Count) + Count, Count) + np.arange(Count.sum())
+        return np.concatenate([self.Rows[Index], self.Large])
+
+
+    def _outside_grid(self, Point):
+        Point = np.asarray(Point, dtype=float)
+        return np.any(Point < self.Origin) or np.any(Point >= self.Origin + self.CellSize*np.array(self.Shape))
+
+
+    def query_point(self, Point):
+        """Returns the rows of every circle containing Point (strictly inside), in increasing order."""
+        if self.N == 0:
+            return np.zeros(0, dtype=np.int64)
+        if self._outside_grid(Point):
+            Candidates = self.Large
+        else:
+            Cell = self.cell_of(Point)
+            Candidates = self._rows_in_cells(np.array([Cell[0]*self.Shape[1] + Cell[1]]))
+        dR = self.Position[Candidates] - Point
+        Hit = self.Radius[Candidates]**2 > (dR*dR).sum(axis=1)
+        return np.unique(Candidates[Hit])
+
+
+    def topmost(self, Point):
+        """Returns the highest row whose circle contains Point, or -1 if there is none."""
+        Rows = self.query_point(Point)
+        return int(Rows[-1]) if len(Rows) else -1
+
+
+    def query_rect(self, Lo, Hi):
+        """Returns the rows of every circle overlapping the axis-aligned rectangle Lo..Hi, in increasing order."""
+        if self.N == 0:
+            return np.zeros(0, dtype=np.int64)
+        Lo, Hi = np.minimum(Lo, Hi), np.maximum(Lo, Hi)
+        CellLo, CellHi = self.cell_of(Lo), self.cell_of(Hi)
+        Span = CellHi - CellLo + 1
+        if Span[0]*Span[1] > len(self.Keys):
+            Candidates = np.arange(self.N)
+            #   -the rectangle covers more cells than there are entries: cheaper to test everything
+        else:
+            CellX, CellY = np.meshgrid(np.arange(CellLo[0], CellHi[0] + 1), np.arange(CellLo[1], CellHi[1] + 1), indexing="ij")
+            Candidates = np.unique(self._rows_in_cells((CellX*self.Shape[1] + CellY).ravel()))
+        Nearest = np.clip(self.Position[Candidates], Lo, Hi)
+        #   -closest point of the rectangle to each centre
+        dR = self.Position[Candidates] - Nearest
+        Hit = self.Radius[Candidates]**2 > (dR*dR).sum(axis=1)
+        return np.unique(Candidates[Hit])
+
+
+    def candidate_pairs(self):
+        """
+        Broad phase: every pair of rows (i < j) registered in a common cell, plus every pair involving a
+        Large body, without repeats. Returns two arrays (I, J).
+        """
+        # Within each run of equal keys, pair every entry with each entry after it:
+        Starts = np.flatnonzero(np.r_[True, self.Keys[1:] != self.Keys[:-1]]) if len(self.Keys) else np.zeros(0, dtype=np.int64)
+        RunEnd = np.repeat(np.r_[Starts[1:], len(self.Keys)], np.diff(np.r_[Starts, len(self.Keys)]))
+        Count = RunEnd - np.arange(len(self.Keys)) - 1
+        First = np.repeat(np.arange(len(self.Keys)), Count)
+        Second = First + 1 + (np.arange(Count.sum()) - np.repeat(np.cumsum(Count) - Count, Count))
+        I, J = self.Rows[First], self.Rows[Second]
+        # Large bodies may touch anything:
+        if len(self.Large):
+            I = np.concatenate([I, np.repeat(self.Large, self.N)])
+            J = np.concatenate([J, np.tile(np.arange(self.N), len(self.Large))])
+        I, J = np.minimum(I, J), np.maximum(I, J)
+        Pair = np.unique(I[I != J]*self.N + J[I != J])
+        return Pair//self.N, Pair % self.N
+
+
+    def overlapping_pairs(self):
+        """Broad phase, then the exact circle-circle test: pairs (I, J), I < J, whose circles overlap."""
+        I, J = self.candidate_pairs()
+        dR = self.Position[J] - self.Position[I]
+        Touching = (dR*dR).sum(axis=1) < (self.Radius[I] + self.Radius[J])**2
+        return I[Touching], J[Touching]
+
+
+#################################################
+#################################################
+#################################################
+
+
+class PlanetIndex():
+    """
+    A SpatialGrid kept in sync with a PlanetState: it is rebuilt on the first query after the state's
+    Version changes, so moving planets cost nothing until somebody clicks.
+    Answers in planet Numbers rather than rows.
+    """
+
+    def __init__(self, State):
+        self.State = State
+        self.Grid = None
+        self.Version = None
+        self.Builds = 0
+
+    def grid(self, Positions=None):
+        """
+        Returns an up-to-date SpatialGrid of the state. If Positions is given (e.g. the positions drawn on
+        screen), the grid is built over those instead.
+        """
+        if Positions is not None:
+            return SpatialGrid(Positions, self.State.Radius)
+        if self.Grid is None or self.Version != self.State.Version:
+            self.Grid = SpatialGrid(self.State.Position.copy(), self.State.Radius.copy())
+            self.Version = self.State.Version
+            self.Builds += 1
+        return self.Grid
+
+    def topmost_at(self, Point, Positions=None):
+        """Number of the topmost planet under Point (Real coordinates), or None."""
+        Row = self.grid(Positions).topmost(Point)
+        return None if Row < 0 else int(self.State.Numbers[Row])
+
+    def in_rect(self, Lo, Hi, Positions=None):
+        """Numbers of all the planets overlapping the rectangle from Lo to Hi (Real coordinates)."""
+        return self.State.Numbers[self.grid(Positions).query_rect(Lo, Hi)]
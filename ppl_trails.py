@@ -0,0 +1,138 @@
+"""
+Orbit trails: the last few positions of every planet, kept in one array.
+
+TrailBuffer is a ring buffer of shape (planets, Length, 2), in Real coordinates, written one column per
+sample for all planets at once. Its memory is bounded: at most MaxPoints points are kept in total, so with
+many planets each trail gets shorter. Planets are matched up by Number, so trails survive planets being
+added, removed or merged. screen_segments() turns the trails into screen-space points ready to draw,
+dropping points closer together than a pixel or so.
+Only uses NumPy.
+"""
+
+import numpy as np
+
+
+class TrailBuffer():
+    """
+    Last Length positions of each planet (see the module docstring). push() one sample per frame (or step);
+    points() gives them oldest first, with NaN where a planet did not exist yet.
+    """
+
+    MaxPoints = 250_000
+    #   -4 MB of float64 points; trails get shorter rather than exceed this
+
+    def __init__(self, Length=200):
+        self.Length = Length
+        self.K = Length
+        #   -current trail length: Length, or less if there are too many planets for MaxPoints
+        self.Numbers = np.zeros(0, dtype=np.int64)
+        self.Points = np.zeros((0, self.K, 2))
+        self.Head = 0
+        #   -column the next sample goes into
+        self.Count = 0
+        #   -number of samples held (at most K)
+
+
+    def clear(self):
+        self.Points[:] = np.nan
+        self.Head = 0
+        self.Count = 0
+
+
+    def match(self, Numbers):
+        """Re-lays the buffer out for the planets Numbers (increasing), keeping the trails of those already in it."""
+        K = int(max(2, min(self.Length, self.MaxPoints//max(len(Numbers), 1))))
+        Points = np.full((len(Numbers), K, 2), np.nan)
+        if K == self.K and len(self.Numbers) and len(Numbers):
+            Rows = np.searchsorted(self.Numbers, Numbers).clip(max=len(self.Numbers) - 1)
+            Known = self.Numbers[Rows] == Numbers
+            Points[Known] = self.Points[Rows[Known]]
+        elif K != self.K:
+            self.Head = 0
+            self.Count = 0
+        self.Numbers = np.array(Numbers, dtype=np.int64)
+        self.Points = Points
+        self.K = K
+
+
+    def push(self, Numbers, Position):
+        """Adds one sample: the Position (N-by-2) of each of the planets Numbers."""
+        if len(Numbers) != len(self.Numbers) or not np.array_equal(Numbers, self.Numbers):
+            self.match(Numbers)
+        self.Points[:, self.Head] = Position
+        self.Head = (self.Head + 1) % self.K
+        self.Count = min(self.Count + 1, self.K)
+
+
+    def points(self):
+        """The trails as an array (planets, Count, 2), oldest sample first (a copy)."""
+        return self._ordered(self.Points)
+
+
+    def _ordered(self, Array):
+        """Columns of a (planets, K, ...) array in sample order, oldest first: two slices, not a gather."""
+        Start = self.Head - self.Count
+        if Start >= 0:
+            return Array[:, Start:self.Head]
+        return np.concatenate([Array[:, Start % self.K:], Array[:, :self.Head]], axis=1)
+
+
+    def screen_segments(self, ToScreen, MinPixels=1):
+        """
+        Trails in screen space, thinned out so consecutive points are at least about MinPixels apart.
+        ToScreen maps an M-by-2 array of Real points to screen points (e.g. CameraRig.get_screen_array).
+        Returns (Screen, Starts, Rows): all kept points, M-by-2, trail after trail; where each trail starts
+        in Screen (with len(Screen) appended); and the planet row of each trail. Trails with fewer than
+        two points are left out.
+        """
+        Planets, Count = len(self.Points), self.Count
+        if Planets == 0 or Count < 2:
+            return np.zeros((0,2)), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        Screen = self._ordered(ToScreen(self.Points.reshape(-1, 2)).reshape(self.Points.shape))
+        Valid = ~np.isnan(Screen[:,:,0])
+        Cells = np.where(Valid[:,:,None], Screen, 0).astype(np.int64)//MinPixels
+        Keep = np.empty((Planets, Count), dtype=bool)
+        Keep[:,0] = True
+        np.not_equal(Cells[:,1:,0], Cells[:,:-1,0], out=Keep[:,1:])
+        Keep[:,1:] |= Cells[:,1:,1] != Cells[:,:-1,1]
+        #   -drop a point in the same MinPixels-sized cell as the one before it
+        Keep[:,-1] = True
+        #   -always keep the newest point, so the trail reaches the planet
+        Keep &= Valid
+        Lengths = Keep.sum(axis=1)
+        Rows = np.flatnonzero(Lengths >= 2)
+        Kept = Keep[Rows]
+        Starts = np.r_[0, np.cumsum(Lengths[Rows])]
+        return Screen[Rows][Kept], Starts, Rows
+
+
+def rasterize_polylines(Screen, Starts, Size=None, MaxSegmentPixels=64, MaxPixels=250_000):
+    """
+    Pixels along the polylines Screen[Starts[i]:Starts[i+1]], for plotting them all at once.
+    Returns (Pixels, Line): integer pixel coordinates M-by-2, and which polyline each pixel belongs to.
+    If Size (width, height) is given, segments entirely off that screen are skipped. Segments are drawn
+    with at most MaxSegmentPixels pixels, and all of them with about MaxPixels at most (dotted beyond
+    that), to bound the cost.
+    """
+    Lines = len(Starts) - 1
+    if Lines <= 0 or len(Screen) < 2:
+        return np.zeros((0,2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    IsLast = np.zeros(len(Screen), dtype=bool)
+    IsLast[Starts[1:] - 1] = True
+    First = np.flatnonzero(~IsLast)
+    #   -segment i goes from point First[i] to First[i] + 1
+    Line = np.repeat(np.arange(Lines), np.diff(Starts) - 1)
+    if Size is not None:
+        Lo = np.minimum(Screen[First], Screen[First + 1])
+        Hi = np.maximum(Screen[First], Screen[First + 1])
+        OnScreen = (Hi[:,0] >= 0) & (Lo[:,0] < Size[0]) & (Hi[:,1] >= 0) & (Lo[:,1] < Size[1])
+        First, Line = First[OnScreen], Line[OnScreen]
+    Delta = Screen[First + 1] - Screen[First]
+    Steps = np.clip(np.ceil(np.abs(Delta).max(axis=1)), 1, MaxSegmentPixels)
+    if Steps.sum() > MaxPixels:
+        Steps = np.maximum(Steps*(MaxPixels/Steps.sum()), 1)
+    Steps = Steps.astype(np.int64)
+    Segment = np.repeat(np.arange(len(First)), Steps)
+    Fraction = (np.arange(Steps.sum()) - np.repeat(np.cumsum(Steps) - Steps, Steps))/np.repeat(Steps, Steps)
+    Pixels = Screen[First[Segment]] + Fraction[:,None]*Delta[Segment]
+    return np.floor(Pixels).astype(np.int64), Line[Segment]
@@ -0,0 +1,298 @@
+"""
+Trajectory files for PyPlanets: the positions and velocities of every planet, recorded step by step.
+
+A trajectory file is append-only. It starts with a small header, then fixed-size frames:
+    "PPLTRAJ1"                    8 bytes, identifies the format
+    header length                 uint64, little-endian
+    header                        JSON: format version, N, dt, Every, NewtonG, the Simulation settings
+    (padding to 64 bytes)
+    Numbers                       int64[N]  - the planets' Numbers, one per body column
+    Mass                          float64[N]  - as at the start
+    Radius                        float64[N]  - as at the start
+    Color                         uint8[N,3]
+    (padding to 64 bytes)
+    frames                        Time float64, Step int64, Position float64[N,2], Velocity float64[N,2],
+                                  Mass float64[N], Radius float64[N]
+
+Mass and Radius are in every frame, as merges and edits change them.
+
+Frames are written with plain appends, so recording costs one copy of the arrays per frame and never holds
+more than one frame in memory; the number of frames is worked out from the file size, so a file is
+readable while it is still being written, or after a crash. Since every frame has the same size, frame i
+starts at a known offset, and TrajectoryReader maps any range of frames with np.memmap, without copying.
+ReplayPlayer plays a file back into a PlanetState, seeking straight to any frame.
+
+The bodies of a file are fixed when recording starts. A planet that later disappears (e.g. merged into
+another) is recorded as NaN; planets created after the start are not recorded.
+Only uses NumPy and the standard library.
+"""
+
+import os
+import json
+import struct
+import numpy as np
+
+
+Magic = b"PPLTRAJ1"
+FormatVersion = 1
+Alignment = 64
+
+
+def _padded(Size):
+    return -(-Size//Alignment)*Alignment
+
+
+def frame_dtype(N):
+    """The NumPy dtype of one frame of a file with N bodies."""
+    return np.dtype([("Time", "<f8"), ("Step", "<i8"), ("Position", "<f8", (N,2)), ("Velocity", "<f8", (N,2)),
+                     ("Mass", "<f8", (N,)), ("Radius", "<f8", (N,))])
+
+
+class TrajectoryRecorder():
+    """
+    Appends frames to a new trajectory file at Path, for the planets of Sim as they are now.
+    dt is the simulated time of one step; a frame is written every Every steps.
+
+    Call record_sim(Sim) after every step (it can be passed straight to Sim.run as the Callback), or
+    record(Numbers, Position, Velocity, Time, Mass, Radius) with arrays from elsewhere, e.g. a physics
+    snapshot.
+    Call close() (or use it in a with-block) when done.
+    """
+
+    def __init__(self, Path, Sim, dt, Every=1):
+        State = Sim.State
+        self.Path = Path
+        self.Numbers = State.Numbers.copy()
+        self.N = len(self.Numbers)
+        self.dt = dt
+        self.Every = max(int(Every), 1)
+        self.Steps = 0
+        #   -steps offered to record() so far
+        self.Frames = 0
+        #   -frames written so far
+        self.FrameDtype = frame_dtype(self.N)
+        self._Frame = np.zeros(1, dtype=self.FrameDtype)
+        #   -one frame, reused for every write: Mass and Radius stay as last recorded unless given
+        self._Frame["Mass"] = State.Mass
+        self._Frame["Radius"] = State.Radius
+
+        Header = json.dumps({"Format": FormatVersion, "N": self.N, "dt": dt, "Every": self.Every,
+                             "NewtonG": Sim.NewtonG, "Settings": Sim.settings()}).encode()
+        Start = len(Magic) + 8 + len(Header)
+        Arrays = (self.Numbers.astype("<i8").tobytes() + State.Mass.astype("<f8").tobytes() + State.Radius.astype("<f8").tobytes()
+                  + State.Color.astype(np.uint8).tobytes())
+        self.File = open(Path, "wb")
+        self.File.write(Magic + struct.pack("<Q", len(Header)) + Header + bytes(_padded(Start) - Start))
+        self.File.write(Arrays + bytes(_padded(len(Arrays)) - len(Arrays)))
+
+
+    def close(self):
+        """Flushes and closes the file. Safe to call more than once."""
+        if self.File is not None:
+            self.File.close()
+            self.File = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Args):
+        self.close()
+
+
+    def record(self, Numbers, Position, Velocity, Time, Mass=None, Radius=None):
+        """
+        Offers the state after one step; writes it if this is an Every-th step. Returns True if written.
+        Mass and Radius may be left out (None) when they have not changed since the last frame.
+        """
+        self.Steps += 1
+        if (self.Steps - 1) % self.Every:
+            return False
+        Frame = self._Frame
+        Frame["Time"] = Time
+        Frame["Step"] = self.Steps - 1
+        Columns = [(Frame["Position"][0], Position), (Frame["Velocity"][0], Velocity)]
+        Columns += [(Frame[Name][0], Values) for Name, Values in (("Mass", Mass), ("Radius", Radius)) if Values is not None]
+        if len(Numbers) == self.N and np.array_equal(Numbers, self.Numbers):
+            for Out, Values in Columns:
+                Out[...] = Values
+        else:
+            # The planets have changed since the start: match them up by Number
+            Rows, Present = np.zeros(self.N, dtype=np.intp), np.zeros(self.N, dtype=bool)
+            if len(Numbers):
+                Rows = np.searchsorted(Numbers, self.Numbers).clip(max=len(Numbers) - 1)
+                Present = Numbers[Rows] == self.Numbers
+            for Out, Values in Columns:
+                Out[~Present] = np.nan
+                Out[Present] = Values[Rows[Present]]
+        self.File.write(self._Frame.tobytes())
+        self.Frames += 1
+        return True
+
+
+    def record_sim(self, Sim):
+        """record() the current state of Sim. Returns False, so a Sim.run using it as Callback never stops early."""
+        State = Sim.State
+        self.record(State.Numbers, State.Position, State.Velocity, Sim.Time, State.Mass, State.Radius)
+        return False
+
+
+#################################################
+#################################################
+#################################################
+
+
+class TrajectoryReader():
+    """
+    Read-only view of a trajectory file. Nothing is read until it is used: the frames are an np.memmap,
+    so reader.positions(Start, Stop) is a view of the file and only the pages touched are loaded.
+    len(reader) is the number of complete frames; call refresh() to see frames written since opening.
+    Mass and Radius are the planets' at the start; masses() and radii() give them frame by frame.
+    """
+
+    def __init__(self, Path):
+        self.Path = Path
+        with open(Path, "rb") as File:
+            if File.read(len(Magic)) != Magic:
+                raise ValueError(f"{Path} is not a PyPlanets trajectory file")
+            Length, = struct.unpack("<Q", File.read(8))
+            self.Header = json.loads(File.read(Length))
+        if self.Header["Format"] != FormatVersion:
+            raise ValueError(f"Unsupported trajectory format: {self.Header['Format']}")
+        self.N = self.Header["N"]
+        self.dt = self.Header["dt"]
+        self.Every = self.Header["Every"]
+        self.NewtonG = self.Header["NewtonG"]
+        ArraysStart = _padded(len(Magic) + 8 + Length)
+        self.Numbers = self._map(np.dtype("<i8"), ArraysStart, self.N)
+        self.Mass = self._map(np.dtype("<f8"), ArraysStart + 8*self.N, self.N)
+        self.Radius = self._map(np.dtype("<f8"), ArraysStart + 16*self.N, self.N)
+        self.Color = self._map(np.dtype("u1"), ArraysStart + 24*self.N, 3*self.N).reshape(self.N, 3)
+        self.DataStart = ArraysStart + _padded(27*self.N)
+        self.FrameDtype = frame_dtype(self.N)
+        self.Frames = None
+        self.refresh()
+
+
+    def _map(self, Dtype, Offset, Count):
+        if Count == 0:
+            return np.zeros(0, dtype=Dtype)
+        return np.memmap(self.Path, dtype=Dtype, mode="r", offset=Offset, shape=(Count,))
+
+
+    def refresh(self):
+        """Re-maps the file, to include any frames appended since it was opened. Returns the frame count."""
+        Count = max(os.path.getsize(self.Path) - self.DataStart, 0)//self.FrameDtype.itemsize
+        self.Frames = self._map(self.FrameDtype, self.DataStart, Count)
+        return Count
+
+
+    def __len__(self):
+        return len(self.Frames)
+
+
+    def frames(self, Start=0, Stop=None):
+        """Frames Start..Stop-1 as a structured array (fields Time, Step, Position, Velocity, Mass, Radius), without copying."""
+        return self.Frames[Start:Stop]
+
+    def positions(self, Start=0, Stop=None):
+        """Positions in frames Start..Stop-1: an array of shape (frames, N, 2), without copying."""
+        return self.Frames["Position"][Start:Stop]
+
+    def velocities(self, Start=0, Stop=None):
+        """Velocities in frames Start..Stop-1: an array of shape (frames, N, 2), without copying."""
+        return self.Frames["Velocity"][Start:Stop]
+
+    def masses(self, Start=0, Stop=None):
+        """Masses in frames Start..Stop-1: an array of shape (frames, N), without copying."""
+        return self.Frames["Mass"][Start:Stop]
+
+    def radii(self, Start=0, Stop=None):
+        """Radii in frames Start..Stop-1: an array of shape (frames, N), without copying."""
+        return self.Frames["Radius"][Start:Stop]
+
+    def times(self, Start=0, Stop=None):
+        return self.Frames["Time"][Start:Stop]
+
+
+    def frame_at_time(self, Time):
+        """Index of the last frame at or before simulated Time (0 if Time is before the first frame)."""
+        return max(int(np.searchsorted(self.Frames["Time"], Time, side="right")) - 1, 0)
+
+
+#################################################
+#################################################
+#################################################
+
+
+class ReplayPlayer():
+    """
+    Plays a TrajectoryReader back into a PlanetState, at Speed times real time (negative plays backwards).
+    Frame is the (fractional) frame being shown. Seeking is O(1), since frames have a fixed size: only the
+    frame shown is read from the file, and copied into the state (which is never simulated).
+    """
+
+    def __init__(self, Trajectory, State):
+        self.Trajectory = Trajectory
+        self.State = State
+        self.Frame = 0.0
+        self.Playing = False
+        self.Speed = 1.0
+        self.Shown = None
+        #   -index of the frame currently in State
+        State.clear()
+        self.show()
+
+
+    def __len__(self):
+        return len(self.Trajectory)
+
+    @property
+    def FrameTime(self):
+        """Simulated time between two frames."""
+        return self.Trajectory.dt*self.Trajectory.Every
+
+
+    def seek(self, Index):
+        """Jumps to frame Index (clipped to the recording)."""
+        self.Frame = float(min(max(Index, 0), max(len(self.Trajectory) - 1, 0)))
+        self.show()
+
+    def step(self, Count):
+        """Moves Count frames forwards (or backwards, if negative)."""
+        self.seek(int(self.Frame) + Count)
+
+    def toggle(self):
+        self.Playing = not self.Playing
+
+
+    def advance(self, RealTime):
+        """Moves on by RealTime seconds of playback, if playing. Stops at either end of the recording."""
+        if not self.Playing:
+            return
+        if self.Speed > 0 and self.Frame >= len(self.Trajectory) - 1:
+            self.Trajectory.refresh()
+            #   -the file may still be being recorded
+        self.Frame += self.Speed*RealTime/self.FrameTime
+        Last = max(len(self.Trajectory) - 1, 0)
+        if not 0 <= self.Frame <= Last:
+            self.Playing = False
+        self.seek(self.Frame)
+
+
+    def show(self):
+        """Copies the current frame into the state, if it is not there already. Planets missing from it are left out."""
+        Index = int(self.Frame)
+        if Index == self.Shown or len(self.Trajectory) == 0:
+            return
+        Trajectory = self.Trajectory
+        Frame = Trajectory.Frames[Index]
+        Present = ~np.isnan(Frame["Position"][:,0])
+        self.State.assign(Trajectory.Numbers[Present], Frame["Position"][Present], Frame["Velocity"][Present],
+                          Frame["Mass"][Present], Frame["Radius"][Present],
+                          Trajectory.Color[Present])
+        self.Shown = Index
+
+
+    def time(self):
+        """Simulated time of the frame shown."""
+        return float(self.Trajectory.Frames["Time"][int(self.Frame)]) if len(self.Trajectory) else 0.0
@@ -0,0 +1,7 @@
+from ppl_bench import check_startup
+
+
+def test_loading_pygame_fails_the_startup_check():
+    Results = {"numpy": (0.080, False), "ppl_physics": (0.085, False), "PyPlanets": (0.090, True), "cold_start": (0.300, False)}
+    assert check_startup(Results, Log=None) == ["PyPlanets", "cold_start"]
+    #   -PyPlanets is fast, but loaded pygame; cold_start is over its budget
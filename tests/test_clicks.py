@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+pygame = pytest.importorskip("pygame")
+
+from ppl_physics import Simulation
+from PyPlanets import CameraRig, PlanetList
+
+
+def test_clicks_hit_the_planets_where_they_are_drawn():
+    Camera = CameraRig((500, 500))
+    Planets = PlanetList(pygame.Surface((500, 500)), Camera, Simulation())
+    Number = Planets.Sim.State.add((0, 0), (0, 0), radius=0.2, mass=1)
+    Planets.set_draw_positions(np.array([[4.0, 0.0]]))
+    #   -drawn ahead of the live state, as between physics steps
+    Planets.handle_click_3(Camera.get_screen((0, 0)))
+    assert not Camera.FollowingPlanet
+    Planets.handle_click_3(Camera.get_screen((4, 0)))
+    assert Camera.FollowingPlanet and Camera.FocusPlanet.CurrentNumber == Number
+    Planets.Sim.State.add((10, 10))
+    assert Planets.drawn_positions() is None
+    #   -the planets changed since they were drawn: back to the live positions
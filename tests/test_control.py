@@ -0,0 +1,60 @@
+import json
+import socket
+import struct
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from ppl_physics import Simulation
+from ppl_control import ControlServer, ControlClient, ControlError
+
+
+@pytest.fixture
+def server():
+    """A ControlServer on a free TCP port, with a thread standing in for the render loop; yields (Server, Planets)."""
+    Planets = SimpleNamespace(Sim=Simulation(NewtonG=1), TimeFlowing=False)
+    Server = ControlServer(0).start()
+    Done = threading.Event()
+    def render_loop():
+        while not Done.wait(0.001):
+            with Planets.Sim.Lock:
+                Server.apply(Planets)
+    Thread = threading.Thread(target=render_loop, daemon=True)
+    Thread.start()
+    yield Server, Planets
+    Done.set()
+    Thread.join()
+    Server.close()
+
+
+def test_request_response_cycle(server):
+    Server, Planets = server
+    with ControlClient(Server.Address, Timeout=10) as Client:
+        Numbers = Client.add([[0.0, 0.0], [10.0, 0.0], [20.0, 0.0]], Velocity=[0.0, 1.0], Mass=[5.0, 1.0, 1.0])
+        assert len(Numbers) == 3
+        assert Client.remove([Numbers[2], Numbers[2]]) == 1
+        assert Client.modify(Numbers[:1], Radius=2.0) == 1
+        Replies = Client.send([{"op": "step", "Count": 2, "dt": 0.01}, {"op": "nonsense"}])
+        assert Replies[0]["StepCount"] == 2 and "error" in Replies[1]
+        State = Client.state()
+    np.testing.assert_array_equal(State["Numbers"], Numbers[:2])
+    np.testing.assert_array_equal(State["Numbers"], Planets.Sim.State.Numbers)
+    np.testing.assert_array_equal(State["Position"], Planets.Sim.State.Position)
+    np.testing.assert_array_equal(State["Radius"], [2.0, 1.0])
+    assert Server.Batches == 5
+
+
+def test_bad_array_key_gets_an_error_reply(server):
+    Server, Planets = server
+    Text = json.dumps({"commands": [{"op": "add"}], "arrays": [["x.Position", "<f8", [1, 2]]]}).encode()
+    with socket.create_connection(("127.0.0.1", Server.Address), timeout=10) as Raw:
+        Raw.sendall(struct.pack("<I", len(Text)) + Text + bytes(16))
+        Length, = struct.unpack("<I", Raw.recv(4))
+        Reply = json.loads(Raw.recv(Length))
+    assert "Bad array key" in Reply["error"]
+    with ControlClient(Server.Address, Timeout=10) as Client:
+        with pytest.raises(ControlError):
+            Client.remove([12345])
+        assert len(Client.state()["Numbers"]) == 0
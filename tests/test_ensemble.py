@@ -0,0 +1,30 @@
+import numpy as np
+
+from ppl_ensemble import Ensemble, Running, Escaped
+
+
+def two_body(Members=4, **Settings):
+    """Members copies of a circular binary."""
+    Position = np.broadcast_to([[-1.0, 0.0], [1.0, 0.0]], (Members, 2, 2))
+    Velocity = np.broadcast_to([[0.0, -1.0], [0.0, 1.0]], (Members, 2, 2))
+    return Ensemble(Position, Velocity, [2.0, 2.0], [0.01, 0.01], NewtonG=4, **Settings)
+
+
+def test_changing_masses_between_steps_is_not_served_from_the_cache():
+    Runs = two_body()
+    Runs.Time_Step(0.01)
+    Runs.Mass[1:] *= 3
+    Fresh = Ensemble(Runs.Position, Runs.Velocity, Runs.Mass, Runs.Radius, NewtonG=4)
+    Runs.Time_Step(0.01)
+    Fresh.Time_Step(0.01)
+    np.testing.assert_allclose(Runs.Position, Fresh.Position, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(Runs.Velocity, Fresh.Velocity, rtol=0, atol=1e-12)
+
+
+def test_run_checks_the_members_at_the_end_between_check_intervals():
+    Runs = two_body(EscapeRadius=5.0, CheckEvery=1000)
+    Runs.Velocity[0] *= 10
+    #   -member 0 is unbound, and flies apart
+    Runs.run(100, 0.01)
+    assert Runs.Status[0] == Escaped
+    assert (Runs.Status[1:] == Running).all()
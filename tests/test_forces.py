@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from ppl_forces import ForceLaws, InversePowerLaw, get_force_law
+
+
+def squared_distances(Position):
+    R2 = ((Position[:,None,:] - Position[None,:,:])**2).sum(axis=2)
+    np.fill_diagonal(R2, np.inf)
+    #   -as the kernels pass them: a body and itself is at infinite distance
+    return R2
+
+
+@pytest.mark.parametrize("Power", [0.5, 1.0, 1.5, 2.0, 3.0])
+def test_power_law_potential_is_finite_with_self_pairs(Power):
+    R2 = np.array([[np.inf, 4.0], [4.0, np.inf]])
+    Phi = InversePowerLaw(Power=Power).potential(R2)
+    assert np.isfinite(Phi).all()
+    assert Phi[0,0] == 0.0 and Phi[1,1] == 0.0
+
+
+@pytest.mark.parametrize("Name", list(ForceLaws))
+def test_every_law_is_finite_with_self_pairs(Name):
+    Position = np.random.default_rng(0).uniform(-5, 5, (20,2))
+    Law = get_force_law(Name)
+    R2 = squared_distances(Position)
+    assert np.isfinite(Law.factor(R2)).all()
+    assert np.isfinite(Law.potential(R2)).all()
+
+
+@pytest.mark.parametrize("Name, Params", [("newton", {"Softening": 0.1}), ("plummer", {}), ("yukawa", {"Length": 3.0}),
+                                          ("power", {"Power": 0.5}), ("power", {"Power": 3.0}), ("electrostatic", {})])
+def test_force_is_minus_gradient_of_potential(Name, Params):
+    Law = get_force_law(Name, **Params)
+    R, Step = np.array([0.7, 1.3, 2.9]), 1e-6
+    Phi = lambda R: Law.potential(R*R)
+    #   -U = -phi, so the force on i along (x_j - x_i) is -dphi/dr, and g(r) = -(dphi/dr)/r
+    Slope = (Phi(R + Step) - Phi(R - Step))/(2*Step)
+    assert np.allclose(Law.factor(R*R)*R, -Slope, rtol=1e-5)
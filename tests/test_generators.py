@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from ppl_generators import plummer_sphere, random_binaries, Generators
+from ppl_physics import pairwise_gravity
+
+
+@pytest.mark.parametrize("Name", sorted(Generators))
+def test_same_seed_same_bodies(Name):
+    A, B = Generators[Name](200, Seed=5), Generators[Name](200, Seed=5)
+    for Field in A:
+        np.testing.assert_array_equal(A[Field], B[Field])
+
+
+def test_plummer_sphere_starts_in_virial_equilibrium():
+    Bodies = plummer_sphere(1000, NewtonG=10, Seed=1)
+    Velocity = Bodies["Velocity"]
+    Kinetic = 0.5*(Bodies["Mass"]*(Velocity*Velocity).sum(axis=1)).sum()
+    Potential = np.empty(1000)
+    pairwise_gravity(Bodies["Position"], Bodies["Mass"], 10, Potential=Potential)
+    assert 2*Kinetic/-(0.5*Potential.sum()) == pytest.approx(1.0, rel=0.01)
+
+
+def test_random_binaries_needs_an_even_count():
+    assert len(random_binaries(10)["Position"]) == 10
+    with pytest.raises(ValueError):
+        random_binaries(11)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from ppl_integrators import Integrators, get_integrator
+from ppl_physics import Simulation
+
+
+def kepler(Position):
+    """Acceleration towards a unit mass at the origin, with G = 1."""
+    Distance = np.sqrt((Position*Position).sum(axis=1))[:,None]
+    return -Position/Distance**3
+
+
+def orbit_error(Name, Steps):
+    """Position error after one period of a circular orbit of radius 1, taken in Steps steps."""
+    Integrator = get_integrator(Name)
+    Position, Velocity, Acc = np.array([[1.0, 0.0]]), np.array([[0.0, 1.0]]), None
+    for Step in range(Steps):
+        Position, Velocity, Acc = Integrator.step(Position, Velocity, 2*np.pi/Steps, kepler, Acc)
+    return np.sqrt(((Position - [[1.0, 0.0]])**2).sum())
+
+
+@pytest.mark.parametrize("Name", sorted(Integrators))
+def test_integrators_converge_at_their_order(Name):
+    Order = Integrators[Name].Order
+    Ratio = orbit_error(Name, 200)/orbit_error(Name, 400)
+    assert Ratio == pytest.approx(2**Order, rel=0.25)
+
+
+def binary(Speed, **Settings):
+    """Two unit masses 2 apart, each moving at Speed: 0.5 is a circular orbit, and slower ones dive closer."""
+    Sim = Simulation(NewtonG=1, **Settings)
+    Sim.State.add_bulk([[-1.0, 0.0], [1.0, 0.0]], [[0.0, -Speed], [0.0, Speed]], Mass=1.0, Radius=0.001)
+    return Sim
+
+
+def energy(Sim):
+    State = Sim.State
+    return 0.5*(State.Mass*(State.Velocity**2).sum(axis=1)).sum() + 0.5*Sim.potential_energies().sum()
+
+
+@pytest.mark.parametrize("Speed, Settings", [(0.4, {"Integrator": "leapfrog"}), (0.4, {"Integrator": "yoshida4"}),
+                                             (0.15, {"Adaptive": True}), (0.15, {"BlockSteps": True})])
+def test_energy_stays_bounded_over_many_orbits(Speed, Settings):
+    Sim = binary(Speed, **Settings)
+    Start = energy(Sim)
+    Sim.run(2000, 0.05)
+    assert abs(energy(Sim)/Start - 1) < 0.01
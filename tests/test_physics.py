@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from ppl_physics import PlanetState, Simulation, pairwise_gravity, pairwise_gravity_rows
+
+
+def naive_gravity(Position, Mass, NewtonG):
+    """Forces and potential energies from a plain loop over every pair: the reference for the vectorized kernels."""
+    N = len(Position)
+    Force, Potential = np.zeros((N, 2)), np.zeros(N)
+    for i in range(N):
+        for j in range(N):
+            if i != j:
+                Apart = Position[j] - Position[i]
+                Distance = np.sqrt(Apart @ Apart)
+                Force[i] += NewtonG*Mass[i]*Mass[j]*Apart/Distance**3
+                Potential[i] -= NewtonG*Mass[i]*Mass[j]/Distance
+    return Force, Potential
+
+
+@pytest.fixture
+def bodies():
+    Rng = np.random.default_rng(4)
+    return Rng.normal(0, 10, (60, 2)), Rng.uniform(0.5, 5, 60)
+
+
+@pytest.mark.parametrize("BlockSize", [None, 1, 7, 64])
+def test_rows_match_the_naive_sum(bodies, BlockSize):
+    Position, Mass = bodies
+    Force, Potential = naive_gravity(Position, Mass, 3.0)
+    for Start, Stop in [(0, 60), (0, 1), (13, 41), (59, 60)]:
+        RowPotential = np.empty(Stop - Start)
+        RowForce = pairwise_gravity_rows(Position, Mass, 3.0, Start, Stop, BlockSize, Potential=RowPotential)
+        np.testing.assert_allclose(RowForce, Force[Start:Stop], rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(RowPotential, Potential[Start:Stop], rtol=1e-10)
+
+
+def test_tiles_and_targets_agree_exactly(bodies):
+    Position, Mass = bodies
+    Whole = pairwise_gravity(Position, Mass, 3.0)
+    Tiled = np.concatenate([pairwise_gravity_rows(Position, Mass, 3.0, Start, min(Start + 17, 60)) for Start in range(0, 60, 17)])
+    np.testing.assert_array_equal(Tiled, Whole)
+    Targets = np.array([42, 3, 17])
+    np.testing.assert_array_equal(pairwise_gravity(Position, Mass, 3.0, Rows=Targets), Whole[Targets])
+
+
+def test_forces_sum_to_zero(bodies):
+    Position, Mass = bodies
+    np.testing.assert_allclose(pairwise_gravity(Position, Mass, 3.0).sum(axis=0), 0, atol=1e-9)
+
+
+def test_fewer_than_two_bodies_feel_nothing():
+    np.testing.assert_array_equal(pairwise_gravity(np.array([[1.0, 2.0]]), np.array([3.0])), [[0.0, 0.0]])
+    assert pairwise_gravity(np.zeros((0, 2)), np.zeros(0)).shape == (0, 2)
+
+
+def test_state_keeps_numbers_sorted_through_adds_and_removes():
+    State = PlanetState(Capacity=2)
+    First = State.add_bulk(np.arange(10.0).reshape(5, 2), Mass=np.arange(5.0))
+    State.remove(First[[1, 3]])
+    Later = State.add_bulk([[100.0, 100.0]] * 20)
+    assert len(State) == 23 and State.Capacity >= 23
+    assert (np.diff(State.Numbers) > 0).all()
+    np.testing.assert_array_equal(State.Mass[State.rows(First[[0, 2, 4]])], [0.0, 2.0, 4.0])
+    assert State.row(Later[-1]) == 22 and First[1] not in State
+    with pytest.raises(KeyError):
+        State.rows([First[1]])
+
+
+def test_edits_made_during_a_step_are_kept():
+    Sim = Simulation(NewtonG=1)
+    Sim.State.add_bulk([[0.0, 0.0], [5.0, 0.0]], [[0.0, 0.0], [0.0, 0.5]])
+    Accelerations = Sim.accelerations
+    Added = []
+    def edit_once(*Args):
+        if not Added:
+            with Sim.Lock:
+                Added.append(Sim.State.add((0.0, 5.0), (0.5, 0.0)))
+            #   -as another thread would, while the step goes on without the lock
+        return Accelerations(*Args)
+    Sim.accelerations = edit_once
+    Sim.Time_Step(0.1)
+    assert len(Sim.State) == 3 and Sim.StepCount == 1
+    assert Sim.State.Position[Sim.State.row(Added[0]), 0] > 0
+    #   -the step was taken again, with the new planet in it
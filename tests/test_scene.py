@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from ppl_physics import Simulation
+from ppl_scene import Fields, save_scene, load_scene
+from PyPlanets import CameraRig, Planet
+
+
+def scene():
+    """A simulation with a few planets (some removed, so Numbers have gaps) and a camera following one."""
+    Rng = np.random.default_rng(2)
+    Sim = Simulation(NewtonG=3, Integrator="rk4", Collisions="merge")
+    Numbers = Sim.State.add_bulk(Rng.normal(0, 10, (8, 2)), Rng.normal(0, 1, (8, 2)), Mass=Rng.uniform(1, 5, 8),
+                                 Radius=Rng.uniform(0.1, 1, 8), Color=Rng.integers(0, 256, (8, 3)))
+    Sim.State.remove(Numbers[[1, 5]])
+    Sim.Time = 12.5
+    Camera = CameraRig((500, 500))
+    Camera.set_view({"PanPosition": [3.0, -4.0], "CameraZoomLinear": 0.75, "VelocityRatio": 2})
+    Camera.set_focus(Planet(Sim.State, int(Numbers[6])))
+    return Sim, Camera
+
+
+@pytest.mark.parametrize("Name", ["scene.npz", "scene.json"])
+def test_save_load_round_trip(tmp_path, Name):
+    Sim, Camera = scene()
+    Path = tmp_path / Name
+    save_scene(Path, Sim.State, Sim, Camera)
+    Loaded, LoadedCamera = Simulation(), CameraRig((500, 500))
+    Loaded.State.add_bulk([[1.0, 1.0]] * 3)
+    #   -replaced by the load
+    load_scene(Path, Loaded.State, Loaded, LoadedCamera)
+    for Field in Fields:
+        np.testing.assert_array_equal(getattr(Loaded.State, Field), getattr(Sim.State, Field))
+    assert Loaded.State.Color.dtype == np.uint8
+    assert Loaded.Time == 12.5 and Loaded.settings() == Sim.settings()
+    assert LoadedCamera.get_view() == Camera.get_view()
+    New = Loaded.State.add((0, 0))
+    assert New > Sim.State.Numbers[-1]
+    #   -Numbers handed out after loading never reuse a saved one
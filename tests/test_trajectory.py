@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from ppl_physics import Simulation, PlanetState
+from ppl_trajectory import TrajectoryRecorder, TrajectoryReader, ReplayPlayer
+
+
+def colliding_sim():
+    """Two planets heading into each other (they merge), and a third well out of the way."""
+    Sim = Simulation(NewtonG=1, Collisions="merge")
+    Sim.State.add_bulk([[-2.0, 0.0], [2.0, 0.0], [0.0, 50.0]], [[1.0, 0.0], [-1.0, 0.0], [0.0, 0.0]],
+                       Mass=[1.0, 2.0, 3.0], Radius=[0.5, 0.5, 0.5], Color=[[255, 0, 0], [0, 255, 0], [0, 0, 255]])
+    return Sim
+
+
+def test_round_trip_records_positions_masses_and_colors(tmp_path):
+    Sim = colliding_sim()
+    Path = tmp_path / "run.ppltraj"
+    with TrajectoryRecorder(Path, Sim, 0.1) as Recorder:
+        States = []
+        for Step in range(40):
+            Sim.Time_Step(0.1)
+            Recorder.record_sim(Sim)
+            States.append(Sim.get_state())
+    assert len(Sim.State) == 2
+    Reader = TrajectoryReader(Path)
+    assert len(Reader) == 40 and Reader.N == 3
+    np.testing.assert_array_equal(Reader.Color, [[255, 0, 0], [0, 255, 0], [0, 0, 255]])
+    np.testing.assert_array_equal(Reader.Mass, [1.0, 2.0, 3.0])
+    Last = States[-1]
+    Rows = np.searchsorted(Reader.Numbers, Last["Numbers"])
+    np.testing.assert_array_equal(Reader.positions()[-1][Rows], Last["Position"])
+    np.testing.assert_array_equal(Reader.masses()[-1][Rows], Last["Mass"])
+    np.testing.assert_array_equal(Reader.radii()[-1][Rows], Last["Radius"])
+    assert np.isnan(Reader.positions()[-1]).any(axis=1).sum() == 1
+    #   -the planet merged away
+    np.testing.assert_allclose(Reader.times(), 0.1*np.arange(1, 41))
+
+    State = PlanetState()
+    Player = ReplayPlayer(Reader, State)
+    Player.seek(len(Reader) - 1)
+    np.testing.assert_array_equal(State.Numbers, Last["Numbers"])
+    np.testing.assert_array_equal(State.Mass, Last["Mass"])
+    np.testing.assert_array_equal(State.Radius, Last["Radius"])
+    np.testing.assert_array_equal(State.Color, Reader.Color[Rows])
+    Player.seek(0)
+    np.testing.assert_array_equal(State.Mass, [1.0, 2.0, 3.0])
+
+
+def test_rejects_other_formats(tmp_path):
+    Path = tmp_path / "other.ppltraj"
+    with TrajectoryRecorder(Path, colliding_sim(), 0.1):
+        pass
+    Data = Path.read_bytes()
+    Path.write_bytes(Data.replace(b'"Format": 1', b'"Format": 7', 1))
+    with pytest.raises(ValueError):
+        TrajectoryReader(Path)